@@ -0,0 +1,205 @@
+"""
+Store of analysis artifacts for many projects.
+
+Each artifact (a project's call graph in cg_json_output_all.json format)
+is keyed by an xxhash of the normalized project path, the kind of
+analysis ("ast", "llm", "hybrid"), its options and the analyzer version,
+so switching between repositories or settings never returns another
+project's graph, and switching back is a warm hit. Artifacts are files
+in one directory, written atomically; an index file records what each
+one belongs to and when it was last used, and the least recently used
+ones are evicted when the total size exceeds the limit. Reads only update
+the in-memory index; it is written out with the next artifact, so a
+restart may forget the most recent reads (which only affects eviction
+order).
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import orjson
+import xxhash
+
+from metrics import record_cache
+
+STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache", "call_graphs")
+INDEX_FILE = "index.json"
+INDEX_FORMAT = 1
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+AST = "ast"
+LLM = "llm"
+HYBRID = "hybrid"
+
+
+def normalize_project_path(project_path: str) -> str:
+    """The same project reached through '..', symlinks or case variants maps to one path."""
+    return os.path.normcase(os.path.realpath(project_path))
+
+
+class ArtifactStore:
+    """Size-bounded LRU store of per-project artifacts with a JSON index."""
+
+    def __init__(self, root: str = STORE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # key -> {project, kind, options, version, size, created, last_used}
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(project_path: str, kind: str, options: Optional[Dict[str, Any]], version: str) -> str:
+        identity = {
+            "project": normalize_project_path(project_path),
+            "kind": kind,
+            "options": options or {},
+            "version": version,
+        }
+        return xxhash.xxh3_128_hexdigest(orjson.dumps(identity, option=orjson.OPT_SORT_KEYS))
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    def _load(self) -> None:
+        try:
+            with open(os.path.join(self.root, INDEX_FILE), "rb") as f:
+                data = orjson.loads(f.read())
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Ignoring unreadable artifact index in {self.root}: {e}")
+            return
+        if not isinstance(data, dict) or data.get("format") != INDEX_FORMAT:
+            return
+        for key, entry in data.get("entries", {}).items():
+            # Drop entries whose artifact was removed behind our back
+            if os.path.exists(self.path(key)):
+                self._entries[key] = entry
+
+    def _save_index(self) -> None:
+        """Write the index atomically; the caller holds the lock."""
+        payload = orjson.dumps({"format": INDEX_FORMAT, "entries": self._entries})
+        index_path = os.path.join(self.root, INDEX_FILE)
+        tmp_path = f"{index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, index_path)
+
+    def _evict(self, keep: str) -> None:
+        """Drop least recently used artifacts until the total fits, sparing keep."""
+        total = sum(entry["size"] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda key: self._entries[key]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)["size"]
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+            print(f"Evicted artifact {key}")
+
+    def temp_path(self, key: str) -> str:
+        """Scratch file in the store directory, to be passed to commit()."""
+        return os.path.join(self.root, f"{key}.{os.getpid()}.{threading.get_ident()}.{time.monotonic_ns()}.tmp")
+
+    def commit(self, key: str, tmp_path: str, project_path: str, kind: str,
+               options: Optional[Dict[str, Any]], version: str) -> str:
+        """Move a fully written temporary file into place as the artifact of key."""
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.path(key))
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "project": normalize_project_path(project_path),
+                "kind": kind,
+                "options": options or {},
+                "version": version,
+                "size": size,
+                "created": now,
+                "last_used": now,
+            }
+            self._evict(keep=key)
+            self._save_index()
+        return self.path(key)
+
+    def write(self, key: str, data: bytes, project_path: str, kind: str,
+              options: Optional[Dict[str, Any]], version: str) -> str:
+        """Save an artifact atomically; returns its path."""
+        tmp_path = self.temp_path(key)
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        return self.commit(key, tmp_path, project_path, kind, options, version)
+
+    def read(self, key: str) -> Optional[bytes]:
+        """Artifact contents, or None if it is not stored."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            record_cache("artifacts", False)
+            return None
+        try:
+            with open(self.path(key), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self._entries.pop(key, None)
+            record_cache("artifacts", False)
+            return None
+        record_cache("artifacts", True)
+        self.touch(key)
+        return data
+
+    def touch(self, key: str) -> None:
+        """Mark an artifact as used; saved with the index on the next write, not on every read."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+
+    def latest(self, project_path: str, kind: Optional[str] = None) -> Optional[str]:
+        """Key of the most recently written artifact of a project (of one kind, if given)."""
+        project = normalize_project_path(project_path)
+        with self._lock:
+            candidates = [
+                (entry["created"], key) for key, entry in self._entries.items()
+                if entry["project"] == project and (kind is None or entry["kind"] == kind)
+            ]
+        return max(candidates)[1] if candidates else None
+
+    def stamp(self, key: Optional[str]) -> Optional[int]:
+        """mtime_ns of an artifact file, to tell whether it was rewritten."""
+        if key is None:
+            return None
+        try:
+            return os.stat(self.path(key)).st_mtime_ns
+        except OSError:
+            return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+
+_default_store: Optional[ArtifactStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Process-wide store instance, loaded from disk on first use."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ArtifactStore()
+        return _default_store
@@ -1,7 +1,34 @@
 import ast
+import asyncio
 import os
 from collections import defaultdict
-from typing import Dict, List, Any, Optional, Set, Tuple
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Any, Optional, Set, Tuple
+
+import xxhash
+
+from metrics import span
+
+from .artifact_store import AST, ArtifactStore, get_artifact_store
+from .discovery import SourceFile, discover_files, discover_paths
+from .serialization import dumps_json
+
+# Bump whenever FunctionVisitor or FileSummary change what they extract (or
+# build_file_graph what it outputs), so that persisted summaries and graphs
+# from older analyzers are not reused
+ANALYZER_VERSION = "4"
+
+# progress(phase, count): count more files "discovered"/"parsed"/"resolved"
+# or bytes "serialized". May be called from worker threads and may raise
+# to abort the analysis.
+ProgressCallback = Callable[[str, int], None]
+
+def _join_module(module: str, name: str) -> str:
+    """Join a (possibly purely relative, e.g. '..') module and a name."""
+    if not module or module.endswith('.'):
+        return f"{module}{name}"
+    return f"{module}.{name}"
+
 
 class FunctionVisitor(ast.NodeVisitor):
     """Extract function and method information from Python files."""
@@ -28,6 +55,14 @@ class FunctionVisitor(ast.NodeVisitor):
         self.method_calls = defaultdict(list)
         # For tracking import aliases
         self.import_aliases = {}  # alias -> original_module_name
+        # Import information (same shape as ImportVisitor) so a single pass
+        # over the tree is enough to summarize a file
+        self.imports = []
+        self.detailed_dependencies = []
+        self._dependency_index = {}  # module -> entry in detailed_dependencies
+        # Names bound by imports -> what they refer to ('pkg.mod', 'pkg.mod.func',
+        # or a relative name like '.mod.func' that is resolved per file later)
+        self.import_bindings = {}
         
     def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
         func_name = node.name
@@ -295,29 +330,43 @@ class FunctionVisitor(ast.NodeVisitor):
             alias = name.asname or name.name
             if alias != module:
                 self.import_aliases[alias] = module
+                self.import_bindings[alias] = module
+            else:
+                # 'import a.b' binds 'a'
+                top_level = module.split('.')[0]
+                self.import_bindings[top_level] = top_level
+            self.imports.append(module)
+            self._add_dependency(module, [alias])
         self.generic_visit(node)
         
     def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
         """Process from x import y, z imports"""
-        if node.module is None:  # relative import like "from . import x"
-            self.generic_visit(node)
-            return
-            
-        module = node.module
-        if node.level > 0:  # Handle relative imports
-            module = '.' * node.level + module
+        # Relative imports keep their leading dots, e.g. '.utils' or '..'
+        module = '.' * node.level + (node.module or '')
             
         for name in node.names:
             alias = name.asname or name.name
             original_name = name.name
-            if alias != original_name:
-                # Store the mapping: alias -> module.original_name
-                self.import_aliases[alias] = f"{module}.{original_name}"
-            else:
-                # Store direct import: name -> module.name
-                self.import_aliases[alias] = f"{module}.{original_name}"
+            if original_name == '*':
+                continue
+            # Store the mapping: alias -> module.original_name
+            qualified = _join_module(module, original_name)
+            self.import_aliases[alias] = qualified
+            self.import_bindings[alias] = qualified
         
+        self.imports.append(module)
+        self._add_dependency(module, [name.name for name in node.names])
         self.generic_visit(node)
+
+    def _add_dependency(self, module: str, names: List[str]) -> None:
+        """Record imported names for a module, merging repeated imports."""
+        existing = self._dependency_index.get(module)
+        if existing:
+            existing["imports"].extend(names)
+        else:
+            entry = {"module": module, "imports": names}
+            self._dependency_index[module] = entry
+            self.detailed_dependencies.append(entry)
         
     def _infer_type(self, node: ast.AST) -> str:
         """Infer the type of a value node."""
@@ -353,12 +402,7 @@ def analyze_python_ast(content: str) -> Dict[str, Any]:
     try:
         tree = ast.parse(content)
         
-        # Extract imports using the import_analyzer module
-        from .import_analyzer import ImportVisitor
-        import_visitor = ImportVisitor()
-        import_visitor.visit(tree)
-        
-        # Extract code structure and function calls
+        # Extract code structure, function calls and imports in one pass
         function_visitor = FunctionVisitor()
         function_visitor.visit(tree)
         
@@ -366,8 +410,8 @@ def analyze_python_ast(content: str) -> Dict[str, Any]:
             'functions': function_visitor.functions,
             'function_calls': dict(function_visitor.function_calls),
             'function_lines': function_visitor.function_lines,
-            'imports': import_visitor.imports,
-            'detailed_dependencies': import_visitor.detailed_dependencies,
+            'imports': function_visitor.imports,
+            'detailed_dependencies': function_visitor.detailed_dependencies,
             'exports': function_visitor.exports,
             'classes': function_visitor.classes,
             'class_methods': function_visitor.class_methods,
@@ -390,6 +434,163 @@ def analyze_python_ast(content: str) -> Dict[str, Any]:
         }
 
 
+@dataclass
+class FileSummary:
+    """
+    Per-file analysis record consumed by the resolution pass.
+
+    Built from a single read, a single ``ast.parse`` and a single
+    FunctionVisitor pass, so the call graph can be resolved without
+    touching the file again. ``module`` is the file name until the
+    resolution pass assigns the fully qualified dotted module path.
+    """
+    path: str
+    module: str
+    line_count: int = 0
+    functions: List[str] = field(default_factory=list)
+    function_lines: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    classes: List[str] = field(default_factory=list)
+    class_lines: Dict[str, Dict[str, int]] = field(default_factory=dict)
+    class_methods: Dict[str, List[str]] = field(default_factory=dict)
+    function_calls: Dict[str, List[str]] = field(default_factory=dict)
+    class_instantiations: Dict[str, List[str]] = field(default_factory=dict)
+    method_calls: Dict[str, List[str]] = field(default_factory=dict)
+    module_level_calls: List[str] = field(default_factory=list)
+    imports: List[str] = field(default_factory=list)
+    detailed_dependencies: List[Dict[str, Any]] = field(default_factory=list)
+    import_bindings: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    content_hash: Optional[str] = None
+
+
+def summarize_source(content: str, file_path: str) -> FileSummary:
+    """Build a FileSummary from already-read source code."""
+    summary = FileSummary(
+        path=file_path,
+        module=os.path.splitext(os.path.basename(file_path))[0],
+        line_count=len(content.split('\n'))
+    )
+    try:
+        with span("parse"):
+            tree = ast.parse(content)
+    except SyntaxError as e:
+        # Keep the file in the graph, just without any structure
+        summary.error = str(e)
+        return summary
+    return summarize_tree(tree, summary)
+
+
+def summarize_tree(tree: ast.AST, summary: FileSummary) -> FileSummary:
+    """Fill a summary from the parsed module of its file."""
+    visitor = FunctionVisitor()
+    with span("visit"):
+        visitor.visit(tree)
+
+    summary.functions = visitor.functions
+    summary.function_lines = visitor.function_lines
+    summary.classes = visitor.classes
+    summary.class_lines = visitor.class_lines
+    summary.class_methods = dict(visitor.class_methods)
+    summary.function_calls = dict(visitor.function_calls)
+    summary.class_instantiations = dict(visitor.class_instantiations)
+    summary.method_calls = dict(visitor.method_calls)
+    summary.module_level_calls = visitor.module_level_calls
+    summary.imports = visitor.imports
+    summary.detailed_dependencies = visitor.detailed_dependencies
+    summary.import_bindings = visitor.import_bindings
+    return summary
+
+
+def content_digest(data: bytes) -> str:
+    """Fast non-cryptographic hash of file bytes, used to key cached results."""
+    return xxhash.xxh3_64_hexdigest(data)
+
+
+def summarize_file(file_path: str) -> Optional[FileSummary]:
+    """
+    Read and summarize a single Python file.
+
+    Returns:
+        FileSummary, or None if the file could not be read
+    """
+    try:
+        with span("read"):
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            content = data.decode('utf-8')
+    except Exception as e:
+        print(f"Error processing {file_path}: {e}")
+        return None
+    summary = summarize_source(content, file_path)
+    summary.content_hash = content_digest(data)
+    return summary
+
+
+def module_name_for(file_path: str, project_root: Optional[str] = None,
+                    package_dirs: Optional[Dict[str, bool]] = None) -> str:
+    """
+    Fully qualified dotted module path of a file.
+    
+    Packages (directories with __init__.py) are followed upwards, even above
+    the project root, so 'scrapy/utils/misc.py' becomes 'scrapy.utils.misc'.
+    Below the project root, plain directories still namespace the module so
+    that files with the same name never share an id. A package's
+    '__init__.py' is named after the package itself.
+    
+    Args:
+        file_path: Python file path
+        project_root: Root directory of the project
+        package_dirs: Optional memo of directory -> is package
+        
+    Returns:
+        Dotted module path
+    """
+    if package_dirs is None:
+        package_dirs = {}
+    
+    def is_package(directory: str) -> bool:
+        if directory not in package_dirs:
+            package_dirs[directory] = os.path.isfile(os.path.join(directory, '__init__.py'))
+        return package_dirs[directory]
+    
+    directory, file_name = os.path.split(os.path.abspath(file_path))
+    stem = os.path.splitext(file_name)[0]
+    parts = [] if stem == '__init__' else [stem]
+    
+    while is_package(directory):
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        parts.insert(0, os.path.basename(directory))
+        directory = parent
+    
+    if project_root:
+        rel_dir = os.path.relpath(directory, os.path.abspath(project_root))
+        if rel_dir != '.' and not rel_dir.startswith('..'):
+            parts = rel_dir.split(os.sep) + parts
+    
+    return '.'.join(parts) or stem
+
+
+def absolute_module_name(name: str, current_module: str, is_package: bool = False) -> str:
+    """
+    Resolve a relative name such as '.misc.load_object' or '..' against
+    the module it appears in. Absolute names are returned unchanged.
+    """
+    if not name.startswith('.'):
+        return name
+    rest = name.lstrip('.')
+    level = len(name) - len(rest)
+    package = current_module.split('.')
+    if not is_package:
+        package = package[:-1]
+    if level - 1 > len(package):
+        # Beyond the top-level package: keep what we know
+        return rest or name
+    base = package[:len(package) - (level - 1)]
+    return '.'.join(base + ([rest] if rest else []))
+
+
 def ast_to_diagram_json(ast_result: dict, file_path: str) -> dict:
     """
     Convert AST analysis result to DIAGRAM_EXAMPLE-style JSON.
@@ -469,386 +670,632 @@ def generate_call_graph(file_paths: List[str], project_root: str = None) -> Dict
     Returns:
         Dict in cg_json_output_all.json format
     """
-    from .import_analyzer import analyze_imports
+    # First pass: read, parse and visit every file exactly once
+    summaries = []
+    for file_path in file_paths:
+        summary = summarize_file(file_path)
+        if summary is not None:
+            summaries.append(summary)
     
-    call_graph = {}
+    # Second pass: resolve function calls from the summaries
+    return resolve_call_graph(summaries, project_root)
+
+
+def resolve_call_graph(summaries: List[FileSummary], project_root: str = None,
+                       progress: Optional[ProgressCallback] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Resolve per-file summaries into a call graph.
     
-    # First pass: collect all functions and imports from all files
-    all_functions = {}  # file_name -> functions
-    all_classes = {}    # file_name -> classes  
-    all_imports = {}    # file_name -> imports
+    Args:
+        summaries: FileSummary records, one per analyzed file
+        project_root: Root directory of the project (for relative paths)
+        progress: Called with ("resolved", 1) after each file
+        
+    Returns:
+        Dict in cg_json_output_all.json format
+    """
+    return dict(iter_file_graphs(summaries, project_root, progress))
+
+
+def iter_file_graphs(summaries: List[FileSummary], project_root: str = None,
+                     progress: Optional[ProgressCallback] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Resolve summaries one file at a time.
     
-    for file_path in file_paths:
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Analyze AST
-            ast_result = analyze_python_ast(content)
-            
-            # Analyze imports
-            import_result = analyze_imports(content)
-            
-            file_name = os.path.splitext(os.path.basename(file_path))[0]
-            all_functions[file_name] = ast_result.get('functions', [])
-            all_classes[file_name] = ast_result.get('classes', [])
-            all_imports[file_name] = {
-                'imports': import_result.get('imports', []),
-                'detailed_dependencies': import_result.get('detailed_dependencies', [])
-            }
-            
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            continue
+    Yields:
+        (normalized file path, {nodes, edges}) in the order of summaries;
+        files that fail to resolve are skipped
+    """
+    assign_module_names(summaries, project_root)
+    symbols = SymbolIndex(summaries)
     
-    # Second pass: resolve function calls and create call graph
-    for file_path in file_paths:
+    for summary in summaries:
+        graph = None
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            ast_result = analyze_python_ast(content)
-            import_result = analyze_imports(content)
-            
-            # Convert to relative path if project_root is provided
-            rel_path = file_path
-            if project_root:
-                rel_path = os.path.relpath(file_path, project_root)
-            
-            # Generate nodes
-            nodes = []
-            file_name = os.path.splitext(os.path.basename(file_path))[0]
-            
-            # Create nodes for classes
-            for cls in ast_result.get('classes', []):
-                lines = ast_result.get('class_lines', {}).get(cls, {})
-                node_id = f"{file_name}.{cls}"
-                
-                # Generate description for class
-                description = f"Class {cls}"
-                if lines.get('start') and lines.get('end'):
-                    line_count = lines['end'] - lines['start'] + 1
-                    methods = ast_result.get('class_methods', {}).get(cls, [])
-                    method_count = len(methods)
-                    description = f"Class {cls} ({line_count} lines, {method_count} methods)"
-                
-                nodes.append({
-                    "id": node_id,
-                    "function_name": cls,
-                    "file": rel_path,
-                    "line_start": lines.get('start'),
-                    "line_end": lines.get('end'),
-                    "description": description,
-                    "node_type": "class"
-                })
-            
-            # Create nodes for defined functions (including methods)
-            for func in ast_result.get('functions', []):
-                lines = ast_result.get('function_lines', {}).get(func, {})
-                node_id = f"{file_name}.{func}"
-                
-                # Check if this is a method (contains class prefix)
-                if '.' in func:
-                    class_name, method_name = func.split('.', 1)
-                    description = f"Method {method_name}"
-                    node_type = "method"
-                else:
-                    description = f"Function {func}"
-                    node_type = "function"
-                
-                if lines.get('start') and lines.get('end'):
-                    line_count = lines['end'] - lines['start'] + 1
-                    description += f" ({line_count} lines)"
-                
-                nodes.append({
-                    "id": node_id,
-                    "function_name": func,
-                    "file": rel_path,
-                    "line_start": lines.get('start'),
-                    "line_end": lines.get('end'),
-                    "description": description,
-                    "node_type": node_type
-                })
-            
-            # Create a dummy 'main' node for scripts without function definitions
-            # but with module-level function calls
-            module_level_calls = ast_result.get('module_level_calls', [])
-            if not ast_result.get('functions', []) and module_level_calls:
-                # Get total line count for the script
-                total_lines = len(content.split('\n'))
-                
-                nodes.append({
-                    "id": f"{file_name}.main",
-                    "function_name": f"{file_name}.main",
-                    "file": rel_path,
-                    "line_start": 1,
-                    "line_end": total_lines,
-                    "description": f"Script {file_name} ({total_lines} lines)"
-                })
-            
-            # Generate edges (with deduplication)
-            edges = []
-            edge_idx = 0
-            seen_edges = set()  # Track unique source-target pairs
-            
-            # Edges for function-to-function calls
-            for caller, callees in ast_result.get('function_calls', {}).items():
-                source_id = f"{file_name}.{caller}"
-                
-                for callee in callees:
-                    target_id = _resolve_function_call(
-                        callee, 
-                        file_name, 
-                        all_functions,
-                        all_classes, 
-                        all_imports[file_name]['detailed_dependencies']
-                    )
-                    
-                    # Skip if target_id is None (built-in function)
-                    if target_id is not None:
-                        # Create a unique key for this edge
-                        edge_key = (source_id, target_id)
-                        
-                        # Only add if we haven't seen this edge before
-                        if edge_key not in seen_edges:
-                            seen_edges.add(edge_key)
-                            edges.append({
-                                "id": f"{file_name}.e{edge_idx}",
-                                "source": source_id,
-                                "target": target_id,
-                                "edge_type": "function_call"
-                            })
-                            edge_idx += 1
-            
-            # Edges for class instantiations
-            for caller, classes in ast_result.get('class_instantiations', {}).items():
-                source_id = f"{file_name}.{caller}"
-                
-                for class_name in classes:
-                    # Check if class is defined in this file
-                    if class_name in ast_result.get('classes', []):
-                        target_id = f"{file_name}.{class_name}"
-                    else:
-                        # Try to resolve external class
-                        target_id = _resolve_function_call(
-                            class_name, 
-                            file_name, 
-                            all_functions,
-                            all_classes, 
-                            all_imports[file_name]['detailed_dependencies']
-                        )
-                    
-                    if target_id is not None:
-                        edge_key = (source_id, target_id)
-                        
-                        if edge_key not in seen_edges:
-                            seen_edges.add(edge_key)
-                            edges.append({
-                                "id": f"{file_name}.e{edge_idx}",
-                                "source": source_id,
-                                "target": target_id,
-                                "edge_type": "instantiation"
-                            })
-                            edge_idx += 1
-            
-            # Edges for method calls on instances
-            for caller, method_calls in ast_result.get('method_calls', {}).items():
-                source_id = f"{file_name}.{caller}"
-                
-                for method_call in method_calls:
-                    # For now, treat method calls as function calls
-                    # In future, we could track object types to be more precise
-                    target_id = _resolve_function_call(
-                        method_call, 
-                        file_name, 
-                        all_functions,
-                        all_classes, 
-                        all_imports[file_name]['detailed_dependencies']
-                    )
-                    
-                    if target_id is not None:
-                        edge_key = (source_id, target_id)
-                        
-                        if edge_key not in seen_edges:
-                            seen_edges.add(edge_key)
-                            edges.append({
-                                "id": f"{file_name}.e{edge_idx}",
-                                "source": source_id,
-                                "target": target_id,
-                                "edge_type": "method_call"
-                            })
-                            edge_idx += 1
-            
-            # Edges for module-level calls (from dummy 'main' node)
-            if module_level_calls:
-                source_id = f"{file_name}.main"
-                for callee in module_level_calls:
-                    target_id = _resolve_function_call(
-                        callee, 
-                        file_name, 
-                        all_functions, 
-                        all_classes,
-                        all_imports[file_name]['detailed_dependencies']
-                    )
-                    
-                    # Skip if target_id is None (built-in function)
-                    if target_id is not None:
-                        # Create a unique key for this edge
-                        edge_key = (source_id, target_id)
-                        
-                        # Only add if we haven't seen this edge before
-                        if edge_key not in seen_edges:
-                            seen_edges.add(edge_key)
-                            edges.append({
-                                "id": f"{file_name}.e{edge_idx}",
-                                "source": source_id,
-                                "target": target_id,
-                                "edge_type": "function_call"
-                            })
-                            edge_idx += 1
-            
-            # Normalize the file path to avoid .. in the JSON keys
-            normalized_file_path = os.path.abspath(file_path)
-            call_graph[normalized_file_path] = {
-                "nodes": nodes,
-                "edges": edges
-            }
-            
+            # Dominated by _resolve_function_call; timed per file, not per call
+            with span("resolve"):
+                graph = build_file_graph(summary, project_root, symbols)
         except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            continue
+            print(f"Error processing {summary.path}: {e}")
+        if progress:
+            progress("resolved", 1)
+        if graph is not None:
+            # Normalize the file path to avoid .. in the JSON keys
+            yield os.path.abspath(summary.path), graph
+
+
+def assign_module_names(summaries: List[FileSummary], project_root: Optional[str] = None) -> None:
+    """Set each summary's module to its fully qualified dotted module path."""
+    package_dirs = {}
+    for summary in summaries:
+        summary.module = module_name_for(summary.path, project_root, package_dirs)
+
+
+def _is_package_file(summary: FileSummary) -> bool:
+    return os.path.basename(summary.path) == '__init__.py'
+
+
+class SymbolIndex:
+    """
+    Project-wide symbol tables for resolving calls with hash lookups.
+    
+    Keyed by fully qualified module path. Built once per resolution pass
+    instead of scanning per-file lists for every call site.
+    """
+    
+    def __init__(self, summaries: List[FileSummary]):
+        self.functions: Dict[str, Set[str]] = {}  # module -> functions and 'Class.method' keys
+        self.classes: Dict[str, Set[str]] = {}    # module -> classes
+        self.suffixes: Dict[str, str] = {}        # 'utils.misc' / 'misc' -> first module ending with it
+        for summary in summaries:
+            self.functions[summary.module] = set(summary.functions)
+            self.classes[summary.module] = set(summary.classes)
+        for module in self.functions:
+            parts = module.split('.')
+            for i in range(1, len(parts)):
+                self.suffixes.setdefault('.'.join(parts[i:]), module)
+    
+    def find_module(self, name: str, touched: Optional[Set[str]] = None) -> Optional[str]:
+        """
+        Find a project module by full path, or by a trailing part of its path
+        (imports written relative to a source root, e.g. 'utils.datasets').
+        Leading components of name are dropped until something matches.
+        """
+        parts = name.split('.')
+        for i in range(len(parts)):
+            candidate = '.'.join(parts[i:])
+            if touched is not None:
+                touched.add(candidate)
+            if candidate in self.functions:
+                return candidate
+            module = self.suffixes.get(candidate)
+            if module is not None:
+                return module
+        return None
+    
+    def has_symbol(self, module: str, name: str) -> bool:
+        return name in self.functions.get(module, _EMPTY) or name in self.classes.get(module, _EMPTY)
+    
+    @staticmethod
+    def import_map(summary: FileSummary) -> Dict[str, str]:
+        """
+        Map each name bound by an import in a file to the absolute name it
+        refers to, e.g. 'load_object' -> 'scrapy.utils.misc.load_object'.
+        """
+        is_package = _is_package_file(summary)
+        return {
+            name: absolute_module_name(target, summary.module, is_package)
+            for name, target in summary.import_bindings.items()
+        }
+
+
+def build_file_graph(summary: FileSummary, project_root: Optional[str],
+                     symbols: SymbolIndex, touched: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """
+    Build the nodes and edges of a single file from its summary.
+    
+    Args:
+        summary: FileSummary of the file
+        project_root: Root directory of the project (for relative paths)
+        symbols: Project-wide symbol index
+        touched: If given, filled with every module name looked up while
+            resolving this file's calls
+        
+    Returns:
+        Dict with 'nodes' and 'edges'
+    """
+    # Convert to relative path if project_root is provided
+    rel_path = summary.path
+    if project_root:
+        rel_path = os.path.relpath(summary.path, project_root)
+    
+    module = summary.module
+    file_name = os.path.splitext(os.path.basename(summary.path))[0]
+    imported = SymbolIndex.import_map(summary)
+    is_package = _is_package_file(summary)
+    local_classes = set(summary.classes)
+    
+    # Call sites often repeat the same callee; resolve each name once
+    resolved = {}
+    
+    def resolve(callee: str) -> Optional[str]:
+        if callee not in resolved:
+            resolved[callee] = _resolve_function_call(
+                callee, module, symbols, imported, is_package, touched
+            )
+        return resolved[callee]
+    
+    # Generate nodes (a name defined twice in a file yields a single node)
+    nodes = []
+    seen_nodes = set()
+    
+    def add_node(node: Dict[str, Any]) -> None:
+        if node["id"] in seen_nodes:
+            return
+        seen_nodes.add(node["id"])
+        nodes.append(node)
+    
+    # Create nodes for classes
+    for cls in summary.classes:
+        lines = summary.class_lines.get(cls, {})
+        node_id = f"{module}.{cls}"
+        
+        # Generate description for class
+        description = f"Class {cls}"
+        if lines.get('start') and lines.get('end'):
+            line_count = lines['end'] - lines['start'] + 1
+            methods = summary.class_methods.get(cls, [])
+            method_count = len(methods)
+            description = f"Class {cls} ({line_count} lines, {method_count} methods)"
+        
+        add_node({
+            "id": node_id,
+            "function_name": cls,
+            "file": rel_path,
+            "line_start": lines.get('start'),
+            "line_end": lines.get('end'),
+            "description": description,
+            "node_type": "class"
+        })
+    
+    # Create nodes for defined functions (including methods)
+    for func in summary.functions:
+        lines = summary.function_lines.get(func, {})
+        node_id = f"{module}.{func}"
+        
+        # Check if this is a method (contains class prefix)
+        if '.' in func:
+            class_name, method_name = func.split('.', 1)
+            description = f"Method {method_name}"
+            node_type = "method"
+        else:
+            description = f"Function {func}"
+            node_type = "function"
+        
+        if lines.get('start') and lines.get('end'):
+            line_count = lines['end'] - lines['start'] + 1
+            description += f" ({line_count} lines)"
+        
+        add_node({
+            "id": node_id,
+            "function_name": func,
+            "file": rel_path,
+            "line_start": lines.get('start'),
+            "line_end": lines.get('end'),
+            "description": description,
+            "node_type": node_type
+        })
     
-    return call_graph
+    # Create a dummy 'main' node for scripts without function definitions
+    # but with module-level function calls
+    module_level_calls = summary.module_level_calls
+    if not summary.functions and module_level_calls:
+        total_lines = summary.line_count
+        
+        add_node({
+            "id": f"{module}.main",
+            "function_name": f"{file_name}.main",
+            "file": rel_path,
+            "line_start": 1,
+            "line_end": total_lines,
+            "description": f"Script {file_name} ({total_lines} lines)"
+        })
+    
+    # Generate edges (with deduplication)
+    edges = []
+    seen_edges = set()  # Track unique source-target pairs
+    
+    def add_edge(source_id: str, target_id: Optional[str], edge_type: str) -> None:
+        # Skip if target_id is None (built-in function) or already seen
+        if target_id is None:
+            return
+        edge_key = (source_id, target_id)
+        if edge_key in seen_edges:
+            return
+        seen_edges.add(edge_key)
+        # Derived from the edge itself, so adding or removing another call keeps it
+        edge_hash = xxhash.xxh3_64_hexdigest(f"{source_id}\0{target_id}\0{edge_type}")
+        edges.append({
+            "id": f"{module}.e{edge_hash[:12]}",
+            "source": source_id,
+            "target": target_id,
+            "edge_type": edge_type
+        })
+    
+    # Edges for function-to-function calls
+    for caller, callees in summary.function_calls.items():
+        source_id = f"{module}.{caller}"
+        for callee in callees:
+            target_id = resolve(callee)
+            add_edge(source_id, target_id, "function_call")
+    
+    # Edges for class instantiations
+    for caller, classes in summary.class_instantiations.items():
+        source_id = f"{module}.{caller}"
+        for class_name in classes:
+            # Check if class is defined in this file
+            if class_name in local_classes:
+                target_id = f"{module}.{class_name}"
+            else:
+                # Try to resolve external class
+                target_id = resolve(class_name)
+            add_edge(source_id, target_id, "instantiation")
+    
+    # Edges for method calls on instances
+    for caller, method_calls in summary.method_calls.items():
+        source_id = f"{module}.{caller}"
+        for method_call in method_calls:
+            # For now, treat method calls as function calls
+            # In future, we could track object types to be more precise
+            target_id = resolve(method_call)
+            add_edge(source_id, target_id, "method_call")
+    
+    # Edges for module-level calls (from dummy 'main' node)
+    if module_level_calls:
+        source_id = f"{module}.main"
+        for callee in module_level_calls:
+            target_id = resolve(callee)
+            add_edge(source_id, target_id, "function_call")
+    
+    return {
+        "nodes": nodes,
+        "edges": edges
+    }
 
 
-def _resolve_function_call(callee: str, current_file: str, all_functions: Dict[str, List[str]], 
-                          all_classes: Dict[str, List[str]], imports: List[Dict[str, Any]], 
-                          import_aliases: Dict[str, str] = None) -> str:
+def _resolve_function_call(callee: str, current_module: str, symbols: SymbolIndex,
+                          imported: Dict[str, str], is_package: bool = False,
+                          touched: Optional[Set[str]] = None) -> Optional[str]:
     """
-    Resolve a function call to its proper module.function format.
+    Resolve a function call to its fully qualified module.function id.
     
     Args:
-        callee: Function name being called (can be 'func', 'Class.method', or 'module.func')
-        current_file: Current file name (without extension)
-        all_functions: All functions by file (includes classes and methods)
-        all_classes: All classes by file
-        imports: Import dependencies for current file
+        callee: Function name being called (can be 'func', 'Class.method', 'module.func'
+            or a relative name like '.module.func')
+        current_module: Dotted module path of the current file
+        symbols: Project-wide symbol index
+        imported: Imported name -> absolute name map of the current file
+        is_package: Whether the current file is a package's __init__.py
+        touched: If given, filled with every module name looked up
         
     Returns:
         Resolved function identifier or None if it's a built-in function
     """
-    builtin_filter = BuiltinFilter()
+    builtin_filter = _BUILTIN_FILTER
+    local_functions = symbols.functions.get(current_module, _EMPTY)
     
     # Check if callee is already in module.function format
     if '.' in callee:
+        callee = absolute_module_name(callee, current_module, is_package)
         parts = callee.split('.')
         if len(parts) == 2:
             module_name, func_name = parts
             
             # Check if this is a local class method call
-            if module_name in all_classes.get(current_file, []):
+            if module_name in symbols.classes.get(current_module, _EMPTY):
                 # This is a class method call - check if it exists in current file
-                class_method = f"{module_name}.{func_name}"
-                if class_method in all_functions.get(current_file, []):
-                    return f"{current_file}.{class_method}"
+                if callee in local_functions:
+                    return f"{current_module}.{callee}"
             
             # Skip built-in functions (but not for local class methods)
             if builtin_filter.should_exclude_call(func_name, module_name):
                 return None
-            
-            # Check if this is a local module/class
-            if module_name in all_functions:
-                # Check if it's a method call (Class.method)
-                class_method = f"{module_name}.{func_name}"
-                if class_method in all_functions[current_file]:
-                    return f"{current_file}.{class_method}"
-                elif func_name in all_functions[module_name]:
-                    return f"{module_name}.{func_name}"
-            
-            # Return as is for external modules
-            return callee
-        else:
-            # Handle nested calls like obj.method.call
-            return callee
+        
+        # Expand an imported name used as prefix, e.g. 'misc.func' after
+        # 'from scrapy.utils import misc'
+        head = imported.get(parts[0])
+        if head is not None and head != parts[0]:
+            callee = '.'.join([head] + parts[1:])
+            parts = callee.split('.')
+        
+        # Longest project module prefix that declares the rest
+        for i in range(len(parts) - 1, 0, -1):
+            module = symbols.find_module('.'.join(parts[:i]), touched)
+            if module is not None and symbols.has_symbol(module, '.'.join(parts[i:])):
+                return f"{module}.{'.'.join(parts[i:])}"
+        
+        # Return as is for external modules
+        return callee
     
     # Handle single function name
     # Skip built-in functions
     if builtin_filter.should_exclude_call(callee):
         return None
     
-    # Check if it's a local function or class
-    if callee in all_functions.get(current_file, []):
-        return f"{current_file}.{callee}"
+    # Check if it's a local function
+    if callee in local_functions:
+        return f"{current_module}.{callee}"
     
     # Check if it's an imported function or class
-    for imp in imports:
-        if callee in imp.get('imports', []):
-            module = imp['module']
-            
-            # Skip if it's from a standard library module
-            if builtin_filter.is_stdlib_module(module):
-                return None
-            
-            # Try to resolve to local files first
-            module_name = module.split('.')[-1]  # Get last part of module
-            if module_name in all_functions:
-                return f"{module_name}.{callee}"
-            else:
-                return f"{module}.{callee}"
+    target = imported.get(callee)
+    if target is not None:
+        module, _, name = target.rpartition('.')
+        if not module:
+            # 'import x as callee': calling a module is not a function call we track
+            return target
+        
+        # Skip if it's from a standard library module
+        if builtin_filter.is_stdlib_module(module):
+            return None
+        
+        # Try to resolve to project modules first
+        project_module = symbols.find_module(module, touched)
+        if project_module is not None:
+            return f"{project_module}.{name}"
+        return target
     
     # Return as-is if can't resolve (external library)
     return callee
 
 
-async def analyze_project_call_graph(project_path: str, exclude_patterns: List[str] = None) -> Dict[str, Dict[str, Any]]:
+# Name prefixes, not globs (see discovery.compile_exclude_patterns): 'env'
+# also excludes 'environment' and 'build' also 'builder', as before discovery
+# was shared
+DEFAULT_EXCLUDE_PATTERNS = ['test_*', '__pycache__', '.*', 'venv', 'env', 'build', 'dist']
+
+
+def find_python_files(project_path: str, exclude_patterns: List[str] = None) -> List[str]:
     """
-    Analyze call graph for an entire Python project.
+    Find all Python files of a project, skipping excluded files and directories.
     
     Args:
         project_path: Root path of the Python project
-        exclude_patterns: Patterns to exclude (e.g., ['test_*', '__pycache__'])
+        exclude_patterns: Prefixes of file and directory names to skip (e.g., ['test_*', '__pycache__'])
         
     Returns:
-        Complete call graph in cg_json_output_all.json format
+        List of Python file paths
     """
-    import glob
-    import json
-    
     if exclude_patterns is None:
-        exclude_patterns = ['test_*', '__pycache__', '.*', 'venv', 'env', 'build', 'dist']
+        exclude_patterns = DEFAULT_EXCLUDE_PATTERNS
+    return discover_paths(project_path, ('.py',), exclude_patterns)
+
+
+def find_python_sources(project_path: str, exclude_patterns: List[str] = None) -> List[SourceFile]:
+    """find_python_files with the size and mtime of each file."""
+    if exclude_patterns is None:
+        exclude_patterns = DEFAULT_EXCLUDE_PATTERNS
+    return discover_files(project_path, ('.py',), exclude_patterns)
+
+
+def _artifact_options(exclude_patterns: Optional[List[str]]) -> Dict[str, Any]:
+    """Analyzer options that change the call graph, as part of its artifact key."""
+    if exclude_patterns is None:
+        exclude_patterns = DEFAULT_EXCLUDE_PATTERNS
+    return {"exclude_patterns": list(exclude_patterns)}
+
+
+def call_graph_artifact_key(project_path: str, exclude_patterns: List[str] = None) -> str:
+    """Artifact store key of a project's AST call graph."""
+    return ArtifactStore.make_key(project_path, AST, _artifact_options(exclude_patterns), ANALYZER_VERSION)
+
+
+def call_graph_artifact_path(project_path: str, exclude_patterns: List[str] = None) -> str:
+    """Path of a project's cg_json_output_all.json in the artifact store."""
+    return get_artifact_store().path(call_graph_artifact_key(project_path, exclude_patterns))
+
+
+def write_call_graph_artifact(call_graph: Dict[str, Dict[str, Any]], project_path: str,
+                              exclude_patterns: List[str] = None) -> bytes:
+    """
+    Serialize the call graph once (compact JSON) and save it to the artifact store.
     
-    # Find all Python files
-    python_files = []
-    for root, dirs, files in os.walk(project_path):
-        # Filter out excluded directories
-        dirs[:] = [d for d in dirs if not any(d.startswith(pattern.rstrip('*')) for pattern in exclude_patterns)]
-        
-        for file in files:
-            if file.endswith('.py') and not any(file.startswith(pattern.rstrip('*')) for pattern in exclude_patterns):
-                python_files.append(os.path.join(root, file))
-    
-    # Generate call graph
-    call_graph = generate_call_graph(python_files, project_path)
-    
-    # Determine workspace root (go up directories to find backend folder)
-    current_path = os.path.abspath(project_path)
-    # workspace_root = os.path.join(current_path, "..", "..")
-    workspace_root = os.path.join(current_path, "..")
-    # Save to artifacts directory
-    artifacts_dir = os.path.join(workspace_root, 'backend', 'app', 'artifacts')
-    os.makedirs(artifacts_dir, exist_ok=True)
-    
-    output_file = os.path.join(artifacts_dir, 'cg_json_output_all.json')
-    call_graph_json_str = ""
+    Returns:
+        The serialized call graph (also returned if writing fails)
+    """
+    call_graph_json = dumps_json(call_graph)
+    key = call_graph_artifact_key(project_path, exclude_patterns)
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(call_graph, f, indent=2, ensure_ascii=False)
-            call_graph_json_str = json.dumps(call_graph, indent=4, ensure_ascii=False)
+        output_file = get_artifact_store().write(
+            key, call_graph_json, project_path, AST, _artifact_options(exclude_patterns), ANALYZER_VERSION
+        )
         print(f"Call graph saved to: {output_file}")
     except Exception as e:
-        print(f"Error saving call graph to {output_file}: {e}")
+        print(f"Error saving call graph {key}: {e}")
+    
+    return call_graph_json
+
+
+def save_call_graph_artifact(call_graph: Dict[str, Dict[str, Any]], project_path: str,
+                             exclude_patterns: List[str] = None) -> str:
+    """
+    Save the call graph to the artifact store.
+    
+    Args:
+        call_graph: Call graph in cg_json_output_all.json format
+        project_path: Root path of the analyzed project
+        exclude_patterns: Patterns the project was analyzed with (part of the artifact key)
+        
+    Returns:
+        The call graph as a JSON string
+    """
+    return write_call_graph_artifact(call_graph, project_path, exclude_patterns).decode('utf-8')
+
+
+class CallGraphArtifactWriter:
+    """
+    Write cg_json_output_all.json one file entry at a time.
+    
+    Entries go to a temporary file that replaces the artifact on close(),
+    so readers never see a partial graph; abort() discards it.
+    """
+    
+    def __init__(self, project_path: str, exclude_patterns: List[str] = None):
+        self.project_path = project_path
+        self.options = _artifact_options(exclude_patterns)
+        self.key = call_graph_artifact_key(project_path, exclude_patterns)
+        self.tmp_path = get_artifact_store().temp_path(self.key)
+        self._file = open(self.tmp_path, 'wb')
+        self._file.write(b'{')
+        self._count = 0
+    
+    def write(self, file_key_json: bytes, graph_json: bytes) -> None:
+        """Append one entry from its already serialized key and graph."""
+        if self._count:
+            self._file.write(b',')
+        self._file.write(file_key_json + b':' + graph_json)
+        self._count += 1
+    
+    def close(self) -> None:
+        self._file.write(b'}')
+        self._file.close()
+        path = get_artifact_store().commit(
+            self.key, self.tmp_path, self.project_path, AST, self.options, ANALYZER_VERSION
+        )
+        print(f"Call graph saved to: {path}")
+    
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+async def build_project_call_graph(project_path: str, exclude_patterns: List[str] = None,
+                                   jobs: Optional[int] = None, chunk_size: Optional[int] = None,
+                                   use_cache: bool = True,
+                                   progress: Optional[ProgressCallback] = None) -> Tuple[Dict[str, Dict[str, Any]], bytes]:
+    """
+    Analyze call graph for an entire Python project.
+    
+    Args:
+        project_path: Root path of the Python project
+        exclude_patterns: Patterns to exclude (e.g., ['test_*', '__pycache__'])
+        jobs: Number of worker processes for per-file analysis (default: CPU count)
+        chunk_size: Files per worker task (default: derived from jobs)
+        use_cache: Reuse persisted summaries of files whose content is unchanged
+        progress: Receives discovered/parsed/resolved file counts and serialized bytes
+        
+    Returns:
+        (call graph in cg_json_output_all.json format, its compact JSON as saved to the artifact)
+    """
+    from .graph_query import publish_call_graph
+    from .parallel_analyzer import generate_call_graph_parallel
+    from .summary_cache import get_summary_cache
     
-    return call_graph_json_str
+    # Directory walk and artifact writing are blocking I/O; keep them off the event loop
+    loop = asyncio.get_running_loop()
+    
+    # Find all Python files
+    python_files = await loop.run_in_executor(None, find_python_files, project_path, exclude_patterns)
+    if progress:
+        progress("discovered", len(python_files))
+    
+    # Generate call graph (per-file extraction runs in a process pool)
+    cache = get_summary_cache() if use_cache else None
+    call_graph = await generate_call_graph_parallel(python_files, project_path, jobs, chunk_size, cache, progress)
+    
+    call_graph_json = await loop.run_in_executor(
+        None, write_call_graph_artifact, call_graph, project_path, exclude_patterns
+    )
+    if progress:
+        progress("serialized", len(call_graph_json))
+    # Index the new graph for the query endpoints while it is in memory
+    await loop.run_in_executor(None, publish_call_graph, project_path, call_graph)
+    return call_graph, call_graph_json
+
+
+async def analyze_project_call_graph(project_path: str, exclude_patterns: List[str] = None,
+                                     jobs: Optional[int] = None, chunk_size: Optional[int] = None,
+                                     use_cache: bool = True,
+                                     progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Analyze call graph for an entire Python project (see build_project_call_graph).
+    
+    Returns:
+        Complete call graph in cg_json_output_all.json format, as a JSON string
+    """
+    _, call_graph_json = await build_project_call_graph(
+        project_path, exclude_patterns, jobs, chunk_size, use_cache, progress
+    )
+    return call_graph_json.decode('utf-8')
+
+
+# Files resolved and serialized per executor call while streaming
+STREAM_CHUNK_SIZE = 16
+
+
+def _serialize_file_graphs(graphs: Iterator[Tuple[str, Dict[str, Any]]], count: int,
+                           writer: Optional[CallGraphArtifactWriter]) -> List[bytes]:
+    """Resolve up to count files; return their NDJSON lines and tee them to writer."""
+    lines = []
+    for file_key, graph in graphs:
+        file_key_json = dumps_json(file_key)
+        graph_json = dumps_json(graph)
+        if writer:
+            writer.write(file_key_json, graph_json)
+        # {"file":...,"nodes":[...],"edges":[...]} built from the one serialization
+        lines.append(b'{"file":' + file_key_json + b',' + graph_json[1:] + b'\n')
+        if len(lines) >= count:
+            break
+    return lines
+
+
+async def stream_project_call_graph(project_path: str, exclude_patterns: List[str] = None,
+                                    jobs: Optional[int] = None, chunk_size: Optional[int] = None,
+                                    use_cache: bool = True, save_artifact: bool = True,
+                                    progress: Optional[ProgressCallback] = None) -> AsyncIterator[bytes]:
+    """
+    Streaming variant of analyze_project_call_graph.
+    
+    Summaries are extracted for the whole project first (resolution needs
+    every module's symbols), then files are resolved and serialized a few at
+    a time, so only a handful of file graphs are held at once.
+    
+    Yields:
+        One compact JSON line per file: {"file": path, "nodes": [...], "edges": [...]}.
+        The same entries are written to the project's artifact, which is
+        replaced only once the stream completes.
+    """
+    from .parallel_analyzer import summarize_files_parallel
+    from .summary_cache import get_summary_cache
+    
+    loop = asyncio.get_running_loop()
+    python_files = await loop.run_in_executor(None, find_python_files, project_path, exclude_patterns)
+    if progress:
+        progress("discovered", len(python_files))
+    
+    cache = get_summary_cache() if use_cache else None
+    summaries = await summarize_files_parallel(python_files, jobs, chunk_size, cache, progress)
+    
+    graphs = iter_file_graphs(summaries, project_path, progress)
+    writer = (await loop.run_in_executor(None, CallGraphArtifactWriter, project_path, exclude_patterns)
+              if save_artifact else None)
+    try:
+        while True:
+            lines = await loop.run_in_executor(None, _serialize_file_graphs, graphs, STREAM_CHUNK_SIZE, writer)
+            if not lines:
+                break
+            for line in lines:
+                if progress:
+                    progress("serialized", len(line))
+                yield line
+    except BaseException:
+        if writer:
+            writer.abort()
+        raise
+    if writer:
+        await loop.run_in_executor(None, writer.close)
 
 
 def extract_function_description(node: ast.FunctionDef, content_lines: List[str]) -> str:
@@ -1048,4 +1495,9 @@ class BuiltinFilter:
         if func_name.startswith('_') and module_name != 'self':
             return True
         
-        return False
\ No newline at end of file
+        return False
+
+
+# Shared by every resolution; the filter only holds constant sets
+_BUILTIN_FILTER = BuiltinFilter()
+_EMPTY = frozenset()
@@ -0,0 +1,277 @@
+"""
+Project file discovery.
+
+One os.scandir pass over the tree, shared by the AST analyzer and the LLM
+pipeline. Exclusion patterns (name prefixes) are compiled into a single
+regex per call and
+each .gitignore is parsed once, when its directory is listed. Vendored
+directories (virtualenvs, node_modules, site-packages, ...) and huge
+directories are pruned before they are descended into. discover_files
+also returns the size and mtime of each file so callers can key caches on
+them without stat-ing again; the stat is the DirEntry's own (free on
+Windows, one call per kept file elsewhere), so callers that only need
+paths use discover_paths.
+
+Only .gitignore files inside the root are read; rules from parent
+directories and from .git/info/exclude do not apply.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+from metrics import DISCOVERY_SKIPPED_DIRS, span
+
+# Directory names that never hold project sources
+VENDORED_DIRS = frozenset({
+    '.git', '.hg', '.svn', '.tox', '.nox', '.venv', '.mypy_cache', '.pytest_cache',
+    '__pycache__', 'node_modules', 'bower_components', 'site-packages', 'dist-packages',
+})
+# A directory containing this file is a virtualenv, whatever its name
+VIRTUALENV_MARKER = 'pyvenv.cfg'
+# Directories below the root with more entries than this are skipped
+# (datasets, generated output) rather than descended into; each skip is
+# logged and counted in codediagram_discovery_skipped_dirs_total
+MAX_DIR_ENTRIES = 10000
+
+
+class SourceFile(NamedTuple):
+    path: str
+    size: int
+    mtime_ns: int
+
+
+@lru_cache(maxsize=32)
+def compile_exclude_patterns(patterns: Tuple[str, ...]) -> Optional[Pattern]:
+    """
+    One regex matching a file or directory name that starts with any of the
+    patterns (a trailing '*' is ignored), as the analyzers always matched
+    them: 'env' also excludes 'environment', '.*' every hidden name.
+    """
+    if not patterns:
+        return None
+    return re.compile('|'.join(re.escape(pattern.rstrip('*')) for pattern in patterns))
+
+
+def _translate_gitignore_glob(pattern: str) -> str:
+    """Regex for a gitignore glob matched against a '/'-separated relative path."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            parts.append('/.*')
+            i += 3
+        elif pattern.startswith('**', i):
+            parts.append('.*')
+            i += 2
+        elif c == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                parts.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end + 1
+        elif c == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return ''.join(parts)
+
+
+class GitignoreRules:
+    """Rules of one .gitignore file, matched against paths relative to its directory."""
+
+    def __init__(self, lines: Iterable[str]):
+        # (regex, negated, directories only), in file order
+        self.rules: List[Tuple[Pattern, bool, bool]] = []
+        for line in lines:
+            line = line.rstrip('\n').rstrip('\r')
+            if not line.endswith('\\ '):
+                line = line.rstrip(' ')
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            elif line.startswith('\\!') or line.startswith('\\#'):
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if not line:
+                continue
+            # A slash anywhere but at the end anchors the pattern to this directory
+            if '/' in line:
+                regex = _translate_gitignore_glob(line.lstrip('/'))
+            else:
+                regex = '(?:.*/)?' + _translate_gitignore_glob(line)
+            self.rules.append((re.compile(regex + r'\Z'), negated, dir_only))
+        # Without negations the outcome is just "any rule matches"
+        self.simple = not any(negated for _, negated, _ in self.rules)
+        if self.simple:
+            self.files_regex = self._combine(rule for rule in self.rules if not rule[2])
+            self.dirs_regex = self._combine(self.rules)
+
+    @staticmethod
+    def _combine(rules) -> Optional[Pattern]:
+        patterns = [regex.pattern for regex, _, _ in rules]
+        return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns)) if patterns else None
+
+    @classmethod
+    def load(cls, file_path: str) -> Optional["GitignoreRules"]:
+        try:
+            with open(file_path, encoding='utf-8', errors='replace') as f:
+                rules = cls(f)
+        except OSError:
+            return None
+        return rules if rules.rules else None
+
+    def match(self, relative_path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included by a negation, None if no rule applies."""
+        if self.simple:
+            regex = self.dirs_regex if is_dir else self.files_regex
+            return True if regex is not None and regex.match(relative_path) else None
+        for regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                return not negated
+        return None
+
+
+# (directory relative to the root, rules) of the .gitignore files in effect
+_RuleStack = Tuple[Tuple[str, GitignoreRules], ...]
+
+
+def _ignored(rule_stack: _RuleStack, relative_path: str, is_dir: bool) -> bool:
+    # Deeper .gitignore files take precedence over the ones above them
+    for base, rules in reversed(rule_stack):
+        result = rules.match(relative_path[len(base):] if base else relative_path, is_dir)
+        if result is not None:
+            return result
+    return False
+
+
+def _entry_name(entry: os.DirEntry) -> str:
+    return entry.name
+
+
+def _scan(root: str, extensions: Optional[Tuple[str, ...]], excluded: Optional[Pattern],
+          use_gitignore: bool, max_dir_entries: int) -> List[os.DirEntry]:
+    """Entries of the files to keep, in walk order."""
+    found: List[os.DirEntry] = []
+    with span("discover"):
+        # (directory, path relative to root with trailing '/', .gitignore rules in effect)
+        stack: List[Tuple[str, str, _RuleStack]] = [(root, '', ())]
+        while stack:
+            directory, relative, rule_stack = stack.pop()
+            # Names only at first; the .gitignore and virtualenv checks need the whole listing
+            files: List[os.DirEntry] = []
+            subdirectories: List[os.DirEntry] = []
+            entry_count = 0
+            has_gitignore = is_virtualenv = False
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        entry_count += 1
+                        name = entry.name
+                        if name == '.gitignore':
+                            has_gitignore = True
+                        elif name == VIRTUALENV_MARKER:
+                            is_virtualenv = True
+                        try:
+                            is_dir = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if is_dir:
+                            if name in VENDORED_DIRS:
+                                continue
+                        elif extensions is not None and not name.endswith(extensions):
+                            continue
+                        if excluded is not None and excluded.match(name):
+                            continue
+                        (subdirectories if is_dir else files).append(entry)
+            except OSError:
+                continue
+            if relative and (is_virtualenv or entry_count > max_dir_entries):
+                if not is_virtualenv:
+                    DISCOVERY_SKIPPED_DIRS.inc()
+                    print(f"Skipping {directory}: {entry_count} entries (over max_dir_entries)")
+                continue
+            if use_gitignore and has_gitignore:
+                rules = GitignoreRules.load(os.path.join(directory, '.gitignore'))
+                if rules is not None:
+                    rule_stack = rule_stack + ((relative, rules),)
+
+            files.sort(key=_entry_name)
+            if rule_stack:
+                files = [entry for entry in files if not _ignored(rule_stack, relative + entry.name, False)]
+            found.extend(files)
+
+            subdirectories.sort(key=_entry_name, reverse=True)
+            for entry in subdirectories:
+                if rule_stack and _ignored(rule_stack, relative + entry.name, True):
+                    continue
+                stack.append((entry.path, relative + entry.name + '/', rule_stack))
+    return found
+
+
+def _options(extensions: Optional[Sequence[str]], exclude_patterns: Optional[Sequence[str]]):
+    return tuple(extensions) if extensions else None, compile_exclude_patterns(tuple(exclude_patterns or ()))
+
+
+def discover_paths(root: str, extensions: Optional[Sequence[str]] = ('.py',),
+                   exclude_patterns: Optional[Sequence[str]] = None, use_gitignore: bool = True,
+                   max_dir_entries: int = MAX_DIR_ENTRIES) -> List[str]:
+    """
+    Find the source files under root.
+
+    Args:
+        root: Directory to search
+        extensions: File suffixes to keep (None: every file)
+        exclude_patterns: Prefixes matched against file and directory names,
+            a trailing '*' ignored (e.g. ['test_*', '__pycache__']); matching
+            directories are not entered
+        use_gitignore: Skip paths ignored by .gitignore files under root
+        max_dir_entries: Skip directories below root with more entries than this
+
+    Returns:
+        File paths in walk order (each directory's files sorted by name,
+        before its subdirectories)
+    """
+    extensions, excluded = _options(extensions, exclude_patterns)
+    entries = _scan(root, extensions, excluded, use_gitignore, max_dir_entries)
+    # is_file() follows symlinks, like os.walk's file list
+    return [entry.path for entry in entries if entry.is_file()]
+
+
+def discover_files(root: str, extensions: Optional[Sequence[str]] = ('.py',),
+                   exclude_patterns: Optional[Sequence[str]] = None, use_gitignore: bool = True,
+                   max_dir_entries: int = MAX_DIR_ENTRIES) -> List[SourceFile]:
+    """discover_paths with the size and mtime of each file."""
+    extensions, excluded = _options(extensions, exclude_patterns)
+    found = []
+    for entry in _scan(root, extensions, excluded, use_gitignore, max_dir_entries):
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        if entry.is_file():
+            found.append(SourceFile(entry.path, st.st_size, st.st_mtime_ns))
+    return found
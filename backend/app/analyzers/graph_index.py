@@ -0,0 +1,98 @@
+"""
+Project-wide index over a call graph.
+
+The call graph is stored per file ({file: {nodes, edges}}). GraphIndex
+keeps the same data keyed by node id and by (source, target), with
+per-file membership, so cross-file lookups, deduplication and merges are
+direct dictionary operations instead of scans over every file.
+"""
+
+from typing import Dict, List, Any, Optional, Tuple
+
+EdgeKey = Tuple[str, str]
+
+
+class GraphIndex:
+    """Node and edge index of a whole project, grouped by file."""
+
+    def __init__(self):
+        self.nodes: Dict[str, Dict[str, Any]] = {}       # node id -> node
+        self.node_files: Dict[str, str] = {}             # node id -> file key
+        self.edges: Dict[EdgeKey, Dict[str, Any]] = {}   # (source, target) -> edge
+        self.edge_files: Dict[EdgeKey, str] = {}         # (source, target) -> file key
+        self.files: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}  # file key -> {nodes, edges}
+
+    @classmethod
+    def from_call_graph(cls, call_graph: Dict[str, Dict[str, Any]]) -> "GraphIndex":
+        index = cls()
+        for file_key, graph in call_graph.items():
+            index.add_file(file_key, graph)
+        return index
+
+    def add_file(self, file_key: str, graph: Dict[str, Any]) -> None:
+        """Add (or overwrite) the nodes and edges of one file."""
+        if file_key in self.files:
+            self.remove_file(file_key)
+        self.files[file_key] = {"nodes": list(graph.get("nodes", [])), "edges": list(graph.get("edges", []))}
+        for node in self.files[file_key]["nodes"]:
+            self.nodes[node["id"]] = node
+            self.node_files[node["id"]] = file_key
+        for edge in self.files[file_key]["edges"]:
+            key = (edge["source"], edge["target"])
+            self.edges[key] = edge
+            self.edge_files[key] = file_key
+
+    def remove_file(self, file_key: str) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Remove one file; returns its previous {nodes, edges}."""
+        graph = self.files.pop(file_key, None)
+        if graph is None:
+            return None
+        for node in graph["nodes"]:
+            if self.node_files.get(node["id"]) == file_key:
+                del self.nodes[node["id"]]
+                del self.node_files[node["id"]]
+        for edge in graph["edges"]:
+            key = (edge["source"], edge["target"])
+            if self.edge_files.get(key) == file_key:
+                del self.edges[key]
+                del self.edge_files[key]
+        return graph
+
+    def replace_file(self, file_key: str, graph: Dict[str, Any]) -> Dict[str, List[Any]]:
+        """
+        Replace the graph of one file and report the difference.
+
+        Items are matched by id (edge ids derive from source, target and
+        type), so each id appears in at most one of the lists.
+
+        Returns:
+            Dict with 'nodes_added'/'edges_added' and 'nodes_changed'/
+            'edges_changed' (new items) and 'nodes_removed'/'edges_removed' (ids)
+        """
+        old = self.remove_file(file_key) or {"nodes": [], "edges": []}
+        self.add_file(file_key, graph)
+        new = self.files[file_key]
+        diff = {}
+        for kind in ("nodes", "edges"):
+            old_items = {item["id"]: item for item in old[kind]}
+            new_items = {item["id"]: item for item in new[kind]}
+            diff[f"{kind}_added"] = [item for key, item in new_items.items() if key not in old_items]
+            diff[f"{kind}_changed"] = [
+                item for key, item in new_items.items() if key in old_items and old_items[key] != item
+            ]
+            diff[f"{kind}_removed"] = [key for key in old_items if key not in new_items]
+        return diff
+
+    def get_node(self, node_id: str) -> Optional[Dict[str, Any]]:
+        return self.nodes.get(node_id)
+
+    def file_of(self, node_id: str) -> Optional[str]:
+        return self.node_files.get(node_id)
+
+    def get_edge(self, source: str, target: str) -> Optional[Dict[str, Any]]:
+        return self.edges.get((source, target))
+
+    def to_call_graph(self, file_order: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Per-file call graph (cg_json_output_all.json format)."""
+        keys = file_order if file_order is not None else list(self.files)
+        return {key: self.files[key] for key in keys if key in self.files}
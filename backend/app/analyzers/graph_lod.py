@@ -0,0 +1,193 @@
+"""
+Level-of-detail views of a call graph.
+
+Every node gets a chain of supernodes from coarse to fine: its package
+prefixes, its module, its class (for methods and class nodes), then the
+node itself. A view picks one position in that chain (the zoom level)
+and may expand individual supernodes to the next position down; nodes that
+map to the same supernode are merged, and so are the edges between the
+same pair of supernodes, with call counts. The response size depends on
+what is visible, not on the size of the project.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Iterable, Tuple
+
+from metrics import record_cache
+
+PACKAGE = "package"
+MODULE = "module"
+CLASS = "class"
+FUNCTION = "function"
+LEVELS = (PACKAGE, MODULE, CLASS, FUNCTION)
+
+# Supernode id prefixes; ':' never occurs in node ids
+_PREFIXES = {PACKAGE: "package:", MODULE: "module:", CLASS: "class:", "external": "external:"}
+
+# Views kept per hierarchy (level, depth, expanded, externals)
+MAX_CACHED_VIEWS = 32
+
+
+def _node_module(node: Dict[str, Any]) -> str:
+    """Module of a node: its id without the function_name suffix."""
+    node_id = node["id"]
+    if "node_type" not in node:
+        # Script 'main' node: id is {module}.main, function_name {file}.main
+        return node_id.rsplit('.', 1)[0]
+    return node_id[:-len(node["function_name"]) - 1]
+
+
+class GraphHierarchy:
+    """Supernode chains of one CallGraphCSR and the views built from them."""
+
+    def __init__(self, index):
+        self.index = index
+        # node number -> supernode keys from coarsest to finest, the last one
+        # being the node id itself; package prefixes come first
+        self.chains: List[Tuple[str, ...]] = []
+        self.package_counts: List[int] = []  # node number -> number of package entries in its chain
+        self.supernodes: Dict[str, Dict[str, Any]] = {}  # key -> {kind, name, member_count, ...}
+        self._views: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._views_lock = threading.Lock()  # views are built in worker threads
+
+        for number, node_id in enumerate(index.ids):
+            node = index.node_attrs[number]
+            if node is None:
+                chain, packages = self._external_chain(node_id)
+            else:
+                chain, packages = self._project_chain(node)
+            self.chains.append(chain)
+            self.package_counts.append(packages)
+            for key in chain[:-1]:
+                self.supernodes[key]["member_count"] += 1
+
+    def _add_supernode(self, kind: str, name: str, **extra) -> str:
+        key = _PREFIXES[kind] + name
+        if key not in self.supernodes:
+            self.supernodes[key] = {
+                "id": key,
+                "node_type": kind,
+                "function_name": name or "(root)",
+                "member_count": 0,
+                **extra,
+            }
+        return key
+
+    def _project_chain(self, node: Dict[str, Any]) -> Tuple[Tuple[str, ...], int]:
+        module = _node_module(node)
+        parts = module.split('.')
+        # A package's __init__ module belongs to the package itself
+        is_init = (node.get("file") or "").replace('\\', '/').endswith("__init__.py")
+        package_parts = parts if is_init else parts[:-1]
+
+        chain = [self._add_supernode(PACKAGE, '.'.join(package_parts[:depth]))
+                 for depth in range(1, len(package_parts) + 1)]
+        packages = len(chain)
+        chain.append(self._add_supernode(MODULE, module, file=node.get("file")))
+        name = node.get("function_name") or ""
+        if node.get("node_type") in ("class", "method"):
+            class_name = name.split('.', 1)[0]
+            chain.append(self._add_supernode(CLASS, f"{module}.{class_name}", file=node.get("file")))
+        chain.append(node["id"])
+        return tuple(chain), packages
+
+    def _external_chain(self, node_id: str) -> Tuple[Tuple[str, ...], int]:
+        # Library and unresolved call targets are grouped by top-level name
+        return (self._add_supernode("external", node_id.split('.', 1)[0]), node_id), 0
+
+    def _start(self, number: int, level: str, package_depth: int) -> int:
+        """Position in a node's chain shown at the given zoom level."""
+        chain = self.chains[number]
+        if self.index.node_attrs[number] is None:
+            return len(chain) - 1 if level == FUNCTION else 0
+        packages = self.package_counts[number]
+        if level == PACKAGE:
+            return min(package_depth, packages) - 1 if packages else 0
+        if level == MODULE:
+            return packages
+        if level == CLASS:
+            return packages + 1
+        return len(chain) - 1
+
+    def view(self, level: str = PACKAGE, package_depth: int = 1,
+             expanded: Iterable[str] = (), include_external: bool = False) -> Dict[str, Any]:
+        """
+        Aggregated graph at a zoom level.
+
+        Args:
+            level: package, module, class or function
+            package_depth: number of package components shown at package level
+            expanded: supernode ids to show one level finer (may be nested)
+            include_external: keep call targets outside the project (grouped per library)
+
+        Returns:
+            {nodes, edges}: original nodes and supernodes (with member_count and
+            expandable), edges merged per (source, target) with count and edge_types
+        """
+        expanded = frozenset(expanded)
+        key = (level, package_depth, expanded, include_external)
+        with self._views_lock:
+            cached = self._views.get(key)
+            if cached is not None:
+                self._views.move_to_end(key)
+        record_cache("graph_lod_views", cached is not None)
+        if cached is not None:
+            return cached
+
+        index = self.index
+        representative = []  # node number -> visible key (None: hidden)
+        for number, chain in enumerate(self.chains):
+            if not include_external and index.node_attrs[number] is None:
+                representative.append(None)
+                continue
+            position = self._start(number, level, package_depth)
+            while position < len(chain) - 1 and chain[position] in expanded:
+                position += 1
+            representative.append(chain[position])
+
+        visible: Dict[str, Dict[str, Any]] = {}
+        for number, visible_key in enumerate(representative):
+            if visible_key is None or visible_key in visible:
+                continue
+            supernode = self.supernodes.get(visible_key)
+            if supernode is None:
+                visible[visible_key] = index.node_attrs[number] or {"id": visible_key, "external": True}
+            else:
+                visible[visible_key] = dict(supernode, expandable=True, internal_calls=0)
+
+        merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        offsets, targets, edge_numbers = index.out_offsets, index.out_targets, index.out_edges
+        for number, source in enumerate(representative):
+            if source is None:
+                continue
+            for position in range(offsets[number], offsets[number + 1]):
+                target = representative[targets[position]]
+                if target is None:
+                    continue
+                if source == target:
+                    if source in self.supernodes:
+                        visible[source]["internal_calls"] += 1
+                    continue
+                entry = merged.get((source, target))
+                if entry is None:
+                    entry = merged[(source, target)] = {
+                        "id": f"{source}->{target}",
+                        "source": source,
+                        "target": target,
+                        "count": 0,
+                        "edge_types": {},
+                    }
+                entry["count"] += 1
+                edge_type = index.edges[edge_numbers[position]].get("edge_type", "function_call")
+                entry["edge_types"][edge_type] = entry["edge_types"].get(edge_type, 0) + 1
+
+        result = {"nodes": list(visible.values()), "edges": list(merged.values())}
+        with self._views_lock:
+            self._views[key] = result
+            if len(self._views) > MAX_CACHED_VIEWS:
+                self._views.popitem(last=False)
+        return result
+
+    def has_supernode(self, key: str) -> bool:
+        return key in self.supernodes
@@ -0,0 +1,297 @@
+"""
+Server-side queries over a project's call graph.
+
+CallGraphCSR interns every node id into a string table and stores the
+edges twice in compressed sparse row form (outgoing and incoming), as
+int arrays indexed by node number. Callers/callees, k-hop neighborhoods,
+shortest call paths and file/package subgraphs then touch only the part
+of the graph they return, so clients no longer need to load the whole
+cg_json_output_all.json to look at one function.
+"""
+
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+import orjson
+
+from metrics import record_cache
+
+from .artifact_store import AST, get_artifact_store, normalize_project_path
+
+# Bounds on neighborhood queries so responses stay small on any project
+MAX_DEPTH = 5
+MAX_NODES = 2000
+
+OUT = "out"
+IN = "in"
+BOTH = "both"
+
+
+def _csr(node_count: int, rows: array, cols: array) -> Tuple[array, array, array]:
+    """Counting-sort (row, col) pairs into offsets, columns and edge numbers."""
+    offsets = array('i', [0]) * (node_count + 1)
+    for row in rows:
+        offsets[row + 1] += 1
+    for i in range(node_count):
+        offsets[i + 1] += offsets[i]
+    fill = array('i', offsets[:-1])
+    columns = array('i', [0]) * len(rows)
+    edge_numbers = array('i', [0]) * len(rows)
+    for edge_number, (row, col) in enumerate(zip(rows, cols)):
+        position = fill[row]
+        columns[position] = col
+        edge_numbers[position] = edge_number
+        fill[row] = position + 1
+    return offsets, columns, edge_numbers
+
+
+class CallGraphCSR:
+    """Immutable adjacency index of one analyzed call graph."""
+
+    def __init__(self, call_graph: Dict[str, Dict[str, Any]]):
+        self.ids: List[str] = []                          # node number -> id (string table)
+        self.index: Dict[str, int] = {}                   # id -> node number
+        self.node_attrs: List[Optional[Dict[str, Any]]] = []  # None for call targets outside the project
+        self.files: List[str] = list(call_graph)          # file number -> file key
+        self.node_file = array('i')                       # node number -> file number (-1: none)
+        self.edges: List[Dict[str, Any]] = []             # edge number -> edge
+
+        for file_number, graph in enumerate(call_graph.values()):
+            for node in graph.get("nodes", []):
+                number = self._intern(node["id"])
+                self.node_attrs[number] = node
+                self.node_file[number] = file_number
+
+        sources, targets = array('i'), array('i')
+        for graph in call_graph.values():
+            for edge in graph.get("edges", []):
+                sources.append(self._intern(edge["source"]))
+                targets.append(self._intern(edge["target"]))
+                self.edges.append(edge)
+
+        count = len(self.ids)
+        self.out_offsets, self.out_targets, self.out_edges = _csr(count, sources, targets)
+        self.in_offsets, self.in_sources, self.in_edges = _csr(count, targets, sources)
+
+        self.file_nodes: List[array] = [array('i') for _ in self.files]
+        for number, file_number in enumerate(self.node_file):
+            if file_number >= 0:
+                self.file_nodes[file_number].append(number)
+        self.file_index = {file_key: number for number, file_key in enumerate(self.files)}
+
+        # Ids in sorted order, for package (dotted prefix) lookups by bisection
+        self.sorted_numbers = sorted(range(count), key=self.ids.__getitem__)
+        self.sorted_ids = [self.ids[number] for number in self.sorted_numbers]
+        self._hierarchy = None
+        self._hierarchy_lock = threading.Lock()
+
+    @property
+    def hierarchy(self):
+        """GraphHierarchy for level-of-detail views, built on first use (once, from any thread)."""
+        with self._hierarchy_lock:
+            if self._hierarchy is None:
+                from .graph_lod import GraphHierarchy
+                self._hierarchy = GraphHierarchy(self)
+            return self._hierarchy
+
+    def _intern(self, node_id: str) -> int:
+        number = self.index.get(node_id)
+        if number is None:
+            number = len(self.ids)
+            self.index[node_id] = number
+            self.ids.append(node_id)
+            self.node_attrs.append(None)
+            self.node_file.append(-1)
+        return number
+
+    def _adjacent(self, number: int, direction: str) -> Iterable[Tuple[int, int]]:
+        """(neighbor, edge number) pairs of a node."""
+        if direction in (OUT, BOTH):
+            for position in range(self.out_offsets[number], self.out_offsets[number + 1]):
+                yield self.out_targets[position], self.out_edges[position]
+        if direction in (IN, BOTH):
+            for position in range(self.in_offsets[number], self.in_offsets[number + 1]):
+                yield self.in_sources[position], self.in_edges[position]
+
+    def _node(self, number: int) -> Dict[str, Any]:
+        node = self.node_attrs[number]
+        if node is None:
+            # Call target without a definition in the project (library, builtin, unresolved)
+            return {"id": self.ids[number], "external": True}
+        return node
+
+    def _result(self, numbers: Iterable[int], edge_numbers: Iterable[int], **extra) -> Dict[str, Any]:
+        return {
+            "nodes": [self._node(number) for number in numbers],
+            "edges": [self.edges[edge_number] for edge_number in edge_numbers],
+            **extra,
+        }
+
+    def has_node(self, node_id: str) -> bool:
+        return node_id in self.index
+
+    def neighbors(self, node_id: str, direction: str = OUT) -> Dict[str, Any]:
+        """Direct callees (OUT), callers (IN) or both of a node."""
+        return self.neighborhood(node_id, 1, direction)
+
+    def neighborhood(self, node_id: str, depth: int = 1, direction: str = BOTH,
+                     max_nodes: int = MAX_NODES) -> Dict[str, Any]:
+        """
+        Nodes within depth calls of node_id, and the edges that reach them.
+
+        Returns:
+            {nodes, edges, truncated}; truncated is True when max_nodes was hit
+        """
+        start = self.index[node_id]
+        depth = max(0, min(depth, MAX_DEPTH))
+        visited = {start: 0}
+        edge_numbers = []
+        queue = deque([start])
+        truncated = False
+        while queue:
+            number = queue.popleft()
+            distance = visited[number]
+            if distance == depth:
+                continue
+            for neighbor, edge_number in self._adjacent(number, direction):
+                if neighbor not in visited:
+                    if len(visited) >= max_nodes:
+                        truncated = True
+                        continue
+                    visited[neighbor] = distance + 1
+                    queue.append(neighbor)
+                edge_numbers.append(edge_number)
+        return self._result(visited, dict.fromkeys(edge_numbers), truncated=truncated)
+
+    def shortest_path(self, source_id: str, target_id: str) -> Dict[str, Any]:
+        """
+        Shortest chain of calls from source_id to target_id (breadth first).
+
+        Returns:
+            {path (node ids, empty if unreachable), nodes, edges}
+        """
+        source, target = self.index[source_id], self.index[target_id]
+        previous = {source: (-1, -1)}  # node -> (predecessor, edge number)
+        queue = deque([source])
+        while queue and target not in previous:
+            number = queue.popleft()
+            for neighbor, edge_number in self._adjacent(number, OUT):
+                if neighbor not in previous:
+                    previous[neighbor] = (number, edge_number)
+                    queue.append(neighbor)
+        if target not in previous:
+            return self._result([], [], path=[])
+
+        numbers, edge_numbers = [], []
+        number = target
+        while number != -1:
+            numbers.append(number)
+            number, edge_number = previous[number]
+            if edge_number != -1:
+                edge_numbers.append(edge_number)
+        numbers.reverse()
+        edge_numbers.reverse()
+        return self._result(numbers, edge_numbers, path=[self.ids[number] for number in numbers])
+
+    def resolve_file(self, file_path: str, project_path: Optional[str] = None) -> Optional[int]:
+        """File number of an absolute file key or a path relative to the project."""
+        for candidate in (file_path, os.path.abspath(os.path.join(project_path or '', file_path))):
+            if candidate in self.file_index:
+                return self.file_index[candidate]
+        return None
+
+    def package_nodes(self, package: str) -> List[int]:
+        """Nodes whose id is package or lies under it (dotted prefix)."""
+        numbers = []
+        start = bisect_left(self.sorted_ids, package)
+        if start < len(self.sorted_ids) and self.sorted_ids[start] == package:
+            numbers.append(self.sorted_numbers[start])
+        prefix = package + '.'
+        position = bisect_left(self.sorted_ids, prefix)
+        while position < len(self.sorted_ids) and self.sorted_ids[position].startswith(prefix):
+            numbers.append(self.sorted_numbers[position])
+            position += 1
+        return numbers
+
+    def subgraph(self, file_number: Optional[int] = None, package: Optional[str] = None,
+                 include_external: bool = False) -> Dict[str, Any]:
+        """
+        Nodes defined in a file and/or under a package, with the edges between them.
+
+        include_external: also return edges leaving the selection and their targets
+        """
+        if file_number is not None:
+            selected = list(self.file_nodes[file_number])
+            if package is not None:
+                in_package = set(self.package_nodes(package))
+                selected = [number for number in selected if number in in_package]
+        elif package is not None:
+            selected = [number for number in self.package_nodes(package) if self.node_attrs[number] is not None]
+        else:
+            selected = []
+
+        members = dict.fromkeys(selected)
+        edge_numbers = []
+        for number in selected:
+            for neighbor, edge_number in self._adjacent(number, OUT):
+                if neighbor in members:
+                    edge_numbers.append(edge_number)
+                elif include_external:
+                    members[neighbor] = None
+                    edge_numbers.append(edge_number)
+        return self._result(members, edge_numbers)
+
+
+# Query index per project, rebuilt when the artifact it was built from changes
+_indexes: Dict[str, Tuple[Tuple[Optional[str], Optional[int]], CallGraphCSR]] = {}
+_indexes_lock = threading.Lock()
+
+
+def _latest_artifact(project_path: str) -> Tuple[Optional[str], Optional[int]]:
+    """(store key, mtime_ns) of the project's most recent AST call graph."""
+    store = get_artifact_store()
+    key = store.latest(project_path, AST)
+    return key, store.stamp(key)
+
+
+def publish_call_graph(project_path: str, call_graph: Dict[str, Dict[str, Any]]) -> CallGraphCSR:
+    """Build the query index of a freshly analyzed (and saved) call graph."""
+    index = CallGraphCSR(call_graph)
+    with _indexes_lock:
+        _indexes[normalize_project_path(project_path)] = (_latest_artifact(project_path), index)
+    return index
+
+
+def get_query_index(project_path: str) -> Optional[CallGraphCSR]:
+    """
+    Query index of a project's latest call graph, loading the saved artifact
+    if the graph was produced elsewhere (streaming, incremental update, an
+    earlier server run). None if the project has not been analyzed (or its
+    artifact was evicted). Loading and indexing a large graph takes a while;
+    call it off the event loop.
+    """
+    project = normalize_project_path(project_path)
+    artifact = _latest_artifact(project_path)
+    with _indexes_lock:
+        entry = _indexes.get(project)
+    if entry is not None and entry[0] == artifact:
+        record_cache("graph_query_index", True)
+        return entry[1]
+    key, mtime = artifact
+    if mtime is None:
+        return None
+    record_cache("graph_query_index", False)
+    try:
+        with open(get_artifact_store().path(key), 'rb') as f:
+            call_graph = orjson.loads(f.read())
+    except FileNotFoundError:
+        # Evicted from the artifact store since stamp()
+        return None
+    index = CallGraphCSR(call_graph)
+    with _indexes_lock:
+        _indexes[project] = (artifact, index)
+    return index
@@ -78,12 +78,8 @@ class ImportVisitor(ast.NodeVisitor):
     
     def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
         """Process from x import y, z imports"""
-        if node.module is None:  # relative import like "from . import x"
-            return
-            
-        module = node.module
-        if node.level > 0:  # Handle relative imports
-            module = '.' * node.level + module
+        # Relative imports keep their leading dots: "from . import x" -> '.'
+        module = '.' * node.level + (node.module or '')
             
         self.imports.append(module)
         
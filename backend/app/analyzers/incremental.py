@@ -0,0 +1,249 @@
+"""
+Incremental call-graph updates.
+
+A project analyzed once keeps its per-file state (mtime, size, content
+hash), summaries and resolved graph in memory. Later updates re-extract
+only the added or changed files and re-resolve only the files that looked
+up a module whose declared symbols changed. The result
+is a delta of added, changed and removed nodes and edges per file, so a
+client can patch its graph instead of reloading it. Every id appears in
+at most one of those lists, so they can be applied in any order.
+"""
+
+import asyncio
+import itertools
+import os
+from collections import OrderedDict
+from typing import Dict, List, Any, Optional, Set, Tuple
+
+from .ast_analyzer import (
+    FileSummary,
+    SymbolIndex,
+    assign_module_names,
+    build_file_graph,
+    content_digest,
+    find_python_sources,
+    save_call_graph_artifact,
+)
+from .graph_index import GraphIndex
+from .parallel_analyzer import summarize_files_parallel
+from .summary_cache import get_summary_cache
+
+# Projects whose incremental state is kept in memory (least recently used are dropped)
+MAX_INCREMENTAL_PROJECTS = 8
+
+# Graph versions are unique in the process, so a project dropped from memory
+# and analyzed again never reuses a version a client may still hold
+_versions = itertools.count(1)
+
+
+def _module_suffixes(module: str) -> Set[str]:
+    """'a.b.c' -> {'a.b.c', 'b.c', 'c'}: every name SymbolIndex.find_module may match it by."""
+    parts = module.split('.')
+    return {'.'.join(parts[i:]) for i in range(len(parts))}
+
+
+class IncrementalCallGraph:
+    """In-memory call graph of one project that can be updated in place."""
+
+    def __init__(self, project_path: str, exclude_patterns: List[str] = None):
+        self.project_path = os.path.abspath(project_path)
+        self.exclude_patterns = exclude_patterns
+        self.version = 0
+        self.file_states: Dict[str, Tuple[int, int, Optional[str]]] = {}  # path -> (mtime_ns, size, content hash)
+        self.summaries: Dict[str, FileSummary] = {}  # path -> summary, in discovery order
+        self.references: Dict[str, Set[str]] = {}  # path -> module names looked up while resolving
+        self.index = GraphIndex()  # keyed by normalized path
+        self.lock = asyncio.Lock()
+
+    def _scan(self) -> Tuple[List[str], List[str], List[str], List[str], Dict[str, Tuple[int, int]]]:
+        """
+        Compare the files on disk with the recorded state.
+
+        Returns:
+            (current files, added, changed, removed, stat of added/changed files)
+        """
+        sources = find_python_sources(self.project_path, self.exclude_patterns)
+        current = [source.path for source in sources]
+        added, changed = [], []
+        stats = {}
+        for file_path, size, mtime_ns in sources:
+            previous = self.file_states.get(file_path)
+            if previous and previous[0] == mtime_ns and previous[1] == size:
+                continue
+            if previous and previous[2]:
+                # Touched but possibly not modified: compare content hashes
+                try:
+                    with open(file_path, 'rb') as f:
+                        digest = content_digest(f.read())
+                except OSError:
+                    digest = None
+                if digest == previous[2]:
+                    self.file_states[file_path] = (mtime_ns, size, digest)
+                    continue
+            stats[file_path] = (mtime_ns, size)
+            (changed if previous else added).append(file_path)
+        current_set = set(current)
+        removed = [file_path for file_path in self.file_states if file_path not in current_set]
+        return current, added, changed, removed, stats
+
+    async def update(self, jobs: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Bring the graph up to date with the files on disk.
+
+        Returns:
+            Delta with the added/changed/removed files and, per file,
+            the added and changed nodes/edges and the ids of removed ones
+        """
+        loop = asyncio.get_running_loop()
+        current, added, changed, removed, stats = await loop.run_in_executor(None, self._scan)
+
+        fresh = {}
+        if added or changed:
+            for summary in await summarize_files_parallel(added + changed, jobs, cache=get_summary_cache()):
+                fresh[summary.path] = summary
+            await loop.run_in_executor(None, get_summary_cache().save)
+
+        delta = await loop.run_in_executor(None, self._apply, current, added, changed, removed, stats, fresh)
+        if delta["files"]["added"] or delta["files"]["changed"] or delta["files"]["removed"]:
+            await loop.run_in_executor(
+                None, save_call_graph_artifact, self.call_graph, self.project_path, self.exclude_patterns
+            )
+        return delta
+
+    @property
+    def call_graph(self) -> Dict[str, Dict[str, Any]]:
+        """Current call graph in discovery order (cg_json_output_all.json format)."""
+        return self.index.to_call_graph([os.path.abspath(file_path) for file_path in self.summaries])
+
+    def _apply(self, current: List[str], added: List[str], changed: List[str], removed: List[str],
+               stats: Dict[str, Tuple[int, int]], fresh: Dict[str, FileSummary]) -> Dict[str, Any]:
+        old_symbols = SymbolIndex(list(self.summaries.values()))
+
+        # Files that can no longer be read are dropped like removed files
+        unreadable = [file_path for file_path in added + changed if file_path not in fresh]
+        added = [file_path for file_path in added if file_path in fresh]
+        changed = [file_path for file_path in changed if file_path in fresh]
+        removed = removed + [file_path for file_path in unreadable if file_path in self.file_states]
+        for file_path in removed + unreadable:
+            self.file_states.pop(file_path, None)
+            self.summaries.pop(file_path, None)
+            self.references.pop(file_path, None)
+        for file_path in added + changed:
+            summary = fresh[file_path]
+            mtime_ns, size = stats[file_path]
+            self.file_states[file_path] = (mtime_ns, size, summary.content_hash)
+            self.summaries[file_path] = summary
+        # Keep discovery order so the graph is laid out like a full run
+        self.summaries = {file_path: self.summaries[file_path] for file_path in current if file_path in self.summaries}
+
+        # Adding or removing an __init__.py renames the modules around it
+        packages_changed = any(os.path.basename(file_path) == '__init__.py' for file_path in added + removed)
+        if packages_changed:
+            assign_module_names(list(self.summaries.values()), self.project_path)
+        else:
+            assign_module_names([fresh[file_path] for file_path in added + changed], self.project_path)
+
+        symbols = SymbolIndex(list(self.summaries.values()))
+        changed_modules = {
+            module for module in set(old_symbols.functions) | set(symbols.functions)
+            if old_symbols.functions.get(module) != symbols.functions.get(module)
+            or old_symbols.classes.get(module) != symbols.classes.get(module)
+        }
+
+        if packages_changed:
+            to_resolve = set(self.summaries)
+        else:
+            to_resolve = set(added + changed)
+            if changed_modules:
+                lookup_names = set()
+                for module in changed_modules:
+                    lookup_names |= _module_suffixes(module)
+                for file_path, refs in self.references.items():
+                    if file_path not in to_resolve and refs & lookup_names:
+                        to_resolve.add(file_path)
+
+        nodes_added, nodes_changed, nodes_removed = {}, {}, {}
+        edges_added, edges_changed, edges_removed = {}, {}, {}
+
+        for file_path in removed:
+            key = os.path.abspath(file_path)
+            old_graph = self.index.remove_file(key)
+            if old_graph:
+                nodes_removed[key] = [node['id'] for node in old_graph['nodes']]
+                edges_removed[key] = [edge['id'] for edge in old_graph['edges']]
+
+        for file_path in to_resolve:
+            key = os.path.abspath(file_path)
+            touched = set()
+            try:
+                new_graph = build_file_graph(self.summaries[file_path], self.project_path, symbols, touched)
+            except Exception as e:
+                print(f"Error processing {file_path}: {e}")
+                continue
+            self.references[file_path] = touched
+            diff = self.index.replace_file(key, new_graph)
+            for name, changes in (("nodes_added", nodes_added), ("nodes_changed", nodes_changed),
+                                  ("nodes_removed", nodes_removed), ("edges_added", edges_added),
+                                  ("edges_changed", edges_changed), ("edges_removed", edges_removed)):
+                if diff[name]:
+                    changes[key] = diff[name]
+
+        base_version = self.version
+        if added or changed or removed:
+            self.version = next(_versions)
+        return {
+            "project": self.project_path,
+            "base_version": base_version,
+            "version": self.version,
+            "files": {
+                "added": [os.path.abspath(p) for p in added],
+                "changed": [os.path.abspath(p) for p in changed],
+                "removed": [os.path.abspath(p) for p in removed],
+                "resolved": len(to_resolve),
+            },
+            "nodes": {"added": nodes_added, "changed": nodes_changed, "removed": nodes_removed},
+            "edges": {"added": edges_added, "changed": edges_changed, "removed": edges_removed},
+        }
+
+
+# Incremental state per project root, least recently used first
+_projects: "OrderedDict[str, IncrementalCallGraph]" = OrderedDict()
+
+
+def get_incremental_project(project_path: str) -> IncrementalCallGraph:
+    key = os.path.abspath(project_path)
+    project = _projects.get(key)
+    if project is None:
+        project = _projects[key] = IncrementalCallGraph(key)
+        if len(_projects) > MAX_INCREMENTAL_PROJECTS:
+            _projects.popitem(last=False)
+    else:
+        _projects.move_to_end(key)
+    return project
+
+
+async def update_project_call_graph(project_path: str, base_version: Optional[int] = None,
+                                    jobs: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Update a project's call graph and return what changed.
+
+    Args:
+        project_path: Root path of the Python project
+        base_version: Graph version the client currently has. If it does not
+            match the server's version, the full graph is returned instead of a delta.
+        jobs: Number of worker processes for per-file analysis
+
+    Returns:
+        Delta dict (see IncrementalCallGraph.update), with "full": True and
+        the complete "graph" when the client has to resync
+    """
+    project = get_incremental_project(project_path)
+    async with project.lock:
+        resync = base_version is None or base_version != project.version
+        delta = await project.update(jobs)
+        delta["full"] = resync
+        if resync:
+            del delta["nodes"], delta["edges"]
+            delta["graph"] = project.call_graph
+        return delta
@@ -0,0 +1,198 @@
+"""
+Background call-graph analysis jobs.
+
+Submitting a job returns its id immediately; the analysis runs as a task on
+the event loop, with parsing in the shared process pool and resolution and
+I/O in threads, so other requests keep being served. Progress counters
+(files discovered, parsed, resolved and bytes serialized) can be polled or
+streamed, and a job can be cancelled while it runs.
+"""
+
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Any, AsyncIterator, Optional
+
+from .ast_analyzer import build_project_call_graph
+
+# Number of analyses that run at the same time; later jobs wait queued
+MAX_RUNNING_JOBS = 2
+# Finished jobs kept for status and result requests (oldest dropped first)
+MAX_FINISHED_JOBS = 32
+# Minimum time between two progress events of one stream
+PROGRESS_INTERVAL = 0.1
+# Idle time after which a stream sends a keep-alive
+KEEPALIVE_INTERVAL = 15.0
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+_PHASE_COUNTERS = {
+    "discovered": "files_discovered",
+    "parsed": "files_parsed",
+    "resolved": "files_resolved",
+    "serialized": "bytes_serialized",
+}
+
+
+class JobCancelled(Exception):
+    """Raised inside a running analysis once its job has been cancelled."""
+
+
+class AnalysisJob:
+    """One call-graph analysis and its progress."""
+
+    def __init__(self, project_path: str, exclude_patterns: List[str] = None, jobs: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.project_path = os.path.abspath(project_path)
+        self.exclude_patterns = exclude_patterns
+        self.jobs = jobs
+        self.status = QUEUED
+        self.phase = None
+        self.counters = {name: 0 for name in _PHASE_COUNTERS.values()}
+        self.error: Optional[str] = None
+        self.result: Optional[bytes] = None  # compact JSON of the call graph
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._cancel_requested = False
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Status and progress of the job (without the result)."""
+        return {
+            "job_id": self.id,
+            "project": self.project_path,
+            "status": self.status,
+            "phase": self.phase,
+            **self.counters,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def _notify(self) -> None:
+        self._changed.set()
+
+    def progress(self, phase: str, count: int) -> None:
+        """ProgressCallback for build_project_call_graph; safe to call from worker threads."""
+        if self._cancel_requested:
+            raise JobCancelled(self.id)
+        self.phase = phase
+        self.counters[_PHASE_COUNTERS[phase]] += count
+        if not self._changed.is_set():
+            self._loop.call_soon_threadsafe(self._notify)
+
+    def _set_status(self, status: str, error: Optional[str] = None) -> None:
+        self.status = status
+        self.error = error
+        if status == RUNNING:
+            self.started_at = time.time()
+        elif status in FINISHED_STATES:
+            self.finished_at = time.time()
+        self._notify()
+
+    async def run(self, slots: asyncio.Semaphore) -> None:
+        try:
+            async with slots:
+                self._set_status(RUNNING)
+                _, self.result = await build_project_call_graph(
+                    self.project_path, self.exclude_patterns, jobs=self.jobs, progress=self.progress
+                )
+            self._set_status(COMPLETED)
+        except (asyncio.CancelledError, JobCancelled):
+            self._set_status(CANCELLED)
+        except Exception as e:
+            print(f"Analysis job {self.id} failed: {e}")
+            self._set_status(FAILED, str(e))
+
+    def cancel(self) -> bool:
+        """Request cancellation; returns False if the job already finished."""
+        if self.finished:
+            return False
+        # Work running in a thread stops at its next progress report
+        self._cancel_requested = True
+        if self.task is not None:
+            self.task.cancel()
+        return True
+
+    async def events(self) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield a snapshot whenever the job changed, at most every
+        PROGRESS_INTERVAL seconds, until it finishes. None is yielded after
+        KEEPALIVE_INTERVAL seconds without changes.
+        """
+        last = None
+        while True:
+            self._changed.clear()
+            current = self.snapshot()
+            if current != last:
+                last = current
+                yield current
+            if self.finished:
+                return
+            try:
+                await asyncio.wait_for(self._changed.wait(), KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            await asyncio.sleep(PROGRESS_INTERVAL)
+
+
+class JobManager:
+    """Registry of analysis jobs sharing a limited number of run slots."""
+
+    def __init__(self, max_running: int = MAX_RUNNING_JOBS, max_finished: int = MAX_FINISHED_JOBS):
+        self.max_finished = max_finished
+        self._jobs: "OrderedDict[str, AnalysisJob]" = OrderedDict()
+        self._slots = asyncio.Semaphore(max_running)
+
+    def submit(self, project_path: str, exclude_patterns: List[str] = None,
+               jobs: Optional[int] = None) -> AnalysisJob:
+        """Start an analysis in the background and return its job."""
+        self._prune()
+        job = AnalysisJob(project_path, exclude_patterns, jobs)
+        job.task = asyncio.create_task(job.run(self._slots))
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[AnalysisJob]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[AnalysisJob]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def list(self) -> List[AnalysisJob]:
+        return list(self._jobs.values())
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished + 1)]:
+            del self._jobs[job_id]
+
+
+_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    """Process-wide job manager (created on first use inside the event loop)."""
+    global _manager
+    if _manager is None:
+        _manager = JobManager()
+    return _manager
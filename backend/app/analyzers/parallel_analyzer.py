@@ -0,0 +1,180 @@
+"""
+Parallel analysis engine for the AST call graph.
+
+Per-file extraction (read, parse, visit) is CPU bound and independent per
+file, so it is fanned out to a process pool in chunks. Cross-file
+resolution needs every summary and runs afterwards on the merged results.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Any, Optional, Tuple
+
+import metrics
+
+from .ast_analyzer import FileSummary, ProgressCallback, summarize_file, resolve_call_graph
+from .summary_cache import SummaryCache
+
+# Upper bound for the number of files sent to a worker in one task
+MAX_CHUNK_SIZE = 64
+
+# Shared worker pool of default_jobs() processes; requests limit their own
+# share of it (jobs) instead of resizing it, so concurrent requests never
+# shut down each other's pool and the workers stay warm
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def default_jobs() -> int:
+    """Default number of worker processes (one per core)."""
+    return os.cpu_count() or 1
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=default_jobs())
+        return _executor
+
+
+def _reset_executor(broken: Optional[ProcessPoolExecutor] = None) -> None:
+    """Drop the shared pool (only if it is still broken, when given)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None or (broken is not None and _executor is not broken):
+            return
+        executor, _executor = _executor, None
+    executor.shutdown(wait=False)
+
+
+def shutdown_executor() -> None:
+    """Stop the shared worker pool (e.g. on application shutdown)."""
+    _reset_executor()
+
+
+def _summarize_chunk(file_paths: List[str]) -> Tuple[List[Optional[FileSummary]], List[Tuple[str, float]]]:
+    """
+    Worker entry point: summarize a chunk of files.
+
+    Returns:
+        (summaries, phase timings to replay in the parent process)
+    """
+    with metrics.capture() as observations:
+        summaries = [summarize_file(file_path) for file_path in file_paths]
+    return summaries, observations
+
+
+def _chunked(items: List[str], size: int) -> List[List[str]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def resolve_chunk_size(file_count: int, jobs: int, chunk_size: Optional[int] = None) -> int:
+    """
+    Pick a chunk size: a few chunks per worker for load balancing,
+    bounded so that small projects are not split into tiny tasks.
+    """
+    if chunk_size:
+        return max(1, chunk_size)
+    return max(1, min(MAX_CHUNK_SIZE, -(-file_count // (jobs * 4))))
+
+
+async def _run_chunks(executor: Optional[ProcessPoolExecutor], chunks: List[List[str]],
+                      progress: Optional[ProgressCallback], jobs: int = 1) -> List[FileSummary]:
+    """Summarize chunks in the executor, at most jobs at a time (None: one after another in a thread)."""
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(max(1, jobs))
+
+    async def run(chunk: List[str]) -> List[Optional[FileSummary]]:
+        async with limit:
+            summaries, observations = await loop.run_in_executor(executor, _summarize_chunk, chunk)
+        metrics.replay(observations)
+        if progress:
+            progress("parsed", len(chunk))
+        return summaries
+
+    if executor is None:
+        results = [await run(chunk) for chunk in chunks]
+    else:
+        results = await asyncio.gather(*[run(chunk) for chunk in chunks])
+    return [summary for chunk in results for summary in chunk if summary is not None]
+
+
+async def _summarize_uncached(file_paths: List[str], jobs: int, chunk_size: Optional[int],
+                              progress: Optional[ProgressCallback] = None) -> List[FileSummary]:
+    if jobs <= 1 or len(file_paths) <= 1:
+        return await _run_chunks(None, _chunked(file_paths, MAX_CHUNK_SIZE), progress)
+
+    chunks = _chunked(file_paths, resolve_chunk_size(len(file_paths), jobs, chunk_size))
+    executor = _get_executor()
+    try:
+        return await _run_chunks(executor, chunks, progress, jobs)
+    except (BrokenProcessPool, RuntimeError) as e:
+        # RuntimeError: the pool was shut down under us (application shutdown)
+        print(f"Process pool failed ({e}), falling back to serial analysis")
+        if isinstance(e, BrokenProcessPool):
+            _reset_executor(executor)
+        return await _run_chunks(None, _chunked(file_paths, MAX_CHUNK_SIZE), None)
+
+
+async def summarize_files_parallel(file_paths: List[str], jobs: Optional[int] = None,
+                                   chunk_size: Optional[int] = None,
+                                   cache: Optional[SummaryCache] = None,
+                                   progress: Optional[ProgressCallback] = None) -> List[FileSummary]:
+    """
+    Summarize files in a process pool without blocking the event loop.
+
+    Args:
+        file_paths: Python files to analyze
+        jobs: Worker processes used at most, out of the shared pool's default_jobs() (default: all)
+        chunk_size: Files per worker task (default: derived from jobs)
+        cache: Summary cache; only files whose content is not cached are analyzed
+        progress: Called with ("parsed", n) as files are analyzed or found in the cache
+
+    Returns:
+        FileSummary records in the order of file_paths (unreadable files are skipped)
+    """
+    jobs = jobs or default_jobs()
+    if cache is None:
+        return await _summarize_uncached(file_paths, jobs, chunk_size, progress)
+
+    loop = asyncio.get_running_loop()
+    found, missing = await loop.run_in_executor(None, cache.lookup_files, file_paths)
+    if progress and found:
+        progress("parsed", len(found))
+    if missing:
+        fresh = await _summarize_uncached(missing, jobs, chunk_size, progress)
+        found.update((summary.path, summary) for summary in fresh)
+        cache.store_summaries(fresh)
+        await loop.run_in_executor(None, cache.save)
+
+    return [found[file_path] for file_path in file_paths if file_path in found]
+
+
+async def generate_call_graph_parallel(file_paths: List[str], project_root: str = None,
+                                       jobs: Optional[int] = None,
+                                       chunk_size: Optional[int] = None,
+                                       cache: Optional[SummaryCache] = None,
+                                       progress: Optional[ProgressCallback] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Parallel counterpart of ast_analyzer.generate_call_graph.
+
+    Args:
+        file_paths: List of Python file paths to analyze
+        project_root: Root directory of the project (for relative paths)
+        jobs: Worker processes used at most, out of the shared pool's default_jobs() (default: all)
+        chunk_size: Files per worker task (default: derived from jobs)
+        cache: Summary cache to reuse results for unchanged files
+        progress: Called with ("parsed", n) and ("resolved", n) as work completes
+
+    Returns:
+        Dict in cg_json_output_all.json format
+    """
+    summaries = await summarize_files_parallel(file_paths, jobs, chunk_size, cache, progress)
+    # Resolution is cheap compared to parsing but still CPU work; keep it
+    # off the event loop so other endpoints stay responsive
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, resolve_call_graph, summaries, project_root, progress)
@@ -0,0 +1,81 @@
+"""
+Compact call-graph encodings and Accept negotiation.
+
+Graphs are serialized once, without whitespace: orjson for JSON and
+msgpack for binary clients. Graph endpoints pick the encoding from the
+request's Accept header; clients that do not ask for either keep the
+original {"status": 200, "data": "<json string>"} envelope. Both carry
+the status field that error responses set.
+"""
+
+from typing import Any, Optional
+
+import msgpack
+import orjson
+
+from metrics import span
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+_MEDIA_TYPES = {
+    "application/json": JSON_MEDIA_TYPE,
+    "application/msgpack": MSGPACK_MEDIA_TYPE,
+    "application/x-msgpack": MSGPACK_MEDIA_TYPE,
+    "application/vnd.msgpack": MSGPACK_MEDIA_TYPE,
+}
+
+
+def dumps_json(obj: Any) -> bytes:
+    """Minified UTF-8 JSON."""
+    with span("serialize_json"):
+        return orjson.dumps(obj)
+
+
+def dumps_msgpack(obj: Any) -> bytes:
+    with span("serialize_msgpack"):
+        return msgpack.packb(obj, use_bin_type=True)
+
+
+def negotiate_media_type(accept: Optional[str]) -> Optional[str]:
+    """
+    Pick the graph encoding requested by an Accept header.
+
+    Returns:
+        JSON_MEDIA_TYPE or MSGPACK_MEDIA_TYPE for the highest-quality one that
+        is explicitly listed (JSON wins ties), or None when neither is
+        (missing header, */*), meaning the legacy string envelope
+    """
+    best, best_q = None, 0.0
+    for entry in (accept or "").split(","):
+        media_type, _, params = entry.strip().partition(";")
+        media_type = _MEDIA_TYPES.get(media_type.strip().lower())
+        if media_type is None:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q or (q == best_q and media_type == JSON_MEDIA_TYPE and q > 0):
+            best, best_q = media_type, q
+    return best
+
+
+def encode_envelope(media_type: str, data: Any = None, data_json: Optional[bytes] = None) -> bytes:
+    """
+    Encode {"status": 200, "data": data} in the negotiated media type.
+
+    data_json: data already serialized with dumps_json; embedded as is for
+    JSON and decoded only if msgpack is requested
+    """
+    if media_type == MSGPACK_MEDIA_TYPE:
+        if data is None and data_json is not None:
+            data = orjson.loads(data_json)
+        return dumps_msgpack({"status": 200, "data": data})
+    if data_json is None:
+        data_json = dumps_json(data)
+    return b'{"status":200,"data":' + data_json + b'}'
@@ -0,0 +1,205 @@
+"""
+Persistent cache of per-file AST summaries.
+
+Entries are keyed by an xxhash of the file bytes plus ANALYZER_VERSION, so
+an unchanged file is never parsed twice and a new analyzer version never
+reuses stale results. The cache is bounded by total entry size with LRU
+eviction and stored next to the artifacts directory as msgpack files
+sharded by hash prefix, so saving after a few misses rewrites only the
+shards they fall in, not the whole cache.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import msgpack
+
+from metrics import record_cache
+
+from .ast_analyzer import ANALYZER_VERSION, FileSummary, content_digest
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache")
+SHARD_DIR = os.path.join(CACHE_DIR, "ast_summaries")
+CACHE_FORMAT = 1
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Hex digits of the content hash that pick the shard file (256 shards)
+SHARD_PREFIX_LENGTH = 2
+
+# Fields that depend on where the file lives rather than on its content
+_PATH_FIELDS = ("path", "module")
+
+
+def _shard(key: str) -> str:
+    """Shard of a cache key ("{version}:{digest}")."""
+    return key.rsplit(":", 1)[-1][:SHARD_PREFIX_LENGTH]
+
+
+class SummaryCache:
+    """Size-bounded LRU cache of FileSummary records backed by sharded msgpack files."""
+
+    def __init__(self, directory: str = SHARD_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()  # oldest first
+        self._size = 0
+        self._dirty: Set[str] = set()  # shards changed since the last save
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer at a time, so an older snapshot never wins
+        self._load()
+
+    @staticmethod
+    def make_key(digest: str) -> str:
+        return f"{ANALYZER_VERSION}:{digest}"
+
+    def _shard_path(self, shard: str) -> str:
+        return os.path.join(self.directory, f"{shard}.msgpack")
+
+    def _load(self) -> None:
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".msgpack"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, "rb") as f:
+                    data = msgpack.unpackb(f.read(), raw=False)
+            except Exception as e:
+                print(f"Ignoring unreadable summary cache shard {path}: {e}")
+                continue
+            if not isinstance(data, dict) or data.get("format") != CACHE_FORMAT:
+                continue
+            for key, packed in data.get("entries", []):
+                self._entries[key] = packed
+                self._size += len(packed)
+        self._evict()
+
+    def get(self, key: str, file_path: str) -> Optional[FileSummary]:
+        """Return the cached summary for key, rebound to file_path."""
+        with self._lock:
+            packed = self._entries.get(key)
+            if packed is None:
+                self.misses += 1
+                record_cache("ast_summaries", False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        record_cache("ast_summaries", True)
+        fields = msgpack.unpackb(packed, raw=False)
+        return FileSummary(
+            path=file_path,
+            module=os.path.splitext(os.path.basename(file_path))[0],
+            **fields
+        )
+
+    def put(self, key: str, summary: FileSummary) -> None:
+        fields = asdict(summary)
+        for name in _PATH_FIELDS:
+            fields.pop(name)
+        packed = msgpack.packb(fields, use_bin_type=True)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = packed
+            self._size += len(packed)
+            self._dirty.add(_shard(key))
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            key, packed = self._entries.popitem(last=False)
+            self._size -= len(packed)
+            self._dirty.add(_shard(key))
+
+    def save(self) -> None:
+        """Write the shards that changed to disk, each atomically."""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                dirty, self._dirty = self._dirty, set()
+                # Entries keep their LRU order within a shard
+                shards: Dict[str, list] = {shard: [] for shard in dirty}
+                for key, packed in self._entries.items():
+                    entries = shards.get(_shard(key))
+                    if entries is not None:
+                        entries.append((key, packed))
+            os.makedirs(self.directory, exist_ok=True)
+            for shard, entries in shards.items():
+                path = self._shard_path(shard)
+                if not entries:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                payload = msgpack.packb({"format": CACHE_FORMAT, "entries": entries}, use_bin_type=True)
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._dirty.update(_shard(key) for key in self._entries)
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def lookup_files(self, file_paths: List[str]) -> Tuple[Dict[str, FileSummary], List[str]]:
+        """
+        Hash each file and look it up.
+
+        Returns:
+            (summaries found in the cache by path, paths that must be analyzed)
+        """
+        found = {}
+        missing = []
+        for file_path in file_paths:
+            try:
+                with open(file_path, "rb") as f:
+                    digest = content_digest(f.read())
+            except OSError:
+                # Let the analyzer report the unreadable file
+                missing.append(file_path)
+                continue
+            summary = self.get(self.make_key(digest), file_path)
+            if summary is None:
+                missing.append(file_path)
+            else:
+                found[file_path] = summary
+        return found, missing
+
+    def store_summaries(self, summaries: List[FileSummary]) -> None:
+        for summary in summaries:
+            if summary.content_hash:
+                self.put(self.make_key(summary.content_hash), summary)
+
+
+_default_cache: Optional[SummaryCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_summary_cache() -> SummaryCache:
+    """Process-wide cache instance, loaded from disk on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SummaryCache()
+        return _default_cache
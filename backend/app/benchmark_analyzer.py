@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Benchmark the AST call-graph pipeline over the in-tree corpora.
+
+Each corpus is measured in a fresh process so that peak RSS belongs to that
+corpus alone. Phases (walk, read, parse, visit, resolve, serialize) are timed
+on a serial, instrumented run; "pipeline" times the production path
+(process pool, summary cache disabled) end to end.
+
+Usage:
+    python benchmark_analyzer.py run [--output results.json] [--repeat 3] [--jobs N] [corpus ...]
+    python benchmark_analyzer.py compare base.json new.json [--threshold 0.1]
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from analyzers.ast_analyzer import (
+    ANALYZER_VERSION,
+    FileSummary,
+    find_python_files,
+    resolve_call_graph,
+    summarize_tree,
+)
+from analyzers.parallel_analyzer import default_jobs, generate_call_graph_parallel, shutdown_executor
+from analyzers.serialization import dumps_json
+
+WORKSPACE_ROOT = Path(__file__).parent.parent.parent
+CORPORA = {
+    "poc": WORKSPACE_ROOT / "poc",
+    "face_classification": WORKSPACE_ROOT / "face_classification",
+    "study_1": WORKSPACE_ROOT / "study_1",
+    "scrapy": WORKSPACE_ROOT / "scrapy",
+}
+PHASES = ("walk", "read", "parse", "visit", "resolve", "serialize")
+DEFAULT_OUTPUT = Path(__file__).parent / "cache" / "benchmark_results.json"
+
+# Time differences below this are treated as noise when comparing runs
+MIN_DELTA_SECONDS = 0.005
+
+
+def measure_phases(project_path: str) -> dict:
+    """One serial run of the pipeline with every phase timed separately."""
+    timings = dict.fromkeys(PHASES, 0.0)
+
+    start = time.perf_counter()
+    file_paths = find_python_files(project_path)
+    timings["walk"] = time.perf_counter() - start
+
+    summaries = []
+    input_bytes = 0
+    for file_path in file_paths:
+        start = time.perf_counter()
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            content = data.decode('utf-8')
+        except Exception:
+            continue
+        timings["read"] += time.perf_counter() - start
+        input_bytes += len(data)
+
+        summary = FileSummary(
+            path=file_path,
+            module=os.path.splitext(os.path.basename(file_path))[0],
+            line_count=len(content.split('\n'))
+        )
+        start = time.perf_counter()
+        try:
+            tree = ast.parse(content)
+        except SyntaxError as e:
+            summary.error = str(e)
+            tree = None
+        timings["parse"] += time.perf_counter() - start
+
+        if tree is not None:
+            start = time.perf_counter()
+            summarize_tree(tree, summary)
+            timings["visit"] += time.perf_counter() - start
+        summaries.append(summary)
+
+    start = time.perf_counter()
+    call_graph = resolve_call_graph(summaries, project_path)
+    timings["resolve"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    output = dumps_json(call_graph)
+    timings["serialize"] = time.perf_counter() - start
+
+    return {
+        "files": len(file_paths),
+        "input_bytes": input_bytes,
+        "nodes": sum(len(graph["nodes"]) for graph in call_graph.values()),
+        "edges": sum(len(graph["edges"]) for graph in call_graph.values()),
+        "output_bytes": len(output),
+        "phases": timings,
+    }
+
+
+def measure_pipeline(project_path: str, jobs: int) -> float:
+    """Wall time of the production pipeline (process pool, no summary cache)."""
+    async def run():
+        start = time.perf_counter()
+        file_paths = find_python_files(project_path)
+        call_graph = await generate_call_graph_parallel(file_paths, project_path, jobs)
+        dumps_json(call_graph)
+        return time.perf_counter() - start
+
+    try:
+        return asyncio.run(run())
+    finally:
+        shutdown_executor()
+
+
+def measure_corpus(project_path: str, repeat: int, jobs: int) -> dict:
+    """Benchmark one corpus in the current process (median of repeat runs)."""
+    runs = [measure_phases(project_path) for _ in range(repeat)]
+    pipeline = [measure_pipeline(project_path, jobs) for _ in range(repeat)]
+
+    result = {key: runs[0][key] for key in ("files", "input_bytes", "nodes", "edges", "output_bytes")}
+    result["phases"] = {phase: statistics.median(run["phases"][phase] for run in runs) for phase in PHASES}
+    result["total_seconds"] = sum(result["phases"].values())
+    result["pipeline_seconds"] = statistics.median(pipeline)
+    result["files_per_second"] = result["files"] / result["total_seconds"] if result["total_seconds"] else 0.0
+    result["pipeline_files_per_second"] = (
+        result["files"] / result["pipeline_seconds"] if result["pipeline_seconds"] else 0.0
+    )
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["peak_rss_bytes"] = max_rss if sys.platform == "darwin" else max_rss * 1024
+    return result
+
+
+def run_benchmarks(corpora: list, repeat: int, jobs: int) -> dict:
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "analyzer_version": ANALYZER_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "jobs": jobs,
+        "repeat": repeat,
+        "corpora": {},
+    }
+    for name in corpora:
+        path = CORPORA[name]
+        if not path.exists():
+            print(f"Skipping {name}: {path} not found")
+            continue
+        # A fresh interpreter per corpus keeps peak RSS and warm caches separate
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            tmp_path = tmp.name
+        try:
+            subprocess.run(
+                [sys.executable, __file__, "_measure", str(path), tmp_path,
+                 "--repeat", str(repeat), "--jobs", str(jobs)],
+                check=True, stdout=subprocess.DEVNULL, cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            with open(tmp_path, encoding='utf-8') as f:
+                result = json.load(f)
+        finally:
+            os.remove(tmp_path)
+        results["corpora"][name] = result
+        print(f"{name:20s} {result['files']:5d} files  {result['total_seconds'] * 1000:9.1f} ms  "
+              f"{result['files_per_second']:8.0f} files/s  pipeline {result['pipeline_seconds'] * 1000:9.1f} ms  "
+              f"peak RSS {result['peak_rss_bytes'] / 2**20:7.1f} MiB  output {result['output_bytes']:9d} B")
+    return results
+
+
+def compare_results(base: dict, new: dict, threshold: float) -> list:
+    """
+    Compare two result files.
+
+    Returns:
+        Regression messages (empty if none): times, RSS or output size grown
+        by more than threshold, or throughput dropped by more than threshold
+    """
+    regressions = []
+
+    def check(corpus, metric, old, current, higher_is_worse=True, min_delta=0.0):
+        if not old:
+            return
+        change = (current - old) / old
+        worse = change > threshold if higher_is_worse else change < -threshold
+        if worse and abs(current - old) >= min_delta:
+            regressions.append(f"{corpus}: {metric} {old:.6g} -> {current:.6g} ({change:+.1%})")
+
+    for corpus, old in base.get("corpora", {}).items():
+        current = new.get("corpora", {}).get(corpus)
+        if current is None:
+            continue
+        for phase in PHASES:
+            check(corpus, f"phases.{phase}", old["phases"][phase], current["phases"][phase],
+                  min_delta=MIN_DELTA_SECONDS)
+        check(corpus, "total_seconds", old["total_seconds"], current["total_seconds"], min_delta=MIN_DELTA_SECONDS)
+        check(corpus, "pipeline_seconds", old["pipeline_seconds"], current["pipeline_seconds"],
+              min_delta=MIN_DELTA_SECONDS)
+        check(corpus, "files_per_second", old["files_per_second"], current["files_per_second"],
+              higher_is_worse=False)
+        check(corpus, "peak_rss_bytes", old["peak_rss_bytes"], current["peak_rss_bytes"])
+        check(corpus, "output_bytes", old["output_bytes"], current["output_bytes"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the AST call-graph analyzer")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Benchmark the corpora and write a results file")
+    run.add_argument("corpora", nargs="*", help=f"Corpora to run (default: {' '.join(CORPORA)})")
+    run.add_argument("--output", default=str(DEFAULT_OUTPUT))
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--jobs", type=int, default=default_jobs())
+
+    compare = commands.add_parser("compare", help="Flag regressions between two results files")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.1, help="Allowed relative change (default: 0.1)")
+
+    measure = commands.add_parser("_measure")  # internal: one corpus in this process
+    measure.add_argument("path")
+    measure.add_argument("output")
+    measure.add_argument("--repeat", type=int, default=3)
+    measure.add_argument("--jobs", type=int, default=default_jobs())
+
+    args = parser.parse_args()
+
+    if args.command == "_measure":
+        result = measure_corpus(args.path, max(1, args.repeat), max(1, args.jobs))
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f)
+        return
+
+    if args.command == "run":
+        unknown = [name for name in args.corpora if name not in CORPORA]
+        if unknown:
+            parser.error(f"unknown corpus: {', '.join(unknown)} (choose from {', '.join(CORPORA)})")
+        results = run_benchmarks(args.corpora or list(CORPORA), max(1, args.repeat), max(1, args.jobs))
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to: {args.output}")
+        return
+
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+    regressions = compare_results(base, new, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"No regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,23 @@
-from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, START, END
 from typing_extensions import TypedDict
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
+import asyncio
 import uuid
-import json
 import os
+import time
 from typing import AsyncGenerator
 from llm.constants import OPENAI_GPT_4_1
 from llm.prompt_util import *
 from llm.utils import *
+from metrics import observe_phase, span
+from llm.clients import get_chat_model
+from llm.context_retrieval import CONTEXT_TOKEN_BUDGET, GraphContext, get_retrieval_index
+from llm.highlight import FunctionMatcher
+from llm.prompt_budget import HEAD, MIDDLE, RECENT, REPO_TREE_TOKENS, PromptBuilder, fit_text
+from llm.result_cache import content_hash
+from llm.repo_tree import get_repo_tree
+from llm.scheduler import INTERACTIVE, get_llm_scheduler
 
 # 세션별 엔진/히스토리 저장소 (메모리 기반, 프로덕션에서는 Redis 등 외부 저장소 권장)
 session_store = {}
@@ -76,151 +84,209 @@ Call Graph 데이터 형식:
 
 답변은 영어로 작성하고, 찾은 함수들의 ID는 반드시 정확히 기재해주세요."""
 
-def load_call_graph_data():
+# Prompts are laid out for the provider's prompt cache: instructions and
+# project context that are the same on every turn come first (byte for
+# byte, per project and call graph version), then what changes, from the
+# least to the most volatile: history (which only grows), the functions
+# retrieved for the question, the selection, and the question itself.
+CHAT_PROMPT = """아래 INPUT 정보를 참고해서 충분히 고민한 후 사용자의 질문에 정확하고 간결하게 답변하세요.
+INPUT: 채팅 히스토리, 코드[Optional], 다이어그램[Optional], 질문"""
+
+GRAPH_PROMPT = """아래 Call Graph 데이터를 분석하여 사용자의 질문에 답변해주세요.
+사용자가 특정 함수에 대해 찾아달라고 요청하면, 해당 함수와 연결 된 모든 함수들을 찾아주세요.
+관련된 함수의 ID들을 정확히 식별해서 답변에 포함해주세요.
+질문과 관련된 함수들은 <related_call_graph_data>, <related_code>로 추가로 주어질 수 있습니다.
+
+OUTPUT:
+- 답변은 Markdown 형식으로 간결하고 명확하게 작성해주세요.
+- 사용자의 질문에 대한 답변은 영어로 작성해주세요.
+- 사용자가 이유를 묻거나 설명을 요청하지 않는다면, 관련된 함수들의 ID들만 정확하게 나열해주세요.
+
+INPUT:
+<directory_tree>
+{repo_tree}
+</directory_tree>
+
+<call_graph_data>
+{call_graph_json}
+</call_graph_data>
+
+<code>
+{code}
+</code>
+"""
+
+GRAPH_STREAM_PROMPT = """아래 Call Graph 데이터를 분석하여 사용자의 질문에 답변해주세요.
+사용자가 특정 함수에 대해 질문하면, 해당 함수와 관련된 모든 함수들을 찾아서 설명해주세요.
+관련된 함수의 ID들을 정확히 식별해서 답변에 포함해주세요.
+질문과 관련된 함수들은 <related_call_graph_data>, <related_code>로 추가로 주어질 수 있습니다.
+
+<directory_tree>
+{repo_tree}
+</directory_tree>
+
+<call_graph_data>
+{call_graph_json}
+</call_graph_data>
+
+<code>
+{code}
+</code>
+"""
+
+# Token budgets of the prompt sections, in order of importance (see llm.prompt_budget)
+QUERY_TOKENS = 16000  # the question and the context files attached to it
+CODE_TOKENS = 8000
+HISTORY_TOKENS = 4000
+DIAGRAM_TOKENS = 4000
+
+def create_turn_prompt(entry: str, query: str, history: list = None, code: str = None, diagram: str = None) -> PromptBuilder:
+    """
+    질문, 채팅 히스토리, 코드, 다이어그램 섹션의 토큰 예산을 담은 PromptBuilder를 생성하는 함수.
     """
-    Call Graph JSON 데이터를 로드하는 함수.
+    prompt = PromptBuilder(entry, OPENAI_GPT_4_1)
+    prompt.add("query", query, QUERY_TOKENS, MIDDLE)
+    prompt.add("code", code, CODE_TOKENS, MIDDLE)
+    prompt.add("history", history, HISTORY_TOKENS, RECENT)
+    prompt.add("diagram", diagram, DIAGRAM_TOKENS, HEAD)
+    return prompt
+
+def format_turn(sections: dict) -> str:
+    """
+    예산에 맞춘 섹션들 중 매 턴 바뀌는 부분을, 덜 바뀌는 것부터 순서대로 이어 붙이는 함수.
+    """
+    parts = []
+    if sections['history']:
+        parts.append(f"[채팅 히스토리]: {sections['history']}")
+    if sections.get('related_call_graph'):
+        parts.append(f"<related_call_graph_data>\n{sections['related_call_graph']}\n</related_call_graph_data>")
+    if sections.get('related_code'):
+        parts.append(f"<related_code>\n{sections['related_code']}\n</related_code>")
+    if sections['code']:
+        parts.append(f"<code>\n{sections['code']}\n</code>")
+    if sections['diagram']:
+        parts.append(f"<diagram>\n{sections['diagram']}\n</diagram>")
+    parts.append(f"[사용자 질문]: {sections['query']}")
+    return "\n\n".join(parts)
+
+def load_graph_context(target_path: str, query: str):
+    """
+    target_path 프로젝트의 가장 최근 Call Graph 인덱스와, 질문과 무관한 부분(static) 및 질문과 관련된 부분(related) GraphContext를 로드하는 함수.
     """
     try:
-        json_path = os.path.join(os.path.dirname(__file__), '..', 'artifacts', 'cg_json_output_all.json')
-        with open(json_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        index = get_retrieval_index(target_path)
+        if index is None:
+            print(f"Call Graph 데이터 없음: {target_path}")
+            return None, None, None
+        static = index.static_context()
+        related = index.select_context(query, CONTEXT_TOKEN_BUDGET - static.tokens, exclude=static)
+        return index, static, related
     except Exception as e:
         print(f"Call Graph 데이터 로드 실패: {e}")
-        return None
+        return None, None, None
 
-def process_chat_mode(state: ChatbotState, llm):
+def create_graph_prefix(template: str, static: GraphContext, repo_tree: str) -> str:
+    """
+    프로젝트와 Call Graph 버전이 같으면 바이트 단위로 동일한 프롬프트 앞부분을 생성하는 함수.
+    질문과 무관한 내용만 담아 같은 프로젝트의 다음 질문에서 prompt cache가 적용되도록 한다.
+    """
+    repo_tree, _ = fit_text(repo_tree, REPO_TREE_TOKENS, HEAD, model=OPENAI_GPT_4_1)
+    return template.format(repo_tree=repo_tree, call_graph_json=static.call_graph_json, code=static.code)
+
+def get_prompt_cache_key(prefix: str) -> str:
+    """
+    같은 앞부분을 가진 요청들이 같은 캐시로 라우팅되도록 OpenAI에 전달하는 키.
+    고정된 openai SDK 버전의 create()에는 이 인자가 없으므로 extra_body로 요청 본문에 넣어 보낸다.
+    """
+    return f"codediagram-{content_hash(prefix)[:32]}"
+
+def get_answer_text(response) -> str:
+    """
+    LLM 응답 메시지에서 답변 텍스트를 추출하는 함수.
+    """
+    return response.text() if hasattr(response, "text") else str(response)
+
+async def process_chat_mode(state: ChatbotState, llm):
     """
     일반 채팅 모드에서 LLM 호출 및 응답 처리를 담당하는 함수.
     """
-    human_prompt = """아래 INPUT 정보를 참고해서 충분히 고민한 후 사용자의 질문에 정확하고 간결하게 답변하세요.
-    INPUT: 질문, 채팅 히스토리, 코드[Optional], 다이어그램[Optional]"""
-    human_prompt += f"\n[질문]: {state['query']}"
-    
-    if state.get('history'):
-        human_prompt += f"\n[채팅 히스토리]: {state['history']}"
-    if state.get('code'):
-        human_prompt += f"\n<code>\n{state['code']}\n</code>\n"
-    if state.get('diagram'):
-        human_prompt += f"\n<diagram>\n{state['diagram']}\n</diagram>\n"
+    assembly_start = time.perf_counter()
+    prompt = create_turn_prompt("chat", state['query'], state.get('history'), state.get('code'), state.get('diagram'))
+    sections = prompt.fit(SYSTEM_PROMPT, CHAT_PROMPT)
+    human_prompt = CHAT_PROMPT + "\n\n" + format_turn(sections)
     
     system_message = SystemMessage(content=SYSTEM_PROMPT)
     human_message = HumanMessage(content=human_prompt)
     messages = [system_message] + [human_message]
+    observe_phase("prompt_assembly", time.perf_counter() - assembly_start)
     
-    response = llm.invoke(messages)
+    with span("llm_call"):
+        response = await get_llm_scheduler().run(
+            # 앞부분(SYSTEM_PROMPT + CHAT_PROMPT)이 캐시 최소 길이보다 짧아 prompt_cache_key를 보내지 않는다
+            lambda: llm.ainvoke(messages),
+            INTERACTIVE, prompt.estimate()
+        )
     
     # 응답 파싱
-    if hasattr(response, "content") and isinstance(response.content, list) and response.content and "text" in response.content[0]:
-        answer = response.content[0]["text"]
-    else:
-        answer = str(response)
+    prompt.record_usage(response.usage_metadata)
+    answer = get_answer_text(response)
     
     return answer
 
-def extract_function_ids_from_response(answer: str, call_graph_data: dict) -> list:
+def extract_function_ids_from_response(answer: str, matcher: FunctionMatcher) -> list:
     """
-    LLM 응답에서 함수 ID들을 추출하는 함수.
+    LLM 응답에서 언급된 함수 ID들을 관련도 순으로 추출하는 함수.
+    matcher는 Call Graph 버전마다 한 번 만들어지며(RetrievalIndex.matcher), 응답 길이에 비례하는 시간에 동작한다.
     """
-    if not call_graph_data:
+    if matcher is None or not answer:
         return []
-    
-    # 모든 함수 ID 수집
-    all_function_ids = set()
-    for file_path, file_data in call_graph_data.items():
-        for node in file_data.get('nodes', []):
-            all_function_ids.add(node['id'])
-    
-    # 응답에서 언급된 함수 ID들 찾기
-    mentioned_ids = []
-    for func_id in all_function_ids:
-        if func_id in answer:
-            mentioned_ids.append(func_id)
-    
-    # 함수명으로도 검색 (더 유연한 매칭)
-    for file_path, file_data in call_graph_data.items():
-        for node in file_data.get('nodes', []):
-            function_name = node['function_name']
-            if function_name in answer and node['id'] not in mentioned_ids:
-                mentioned_ids.append(node['id'])
-    
-    return mentioned_ids
+    return matcher.match(answer)
 
-def process_graph_mode(state: ChatbotState, llm):
+async def process_graph_mode(state: ChatbotState, llm):
     """
     그래프 검색 모드에서 Call Graph 분석 및 응답 처리를 담당하는 함수.
     """
-    # Call Graph 데이터 로드
-    call_graph_data = load_call_graph_data()
-    if not call_graph_data:
-        return "Call Graph 데이터를 로드할 수 없습니다. 일반 채팅 모드로 전환해주세요.", []
-    
     target_path = os.path.join(WORKSPACE_ROOT_DIR, state['target_path'])
     target_path = os.path.abspath(target_path)
-    # print(f"target_path: {target_path}")
-    
-    repo_tree = build_repo_tree(Path(target_path))
-    # print(f"repo_tree: {repo_tree}")
-    all_codes = get_all_source_files_with_line_numbers(target_path)
-    print(f"all_codes: {all_codes}")
-
-    # Call Graph 데이터를 프롬프트에 포함
-    human_prompt = """아래 Call Graph 데이터를 분석하여 사용자의 질문에 답변해주세요.
-사용자가 특정 함수에 대해 찾아달라고 요청하면, 해당 함수와 연결 된 모든 함수들을 찾아주세요.
-관련된 함수의 ID들을 정확히 식별해서 답변에 포함해주세요.
 
-INPUT:
-<call_graph_data>
-{call_graph_json}
-</call_graph_data>
-
-<directory_tree>
-{repo_tree}
-</directory_tree>
-
-<code>
-{all_codes}
-</code>
-
-[사용자 질문]: {query}
-
-OUTPUT:
-- 답변은 Markdown 형식으로 간결하고 명확하게 작성해주세요.
-- 사용자의 질문에 대한 답변은 영어로 작성해주세요.
-- 사용자가 이유를 묻거나 설명을 요청하지 않는다면, 관련된 함수들의 ID들만 정확하게 나열해주세요.
-""".format(
-        call_graph_json=json.dumps(call_graph_data, ensure_ascii=False, indent=2),
-        repo_tree=repo_tree,
-        all_codes=all_codes,
-        query=state['query']
-    )
+    assembly_start = time.perf_counter()
+    # Call Graph 중 질문(과 선택된 코드)에 관련된 함수들만 로드 (파일 I/O는 이벤트 루프 밖에서)
+    retrieval_query = "\n".join(filter(None, [state['query'], state.get('code')]))
+    index, static, related = await asyncio.to_thread(load_graph_context, target_path, retrieval_query)
+    if index is None:
+        return "Call Graph 데이터를 로드할 수 없습니다. 일반 채팅 모드로 전환해주세요.", []
     
-    print(f"human_prompt: {human_prompt}")
-
-    if state.get('history'):
-        human_prompt += f"\n[채팅 히스토리]: {state['history']}"
-    if state.get('code'):
-        human_prompt += f"\n<code>\n{state['code']}\n</code>\n"
-    if state.get('diagram'):
-        human_prompt += f"\n<diagram>\n{state['diagram']}\n</diagram>\n"
+    repo_tree = await asyncio.to_thread(get_repo_tree, target_path)
+
+    # 질문과 무관한 Call Graph 데이터가 앞에, 질문과 관련된 부분과 질문이 뒤에 오도록 구성
+    prefix = create_graph_prefix(GRAPH_PROMPT, static, repo_tree)
+    prompt = create_turn_prompt("graph_chat", state['query'], state.get('history'), state.get('code'), state.get('diagram'))
+    prompt.add("related_call_graph", related.call_graph_json)
+    prompt.add("related_code", related.code)
+    sections = prompt.fit(GRAPH_SYSTEM_PROMPT, prefix)
+    human_prompt = prefix + "\n" + format_turn(sections)
     
     system_message = SystemMessage(content=GRAPH_SYSTEM_PROMPT)
     human_message = HumanMessage(content=human_prompt)
     messages = [system_message] + [human_message]
+    observe_phase("prompt_assembly", time.perf_counter() - assembly_start)
     
-    response = llm.invoke(messages)
+    with span("llm_call"):
+        response = await get_llm_scheduler().run(
+            lambda: llm.ainvoke(messages, extra_body={"prompt_cache_key": get_prompt_cache_key(prefix)}),
+            INTERACTIVE, prompt.estimate()
+        )
     
     # 응답 파싱
-    if hasattr(response, "content") and isinstance(response.content, list) and response.content and "text" in response.content[0]:
-        answer = response.content[0]["text"]
-    else:
-        answer = str(response)
+    prompt.record_usage(response.usage_metadata)
+    answer = get_answer_text(response)
     
     # 응답에서 관련 함수 ID들 추출
-    highlighted_function_ids = extract_function_ids_from_response(answer, call_graph_data)
+    highlighted_function_ids = extract_function_ids_from_response(answer, index.matcher)
     
     return answer, highlighted_function_ids
 
-def llm_node(state: ChatbotState, llm):
+async def llm_node(state: ChatbotState, llm):
     """
     LLM을 호출해 답변을 생성하는 LangGraph 노드 함수.
     """
@@ -228,11 +294,11 @@ def llm_node(state: ChatbotState, llm):
     
     if graph_mode:
         # 그래프 검색 모드
-        answer, highlight_list = process_graph_mode(state, llm)
+        answer, highlight_list = await process_graph_mode(state, llm)
         state['highlight'] = highlight_list
     else:
         # 일반적인 LLM 대화 모드
-        answer = process_chat_mode(state, llm)
+        answer = await process_chat_mode(state, llm)
         state['highlight'] = []
     
     # 상태 업데이트
@@ -248,21 +314,35 @@ def llm_node(state: ChatbotState, llm):
 
 class LangGraphChatbotEngine:
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model=OPENAI_GPT_4_1,
+        self.graph = StateGraph(ChatbotState)
+
+        async def run_llm_node(state: ChatbotState):
+            return await llm_node(state, self.llm)
+
+        self.graph.add_node("llm", run_llm_node)
+        self.graph.add_edge(START, "llm")
+        self.graph.add_edge("llm", END)
+        self.app = self.graph.compile()
+
+    # Models come from the shared registry at call time, so sessions do not
+    # hold clients (or connection pools) of their own
+    @property
+    def llm(self):
+        return get_chat_model(
+            OPENAI_GPT_4_1,
             use_responses_api=True,
             temperature=0.1,
+            max_retries=0,  # retried by the scheduler
         )
-        self.streaming_llm = ChatOpenAI(
-            model=OPENAI_GPT_4_1,
+
+    @property
+    def streaming_llm(self):
+        return get_chat_model(
+            OPENAI_GPT_4_1,
             temperature=0.1,
-            streaming=True
+            streaming=True,
+            stream_usage=True  # usage (with cached prompt tokens) in the last chunk
         )
-        self.graph = StateGraph(ChatbotState)
-        self.graph.add_node("llm", lambda state: llm_node(state, self.llm))
-        self.graph.add_edge(START, "llm")
-        self.graph.add_edge("llm", END)
-        self.app = self.graph.compile()
 
     async def ask(self, query: str, graph_mode: bool, target_path: str, code: str = None, diagram: str = None, history: list = None):
         state: ChatbotState = {
@@ -283,66 +363,51 @@ class LangGraphChatbotEngine:
         스트리밍 방식으로 챗봇 답변을 생성합니다.
         """
         # 기본 프롬프트 생성
+        assembly_start = time.perf_counter()
         if graph_mode:
             # 그래프 검색 모드
-            call_graph_data = load_call_graph_data()
-            if not call_graph_data:
-                yield "Call Graph 데이터를 로드할 수 없습니다. 일반 채팅 모드로 전환해주세요."
-                return
-            
             target_path_abs = os.path.join(WORKSPACE_ROOT_DIR, target_path)
             target_path_abs = os.path.abspath(target_path_abs)
-            
-            repo_tree = build_repo_tree(Path(target_path_abs))
-            all_codes = get_all_source_files_with_line_numbers(target_path_abs)
 
-            human_prompt = """아래 Call Graph 데이터를 분석하여 사용자의 질문에 답변해주세요.
-사용자가 특정 함수에 대해 질문하면, 해당 함수와 관련된 모든 함수들을 찾아서 설명해주세요.
-관련된 함수의 ID들을 정확히 식별해서 답변에 포함해주세요.
-
-<call_graph_data>
-{call_graph_json}
-</call_graph_data>
-
-<directory_tree>
-{repo_tree}
-</directory_tree>
-
-<code>
-{all_codes}
-</code>
-
-[사용자 질문]: {query}
-""".format(
-                call_graph_json=json.dumps(call_graph_data, ensure_ascii=False, indent=2),
-                repo_tree=repo_tree,
-                all_codes=all_codes,
-                query=query
-            )
+            retrieval_query = "\n".join(filter(None, [query, code]))
+            index, static, related = await asyncio.to_thread(load_graph_context, target_path_abs, retrieval_query)
+            if index is None:
+                yield "Call Graph 데이터를 로드할 수 없습니다. 일반 채팅 모드로 전환해주세요."
+                return
+            
+            repo_tree = await asyncio.to_thread(get_repo_tree, target_path_abs)
+
+            prefix = create_graph_prefix(GRAPH_STREAM_PROMPT, static, repo_tree)
+            prompt = create_turn_prompt("graph_chat_stream", query, history, code, diagram)
+            prompt.add("related_call_graph", related.call_graph_json)
+            prompt.add("related_code", related.code)
+            sections = prompt.fit(GRAPH_SYSTEM_PROMPT, prefix)
+            human_prompt = prefix + "\n" + format_turn(sections)
             
             system_message = SystemMessage(content=GRAPH_SYSTEM_PROMPT)
         else:
             # 일반 채팅 모드
-            human_prompt = """아래 INPUT 정보를 참고해서 충분히 고민한 후 사용자의 질문에 정확하고 간결하게 답변하세요.
-INPUT: 질문, 채팅 히스토리, 코드[Optional], 다이어그램[Optional]"""
-            human_prompt += f"\n[질문]: {query}"
+            prefix = CHAT_PROMPT
+            prompt = create_turn_prompt("chat_stream", query, history, code, diagram)
+            sections = prompt.fit(SYSTEM_PROMPT, CHAT_PROMPT)
+            human_prompt = CHAT_PROMPT + "\n\n" + format_turn(sections)
             
             system_message = SystemMessage(content=SYSTEM_PROMPT)
         
-        if history:
-            human_prompt += f"\n[채팅 히스토리]: {history}"
-        if code:
-            human_prompt += f"\n<code>\n{code}\n</code>\n"
-        if diagram:
-            human_prompt += f"\n<diagram>\n{diagram}\n</diagram>\n"
-        
         human_message = HumanMessage(content=human_prompt)
         messages = [system_message, human_message]
+        observe_phase("prompt_assembly", time.perf_counter() - assembly_start)
         
-        # 스트리밍 응답 생성
-        async for chunk in self.streaming_llm.astream(messages):
-            if chunk.content:
-                yield chunk.content
+        # 스트리밍 응답 생성 (대화형 우선순위로 스케줄러 슬롯 점유)
+        usage = None
+        async with get_llm_scheduler().slot(INTERACTIVE, prompt.estimate()):
+            with span("llm_stream"):
+                async for chunk in self.streaming_llm.astream(messages, extra_body={"prompt_cache_key": get_prompt_cache_key(prefix)}):
+                    if chunk.usage_metadata:
+                        usage = chunk.usage_metadata
+                    if chunk.content:
+                        yield chunk.content
+        prompt.record_usage(usage)
 
 async def generate_chatbot_answer_with_session(session_id: str, graph_mode: bool, target_path: str, query: str, code: str = None, diagram: str = None):
     """
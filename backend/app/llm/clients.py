@@ -0,0 +1,177 @@
+"""
+Process-wide registry of LLM clients.
+
+Each ChatOpenAI builds its own openai client and with it its own HTTP
+connection pool, so a model created per call or per chat session pays a
+new TCP and TLS handshake for every request. get_chat_model returns one
+shared ChatOpenAI per model and options instead, all of them on a single
+keep-alive pool per event loop (httpx connections cannot move between
+loops). The pool is sized for the scheduler's concurrency plus streams,
+and its connections and requests are exported through metrics
+(/api/metrics).
+"""
+
+import asyncio
+import json
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+import openai
+from langchain_openai import ChatOpenAI
+
+from llm.scheduler import MAX_CONCURRENCY
+from metrics import (
+    LLM_HTTP_CONNECTIONS,
+    LLM_HTTP_CONNECTIONS_OPENED,
+    LLM_HTTP_IN_FLIGHT,
+    LLM_HTTP_POOL_UTILIZATION,
+    LLM_HTTP_REQUESTS,
+)
+
+# Scheduler slots plus a few for requests that bypass it
+MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", str(MAX_CONCURRENCY + 4)))
+# How long idle connections stay open (httpx's default is 5 seconds)
+KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "60"))
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body that reports when it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[], None]):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class _TrackedTransport(httpx.AsyncHTTPTransport):
+    """Pooled transport that counts requests in flight and connections opened."""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self._seen = weakref.WeakSet()
+        _transports.add(self)
+
+    def connection_counts(self) -> Tuple[int, int]:
+        """(active, idle) connections in the pool."""
+        active = idle = 0
+        for connection in self._pool.connections:
+            if connection.is_idle():
+                idle += 1
+            elif not connection.is_closed():
+                active += 1
+        return active, idle
+
+    def _finished(self) -> None:
+        self.in_flight -= 1
+        _update_gauges()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        LLM_HTTP_REQUESTS.inc()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self._finished()
+            raise
+        for connection in self._pool.connections:
+            if connection not in self._seen:
+                self._seen.add(connection)
+                LLM_HTTP_CONNECTIONS_OPENED.inc()
+        _update_gauges()
+        # The request holds its connection until the body is read or closed
+        response.stream = _TrackedStream(response.stream, self._finished)
+        return response
+
+
+_transports: "weakref.WeakSet[_TrackedTransport]" = weakref.WeakSet()
+
+
+def pool_stats() -> Dict[str, int]:
+    transports = list(_transports)
+    active = idle = 0
+    for transport in transports:
+        transport_active, transport_idle = transport.connection_counts()
+        active += transport_active
+        idle += transport_idle
+    return {
+        "pools": len(transports),
+        "max_connections": MAX_CONNECTIONS * len(transports),
+        "active": active,
+        "idle": idle,
+        "in_flight": sum(transport.in_flight for transport in transports),
+    }
+
+
+def _update_gauges() -> None:
+    stats = pool_stats()
+    LLM_HTTP_CONNECTIONS.set(stats["active"], "active")
+    LLM_HTTP_CONNECTIONS.set(stats["idle"], "idle")
+    LLM_HTTP_IN_FLIGHT.set(stats["in_flight"])
+    LLM_HTTP_POOL_UTILIZATION.set(stats["active"] / stats["max_connections"] if stats["max_connections"] else 0.0)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+_lock = threading.Lock()
+# event loop -> (its HTTP client, {options key: ChatOpenAI})
+_loop_clients: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, Dict[str, ChatOpenAI]]] = {}
+_sync_client: Optional[httpx.Client] = None
+
+
+def _shared_sync_client() -> httpx.Client:
+    """Pool for synchronous invoke() calls; httpx.Client is thread-safe."""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = openai.DefaultHttpxClient(limits=_limits())
+    return _sync_client
+
+
+def get_chat_model(model: str, **options: Any) -> ChatOpenAI:
+    """
+    Shared ChatOpenAI for model and options (temperature, streaming,
+    max_retries, model_kwargs, ...) on the running event loop's pool.
+    Outside a running loop the instance is not cached.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _lock:
+        http_client = _shared_sync_client()
+        if loop is None:
+            return ChatOpenAI(model=model, http_client=http_client, **options)
+        for closed_loop in [other for other in _loop_clients if other.is_closed()]:
+            del _loop_clients[closed_loop]
+        entry = _loop_clients.get(loop)
+        if entry is None:
+            http_async_client = openai.DefaultAsyncHttpxClient(transport=_TrackedTransport(limits=_limits()))
+            entry = _loop_clients[loop] = (http_async_client, {})
+        http_async_client, models = entry
+        key = json.dumps([model, options], sort_keys=True, default=str)
+        chat_model = models.get(key)
+        if chat_model is None:
+            chat_model = models[key] = ChatOpenAI(
+                model=model, http_client=http_client, http_async_client=http_async_client, **options
+            )
+        return chat_model
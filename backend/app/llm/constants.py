@@ -4,9 +4,15 @@ OPENAI_O3 = "o3-2025-04-16"
 OPENAI_O4_MINI = "o4-mini-2025-04-16"
 OPENAI_GPT_4_1 = "gpt-4.1-2025-04-14"
 OPENAI_GPT_4_1_MINI = "gpt-4.1-mini-2025-04-14"
+# Context window (prompt + completion tokens) per model
+MODEL_CONTEXT_TOKENS = {
+    OPENAI_O3: 200_000,
+    OPENAI_O4_MINI: 200_000,
+    OPENAI_GPT_4_1: 1_047_576,
+    OPENAI_GPT_4_1_MINI: 1_047_576,
+}
 BACKEND_ROOT_DIR = os.getcwd()
 WORKSPACE_ROOT_DIR = os.path.join(BACKEND_ROOT_DIR, "..", "..")
 ARTIFACTS_REPO_PROMPT_TXT = os.path.join(BACKEND_ROOT_DIR, "artifacts", "repo_prompt.txt")
-CG_JSON_OUTPUT = os.path.join(BACKEND_ROOT_DIR, "artifacts", "cg_json_output_all.json")
 
 SAMPLE_CFG_JSON = os.path.join(BACKEND_ROOT_DIR, "artifacts", "cfg_main.py_func_main.json")
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+Retrieval of the call graph context for graph-mode chat.
+
+Graph-mode prompts used to carry the whole call graph, the source of every
+file and the repo tree, which overflows the context window on anything but
+small projects. RetrievalIndex is built once per stored call graph and
+holds a lexical index over each function's name, id, description,
+docstring and the identifiers of its body. A question is answered with:
+
+1. seeds: functions whose name or id the question mentions, plus the best
+   lexical matches;
+2. expansion: callers and callees of the seeds, a few hops out, with a
+   score that decays per hop;
+3. packing: functions in score order (then by number of calls) with their
+   numbered code, and the call edges between them, until the token budget
+   is spent. Functions whose code no longer fits are listed without it.
+
+On small projects everything fits, so the prompt holds the whole graph as
+before. Part of the budget goes to static_context(), the most connected
+functions regardless of the question, which stays the same for every
+turn on a graph version and so can be served from the provider's prompt
+cache; select_context() then adds what the question needs on top of it.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from analyzers.artifact_store import get_artifact_store, normalize_project_path
+from llm.constants import OPENAI_GPT_4_1
+from llm.highlight import FunctionMatcher
+from llm.tokens import count_tokens
+from metrics import record_cache, span
+
+# Tokens of call graph and code put in a graph-mode prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("GRAPH_CHAT_CONTEXT_TOKENS", "12000"))
+# Share of it spent on the question-independent part (see static_context)
+STATIC_TOKEN_BUDGET = int(os.getenv("GRAPH_CHAT_STATIC_TOKENS", "6000"))
+# Best lexical matches used as seeds besides the functions named in the question
+SEED_COUNT = 8
+# Call hops explored from the seeds, and the share of the score kept per hop
+EXPANSION_HOPS = 2
+HOP_DECAY = 0.5
+# Score of a function the question names outright
+SYMBOL_SCORE = 10.0
+# Code lines sent per function
+MAX_FUNCTION_LINES = 80
+
+# Weight of a term by where it occurs in a function
+NAME_WEIGHT = 3.0
+ID_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.5
+BODY_WEIGHT = 1.0
+
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_DOTTED_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)+")
+_SUBWORD = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+_DOCSTRING = re.compile(r'^\s*[rRbBuU]?("""|\'\'\')(.*?)\1', re.S)
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i if in into is it its me my of on or our self
+that the their them then there these this to was we what when where which who why will with you your
+def class return none true false not else elif import pass cls args kwargs
+function functions method methods call calls called code file find show explain
+""".split())
+
+
+def _terms(text: str) -> List[str]:
+    """Lower-cased identifiers and their snake_case/CamelCase parts, without stopwords."""
+    terms = []
+    for identifier in _IDENTIFIER.findall(text):
+        lowered = identifier.lower()
+        if lowered not in STOPWORDS and len(lowered) > 1:
+            terms.append(lowered)
+        parts = _SUBWORD.findall(identifier)
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts if part.lower() not in STOPWORDS and len(part) > 1)
+    return terms
+
+
+class GraphContext(NamedTuple):
+    call_graph_json: str  # {"nodes": [...], "edges": [...]} of the selected functions
+    code: str             # their numbered code, one block per function
+    node_ids: List[str]   # in rank order
+    code_ids: List[str]   # functions whose code is included
+    tokens: int
+
+
+class RetrievalIndex:
+    """Lexical index and call adjacency of one stored call graph."""
+
+    def __init__(self, call_graph: Dict[str, Dict], project_path: str):
+        self.call_graph = call_graph
+        self.nodes: Dict[str, Dict] = {}
+        self.edges: List[Dict] = []
+        self.adjacent: Dict[str, List[Tuple[str, int]]] = defaultdict(list)  # id -> (neighbor, edge number)
+        # term -> {node id: weighted occurrences}
+        self.postings: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        # lower-cased names and ids a question may use -> node ids
+        self.symbols: Dict[str, List[str]] = defaultdict(list)
+        # node id -> (code block, its tokens)
+        self.blocks: Dict[str, Tuple[str, int]] = {}
+        # budget -> static_context()
+        self._static: Dict[int, GraphContext] = {}
+        self._matcher: Optional[FunctionMatcher] = None
+
+        with span("retrieval_index"):
+            for file_key, graph in call_graph.items():
+                nodes = [node for node in graph.get("nodes", []) if node.get("id")]
+                for node in nodes:
+                    self.nodes[node["id"]] = node
+                lines = self._read_lines(file_key, nodes, project_path)
+                for node in nodes:
+                    self._index_node(node, nodes, lines)
+            for graph in call_graph.values():
+                for edge in graph.get("edges", []):
+                    source, target = edge.get("source"), edge.get("target")
+                    if source is None or target is None:
+                        continue
+                    number = len(self.edges)
+                    self.edges.append(edge)
+                    self.adjacent[source].append((target, number))
+                    self.adjacent[target].append((source, number))
+            self.degree = {node_id: len(self.adjacent.get(node_id, ())) for node_id in self.nodes}
+            self.node_tokens = {
+                node_id: count_tokens(json.dumps(node, ensure_ascii=False), OPENAI_GPT_4_1)
+                for node_id, node in self.nodes.items()
+            }
+
+    @staticmethod
+    def _read_lines(file_key: str, nodes: List[Dict], project_path: str) -> List[str]:
+        candidates = [file_key]
+        if nodes and nodes[0].get("file"):
+            candidates.append(os.path.join(project_path, nodes[0]["file"]))
+        for path in candidates:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    return f.read().splitlines()
+            except (OSError, UnicodeDecodeError):
+                continue
+        return []
+
+    def _index_node(self, node: Dict, file_nodes: List[Dict], lines: List[str]) -> None:
+        node_id = node["id"]
+        name = str(node.get("function_name") or node_id.rsplit(".", 1)[-1])
+        for symbol in {node_id.lower(), name.lower(), name.rsplit(".", 1)[-1].lower()}:
+            self.symbols[symbol].append(node_id)
+
+        def add(text: str, weight: float) -> None:
+            for term in _terms(text):
+                self.postings[term][node_id] += weight
+
+        add(name, NAME_WEIGHT)
+        add(node_id, ID_WEIGHT)
+        add(str(node.get("description") or ""), DESCRIPTION_WEIGHT)
+
+        start, end = node.get("line_start"), node.get("line_end")
+        if not lines or not isinstance(start, int) or not isinstance(end, int) or start < 1:
+            return
+        # The block stops where the next node of the file (a method, a nested def) starts
+        block_end = min(
+            [other["line_start"] for other in file_nodes
+             if isinstance(other.get("line_start"), int) and start < other["line_start"] <= end] + [end + 1]
+        ) - 1
+        block_end = min(block_end, start + MAX_FUNCTION_LINES - 1, len(lines))
+        body = "\n".join(lines[start - 1:block_end])
+        docstring = _DOCSTRING.search("\n".join(lines[start:block_end]))
+        if docstring:
+            add(docstring.group(2), DESCRIPTION_WEIGHT)
+        add(body, BODY_WEIGHT)
+        numbered = "\n".join(f"{number:4}: {lines[number - 1]}" for number in range(start, block_end + 1))
+        if block_end < min(end, len(lines)):
+            numbered += "\n    ..."
+        block = f"### {node_id} ({node.get('file')}:{start}-{end})\n{numbered}"
+        self.blocks[node_id] = (block, count_tokens(block, OPENAI_GPT_4_1))
+
+    def rank(self, query: str) -> Dict[str, float]:
+        """Scores of the functions relevant to a question (seeds and their neighbors)."""
+        count = len(self.nodes) or 1
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(_terms(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + count / len(postings))
+            for node_id, weight in postings.items():
+                scores[node_id] += idf * weight / (weight + 1.0)
+        named = set()
+        for symbol in _DOTTED_IDENTIFIER.findall(query) + _IDENTIFIER.findall(query):
+            for node_id in self.symbols.get(symbol.lower(), ()):
+                named.add(node_id)
+        for node_id in named:
+            scores[node_id] += SYMBOL_SCORE
+
+        seeds = named | set(sorted(scores, key=scores.get, reverse=True)[:SEED_COUNT])
+        ranked = dict(scores)
+        frontier = {node_id: scores[node_id] for node_id in seeds}
+        for _ in range(EXPANSION_HOPS):
+            reached: Dict[str, float] = {}
+            for node_id, score in frontier.items():
+                for neighbor, _ in self.adjacent.get(node_id, ()):
+                    if neighbor in self.nodes:
+                        reached[neighbor] = max(reached.get(neighbor, 0.0), score * HOP_DECAY)
+            frontier = {}
+            for node_id, score in reached.items():
+                if score > ranked.get(node_id, 0.0):
+                    ranked[node_id] = score
+                    frontier[node_id] = score
+        return ranked
+
+    def _pack(self, order: List[str], scores: Dict[str, float], budget: int,
+              placed: Dict[str, bool]) -> GraphContext:
+        """Functions of order, with their code and new call edges, within budget tokens."""
+        selected: Dict[str, bool] = {}  # node id -> code included
+        coded: List[str] = []  # functions placed before whose code is added now
+        edge_numbers: List[int] = []
+        used = 0
+        for node_id in order:
+            if node_id in placed:
+                block = self.blocks.get(node_id)
+                if not placed[node_id] and block is not None and scores.get(node_id, 0.0) > 0.0 \
+                        and used + block[1] <= budget:
+                    coded.append(node_id)
+                    used += block[1]
+                continue
+            new_edges = [
+                number for neighbor, number in self.adjacent.get(node_id, ())
+                if neighbor in selected or neighbor in placed or neighbor not in self.nodes or neighbor == node_id
+            ]
+            cost = self.node_tokens[node_id] + 12 * len(new_edges)
+            if used + cost > budget:
+                if scores.get(node_id, 0.0) <= 0.0:
+                    break
+                continue
+            block = self.blocks.get(node_id)
+            with_code = block is not None and used + cost + block[1] <= budget
+            selected[node_id] = with_code
+            if with_code:
+                coded.append(node_id)
+            edge_numbers.extend(new_edges)
+            used += cost + (block[1] if with_code else 0)
+
+        if not selected and not coded:
+            return GraphContext("", "", [], [], 0)
+        edges = [self.edges[number] for number in dict.fromkeys(edge_numbers)]
+        call_graph_json = json.dumps(
+            {"nodes": [self.nodes[node_id] for node_id in selected], "edges": edges},
+            ensure_ascii=False,
+        ) if selected else ""
+        code = "\n\n".join(self.blocks[node_id][0] for node_id in coded)
+        return GraphContext(call_graph_json, code, list(selected), coded, used)
+
+    @property
+    def matcher(self) -> FunctionMatcher:
+        """Matcher of this graph's function ids and names in chat answers (built on first use)."""
+        if self._matcher is None:
+            with span("highlight_index"):
+                self._matcher = FunctionMatcher(self.nodes.values())
+        return self._matcher
+
+    def static_context(self, budget: int = STATIC_TOKEN_BUDGET) -> GraphContext:
+        """
+        The most connected functions within budget tokens, independent of any
+        question: byte-identical for every turn on this graph, so it can lead
+        the prompt and be served from the provider's prompt cache.
+        """
+        context = self._static.get(budget)
+        if context is None:
+            with span("retrieval"):
+                order = sorted(self.nodes, key=lambda node_id: -self.degree[node_id])
+                context = self._static[budget] = self._pack(order, {}, budget, {})
+        return context
+
+    def select_context(self, query: str, budget: int = CONTEXT_TOKEN_BUDGET,
+                       exclude: Optional[GraphContext] = None) -> GraphContext:
+        """
+        Pack the functions most relevant to query, their code and the calls
+        between them into at most budget tokens; the remaining budget goes to
+        the most connected other functions.
+
+        Args:
+            exclude: Context already in the prompt (static_context()); its
+                functions are left out, except for code it had no room for
+        """
+        with span("retrieval"):
+            scores = self.rank(query)
+            order = sorted(self.nodes, key=lambda node_id: (-scores.get(node_id, 0.0), -self.degree[node_id]))
+            placed: Dict[str, bool] = {}
+            if exclude is not None:
+                code_ids = set(exclude.code_ids)
+                placed = {node_id: node_id in code_ids for node_id in exclude.node_ids}
+            return self._pack(order, scores, budget, placed)
+
+
+# Index per project, rebuilt when the project's latest call graph changes
+_indexes: Dict[str, Tuple[Tuple[Optional[str], Optional[int]], RetrievalIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_retrieval_index(project_path: str) -> Optional[RetrievalIndex]:
+    """
+    Retrieval index of the project's most recent call graph (of any kind),
+    or None if the project has no stored graph.
+    """
+    store = get_artifact_store()
+    key = store.latest(project_path)
+    version = (key, store.stamp(key))
+    project = normalize_project_path(project_path)
+    with _indexes_lock:
+        entry = _indexes.get(project)
+    if entry is not None and entry[0] == version:
+        record_cache("retrieval_index", True)
+        return entry[1]
+    data = store.read(key) if version[1] is not None else None
+    if data is None:
+        return None
+    record_cache("retrieval_index", False)
+    index = RetrievalIndex(orjson.loads(data), project_path)
+    with _indexes_lock:
+        _indexes[project] = (version, index)
+    return index
@@ -3,8 +3,11 @@ import inspect
 import traceback
 import os
 import asyncio
+import ast
+import posixpath
+import textwrap
+from collections import Counter
 from fastapi import HTTPException
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
 from llm.prompt_util import *
 from llm.utils import (
@@ -14,15 +17,38 @@ from llm.utils import (
     extract_json_from_response,
     save_json_and_return_str,
 )
-from typing import Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import json
+from metrics import HYBRID_NODES, LLM_CALL_GRAPH_BATCHED_FILES, LLM_CALL_GRAPH_BATCHES, span, timed
 from llm.constants import (
     OPENAI_O4_MINI,
     OPENAI_GPT_4_1,
+    OPENAI_GPT_4_1_MINI,
     BACKEND_ROOT_DIR,
-    CG_JSON_OUTPUT,
     WORKSPACE_ROOT_DIR
 )
+from analyzers.artifact_store import HYBRID, LLM, ArtifactStore, get_artifact_store
+from analyzers.ast_analyzer import build_project_call_graph
+from analyzers.serialization import dumps_json
+from llm.clients import get_chat_model
+from llm.prompt_budget import HEAD, OUTLINE, REPO_TREE_TOKENS, PromptBuilder
+from llm.repo_tree import get_repo_tree
+from llm.result_cache import LLMResultCache, content_hash, make_key
+from llm.scheduler import BULK, DEFAULT_COMPLETION_TOKENS, INTERACTIVE, estimate_tokens, get_llm_scheduler
+from llm.tokens import count_tokens
+
+# Bump when prompts or post-processing change what a stored LLM call graph contains
+LLM_CALL_GRAPH_VERSION = "1"
+
+# Bump when the hybrid prompt or merging change what a stored hybrid graph contains
+HYBRID_CALL_GRAPH_VERSION = "1"
+
+# Files whose numbered code is at most this many tokens share requests
+BATCH_SMALL_FILE_TOKENS = int(os.getenv("LLM_BATCH_SMALL_FILE_TOKENS", "1500"))
+# Code tokens per batched request; the repo tree and instructions come on top
+BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "12000"))
+# Bounds the size of the combined answer
+BATCH_MAX_FILES = int(os.getenv("LLM_BATCH_MAX_FILES", "20"))
 
 reasoning_high = {
     "effort": "high",  # 'low', 'medium', or 'high'
@@ -42,12 +68,28 @@ reasoning_low = {
     # "summary": "None",  # 'detailed', 'auto', or None
 }
 
-def create_messages(root_path: str, file_path: str):
+# Per-file call graphs, reused while the file, repo tree, prompt and model are unchanged
+call_graph_cache = LLMResultCache("llm_call_graphs")
+# The template and the example it embeds are fixed for the life of the process
+PROMPT_CODE_TO_CG_HASH = content_hash(PROMPT_CODE_TO_CG + json.dumps(DIAGRAM_EXAMPLE))
+PROMPT_CODE_TO_CG_BATCH_HASH = content_hash(PROMPT_CODE_TO_CG_BATCH + json.dumps(DIAGRAM_EXAMPLE))
+CALL_GRAPH_MODEL_ID = f"{OPENAI_O4_MINI}:reasoning={reasoning_low['effort']}"
+
+# Hybrid mode: descriptions of nodes without a docstring, reused while the code sent is unchanged
+description_cache = LLMResultCache("llm_node_descriptions")
+PROMPT_NODE_DESCRIPTIONS_HASH = content_hash(PROMPT_NODE_DESCRIPTIONS)
+DESCRIPTION_MODEL_ID = f"{OPENAI_GPT_4_1_MINI}:temperature=0.0"
+# One sentence per node
+DESCRIPTION_COMPLETION_TOKENS = 48
+# Lines of a function body sent for its description
+HYBRID_MAX_BODY_LINES = 40
+
+@timed("prompt_assembly")
+def create_messages(root_path: str, file_path: str, repo_tree: Optional[str] = None):
 
     print(f"Creating messages for root_path: {root_path}, file_path: {file_path}")
-    # Convert str to Path
-    root_dir = Path(root_path)
-    repo_tree = build_repo_tree(root_dir)
+    if repo_tree is None:
+        repo_tree = get_repo_tree(root_path)
     print(f"Repo tree: {repo_tree}")
 
     code_from_file = get_codes_from_file(file_path)
@@ -57,84 +99,497 @@ def create_messages(root_path: str, file_path: str):
         [HumanMessagePromptTemplate.from_template(PROMPT_CODE_TO_CG),]
         )  
     
+    diagram_example = json.dumps(DIAGRAM_EXAMPLE)
+    prompt = PromptBuilder("call_graph_file", OPENAI_O4_MINI)
+    prompt.add("code_from_file", code_from_file, policy=OUTLINE)
+    prompt.add("repo_tree", repo_tree, REPO_TREE_TOKENS, HEAD)
+    sections = prompt.fit(PROMPT_CODE_TO_CG, diagram_example)
+    messages = chat_prompt.format_messages(
+        repo_tree=sections["repo_tree"],
+        code_from_file=sections["code_from_file"], 
+        diagram_example=diagram_example
+        )
+    return messages
+
+
+@timed("prompt_assembly")
+def create_batch_messages(repo_tree: str, codes_from_files: List[str]):
+    """One prompt for several files; each code block is headed by the file's path from the root."""
+    chat_prompt = ChatPromptTemplate.from_messages(
+        [HumanMessagePromptTemplate.from_template(PROMPT_CODE_TO_CG_BATCH),]
+        )
+
+    diagram_example = json.dumps(DIAGRAM_EXAMPLE)
+    # Batches are packed within BATCH_TOKEN_BUDGET, so the code is only cut past the prompt limit
+    prompt = PromptBuilder("call_graph_batch", OPENAI_O4_MINI)
+    prompt.add("code_from_files", "\n".join(codes_from_files))
+    prompt.add("repo_tree", repo_tree, REPO_TREE_TOKENS, HEAD)
+    sections = prompt.fit(PROMPT_CODE_TO_CG_BATCH, diagram_example)
     messages = chat_prompt.format_messages(
-        repo_tree=repo_tree,
-        code_from_file=code_from_file, 
-        diagram_example=json.dumps(DIAGRAM_EXAMPLE)
+        repo_tree=sections["repo_tree"],
+        code_from_files=sections["code_from_files"],
+        diagram_example=diagram_example
         )
     return messages
 
 
-async def generate_call_graphs_for_directory(root_path: str, file_type: Optional[str]):
+class BatchFile(NamedTuple):
+    file_path: str
+    label: str  # path from the root, as written in the prompt and expected in the answer
+    code: str
+    tokens: int
+    cache_key: str
+
+
+def _call_graph_cache_key(file_hash: str, repo_tree_hash: str, prompt_hash: str, **extra: str) -> str:
+    return make_key(file=file_hash, repo_tree=repo_tree_hash, prompt=prompt_hash, model=CALL_GRAPH_MODEL_ID, **extra)
+
+
+async def _request_call_graph(messages, completion_tokens: int = DEFAULT_COMPLETION_TOKENS):
+    """Send a call graph prompt on the bulk lane and parse the JSON answer."""
+    llm = get_chat_model(
+        OPENAI_O4_MINI,
+        use_responses_api=True,
+        model_kwargs={"reasoning": reasoning_low},
+        max_retries=0  # retried by the scheduler, within the rate budgets
+    )
+    with span("llm_call"):
+        response = await get_llm_scheduler().run(
+            lambda: llm.ainvoke(messages), BULK, estimate_tokens(messages, completion_tokens)
+        )
+    print(f"LLM call graph output: {response.text()}")
+    # Use helper function for JSON extraction/parsing
+    return extract_json_from_response(response.text())
+
+
+def _split_small_files(root_path: str, source_files: List[str], repo_tree_hash: str, results: dict):
+    """
+    Separate the files small enough to batch.
+    Cached graphs of small files go straight into results.
+
+    Returns:
+        (files to request one by one, small files to request in batches)
+    """
+    single_files, small_files = [], []
+    for file_path in source_files:
+        label = os.path.relpath(file_path, root_path).replace(os.sep, "/")
+        try:
+            with open(file_path, "rb") as f:
+                file_hash = content_hash(f.read())
+            code = get_codes_from_file(file_path, label)
+        except OSError:
+            single_files.append(file_path)  # reported by the single-file path
+            continue
+        tokens = count_tokens(code, OPENAI_O4_MINI)
+        if tokens > BATCH_SMALL_FILE_TOKENS:
+            single_files.append(file_path)
+            continue
+        # The path is part of the batched prompt, so it is part of the key
+        cache_key = _call_graph_cache_key(
+            file_hash, repo_tree_hash, PROMPT_CODE_TO_CG_BATCH_HASH, path=content_hash(label)
+        )
+        cached = call_graph_cache.get(cache_key)
+        if cached is not None:
+            results[file_path] = cached
+        else:
+            small_files.append(BatchFile(file_path, label, code, tokens, cache_key))
+    return single_files, small_files
+
+
+def _pack_batches(files: List[BatchFile]) -> List[List[BatchFile]]:
+    """Group files in walk order (neighbours together) under the token and file count limits."""
+    batches, current, current_tokens = [], [], 0
+    for file in files:
+        if current and (current_tokens + file.tokens > BATCH_TOKEN_BUDGET or len(current) >= BATCH_MAX_FILES):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(file)
+        current_tokens += file.tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_batch_response(answer, labels: List[str]) -> dict:
+    """
+    Per-file graphs of a batched answer, keyed by the requested labels.
+    Files the answer lacks (or gives no node list for) are left out.
+    """
+    if not isinstance(answer, dict):
+        return {}
+    answered = {}
+    for name, graph in answer.items():
+        name = str(name).strip().replace("\\", "/")
+        answered[name[2:] if name.startswith("./") else name] = graph
+    basename_counts = Counter(posixpath.basename(label) for label in labels)
+    graphs = {}
+    for label in labels:
+        graph = answered.get(label)
+        if graph is None:
+            # Models sometimes prefix the root directory or drop the directories
+            basename = posixpath.basename(label)
+            candidates = [
+                graph for name, graph in answered.items()
+                if name.endswith("/" + label) or (name == basename and basename_counts[basename] == 1)
+            ]
+            if len(candidates) == 1:
+                graph = candidates[0]
+        if isinstance(graph, dict) and isinstance(graph.get("nodes"), list):
+            graphs[label] = graph
+    return graphs
+
+
+async def generate_call_graphs_for_batch(root_path: str, files: List[BatchFile], repo_tree: str):
+    """
+    Generate the call graphs of several small files with one request.
+    The combined answer is split per file and each graph cached on its own;
+    files missing from the answer (or all of them, if the request fails)
+    are requested one by one.
+    Returns a dict mapping file paths to their graph JSON.
+    """
+    messages = create_batch_messages(repo_tree, [file.code for file in files])
+    graphs = {}
+    try:
+        answer = await _request_call_graph(messages, DEFAULT_COMPLETION_TOKENS * len(files))
+        graphs = split_batch_response(answer, [file.label for file in files])
+    except Exception as e:
+        log_exception(e, inspect.currentframe().f_code.co_name, f" for {len(files)} files")
+
+    results = {}
+    missing = []
+    for file in files:
+        graph = graphs.get(file.label)
+        if graph is None:
+            missing.append(file)
+        else:
+            call_graph_cache.put(file.cache_key, graph)
+            results[file.file_path] = graph
+    if not missing:
+        return results
+
+    print(f"Batched answer lacks {len(missing)} of {len(files)} files; requesting them one by one")
+
+    async def process_missing(file: BatchFile):
+        try:
+            graph = await _request_call_graph(create_messages(root_path, file.file_path, repo_tree))
+            # Same graph as a batched answer; cached under the file's batch key
+            call_graph_cache.put(file.cache_key, graph)
+            return (file.file_path, graph)
+        except Exception as e:
+            log_exception(e, inspect.currentframe().f_code.co_name, f" for file '{file.file_path}'")
+            return (file.file_path, {"error": str(e)})
+
+    results.update(await asyncio.gather(*(process_missing(file) for file in missing)))
+    return results
+
+
+async def generate_call_graphs_for_directory(root_path: str, file_type: Optional[str], batch: bool = True):
     """
     Generate a call graph for each file in the directory.
     Returns a dict mapping file paths to their generated graph JSON.
+    Requests are queued on the shared LLM scheduler in the bulk lane, which
+    bounds how many run at once and paces them to the rate limits.
+    With batch, uncached files of at most BATCH_SMALL_FILE_TOKENS tokens are
+    packed into shared requests of up to BATCH_TOKEN_BUDGET code tokens, so
+    the repo tree and instructions are sent once per batch, not per file.
     """
     source_files = get_all_source_files(root_path, file_type)
     print(f"Source files found: {source_files}")
-    results = {}
+    outputs = {}
+    # The repo tree is part of every file's prompt; build it once per run
+    repo_tree = get_repo_tree(root_path)
+    repo_tree_hash = content_hash(repo_tree)
+
+    single_files, batches = source_files, []
+    if batch:
+        single_files, small_files = _split_small_files(root_path, source_files, repo_tree_hash, outputs)
+        batches = _pack_batches(small_files)
 
     async def process_file(file_path):
         # print(f"Processing file: {file_path}")
         try:
-            output_json = await generate_call_graph_for_file(root_path, file_path)
-            return (file_path, output_json)
+            output_json = await generate_call_graph_for_file(root_path, file_path, repo_tree, repo_tree_hash)
+            return {file_path: output_json}
         except Exception as e:
-            return (file_path, {"error": str(e)})
+            return {file_path: {"error": str(e)}}
 
-    tasks = [process_file(file_path) for file_path in source_files]
+    async def process_batch(files):
+        try:
+            return await generate_call_graphs_for_batch(root_path, files, repo_tree)
+        except Exception as e:
+            return {file.file_path: {"error": str(e)} for file in files}
+
+    tasks = [process_file(file_path) for file_path in single_files]
+    tasks += [process_batch(files) for files in batches]
     results_list = await asyncio.gather(*tasks)
     # print(f"Results: {results_list}")
-    for file_path, output in results_list:
-        results[file_path] = output
-    return results
+    for output in results_list:
+        outputs.update(output)
+    if batches:
+        LLM_CALL_GRAPH_BATCHES.inc(len(batches))
+        LLM_CALL_GRAPH_BATCHED_FILES.inc(sum(len(files) for files in batches))
+    # Keep the walk order of the files
+    return {file_path: outputs[file_path] for file_path in source_files}
 
-async def generate_call_graph_for_file(root_path: str, file_path: str):
+async def generate_call_graph_for_file(root_path: str, file_path: str, repo_tree: Optional[str] = None,
+                                       repo_tree_hash: Optional[str] = None):
     """
     Generate a call graph for a single file.
+    Results are cached by file content, repo tree, prompt template and model,
+    so only files whose prompt would change cost an LLM call.
     """
     try:
-        llm = ChatOpenAI(
-            model=OPENAI_O4_MINI,
-            use_responses_api=True,
-            model_kwargs={"reasoning": reasoning_low}
+        if repo_tree is None:
+            repo_tree = get_repo_tree(root_path)
+        with open(file_path, "rb") as f:
+            file_hash = content_hash(f.read())
+        cache_key = _call_graph_cache_key(
+            file_hash, repo_tree_hash or content_hash(repo_tree), PROMPT_CODE_TO_CG_HASH
         )
-        messages = create_messages(root_path, file_path)
-        response = await llm.ainvoke(messages)
-        print(f"Output for {file_path}: {response.text()}")
-        # Use helper function for JSON extraction/parsing
-        json_obj = extract_json_from_response(response.text())
-        # Save each file's output separately
-        rel_path = os.path.relpath(file_path, root_path)
-        rel_path_flat = rel_path.replace(os.sep, "_")
-        output_path = os.path.join(BACKEND_ROOT_DIR, "artifacts", f"cg_{rel_path_flat}.json")
-        save_json_and_return_str(json_obj, output_path)
+        cached = call_graph_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        messages = create_messages(root_path, file_path, repo_tree)
+        json_obj = await _request_call_graph(messages)
+        call_graph_cache.put(cache_key, json_obj)
         return json_obj
     except Exception as e:
         log_exception(e, inspect.currentframe().f_code.co_name, f" for file '{file_path}'")
         raise HTTPException(status_code=500, detail=f"Error in {inspect.currentframe().f_code.co_name} for {file_path}: {str(e)}")
 
-async def generate_call_graph(root_path: str, file_type: Optional[str]):
+async def generate_call_graph(root_path: str, file_type: Optional[str]) -> bytes:
+    """
+    Generate the LLM call graph of a project.
+
+    Returns:
+        The graph in cg_json_output_all.json format as compact JSON, also
+        saved to the artifact store
+    """
     try:
         # path 내의 .., . 등 정규화
         abs_path = os.path.abspath(os.path.normpath(root_path))
         print(f"Path: {abs_path}, File Type: {file_type}")
 
-        # ⭐️ 이미 결과 파일이 있으면 바로 반환
-        if os.path.exists(CG_JSON_OUTPUT):
-            print(f"Call graph file already exists: {CG_JSON_OUTPUT}")
-            with open(CG_JSON_OUTPUT, "r", encoding="utf-8") as f:
-                return f.read()
-
+        # 파일별 결과는 내용 기준으로 캐시되므로 매번 다시 만들어도 바뀐 파일만 LLM을 호출한다
         results = await generate_call_graphs_for_directory(abs_path, file_type)
-        # Save the results to a JSON file
-        results_str = ""
-        with open(CG_JSON_OUTPUT, "w", encoding="utf-8") as f:
-            json.dump(results, f, indent=4, ensure_ascii=False)
-            results_str = json.dumps(results, indent=4, ensure_ascii=False)
-        print(f"Call graphs saved to {CG_JSON_OUTPUT}")
-        #results should be json string
-        return results_str
+        # Save the results to the artifact store
+        store = get_artifact_store()
+        options = {"file_type": file_type, "model": OPENAI_O4_MINI}
+        key = ArtifactStore.make_key(abs_path, LLM, options, LLM_CALL_GRAPH_VERSION)
+        # Serialized once, compact; the same bytes are stored and returned
+        results_json = dumps_json(results)
+        output_path = store.write(key, results_json, abs_path, LLM, options, LLM_CALL_GRAPH_VERSION)
+        print(f"Call graphs saved to {output_path}")
+        return results_json
+
+    except Exception as e:
+        log_exception(e, inspect.currentframe().f_code.co_name)
+        raise HTTPException(status_code=500, detail=f"Error in {inspect.currentframe().f_code.co_name}: {str(e)}")
+
+def _docstring_summary(definition) -> Optional[str]:
+    """First paragraph of a docstring, on one line."""
+    docstring = ast.get_docstring(definition)
+    if not docstring:
+        return None
+    return " ".join(docstring.strip().split("\n\n", 1)[0].split()) or None
+
+
+def _compact_code(definition, lines: List[str]) -> str:
+    """
+    Code of a definition as sent for its description: a function's body
+    without blank and comment lines (at most HYBRID_MAX_BODY_LINES), or a
+    class's signature with the signatures of its methods.
+    """
+    if isinstance(definition, ast.ClassDef):
+        selected = [lines[definition.lineno - 1]]
+        selected += [
+            lines[child.lineno - 1] for child in definition.body
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
+        ]
+    else:
+        selected = [
+            line for line in lines[definition.lineno - 1:definition.end_lineno]
+            if line.strip() and not line.lstrip().startswith("#")
+        ]
+    if len(selected) > HYBRID_MAX_BODY_LINES:
+        selected = selected[:HYBRID_MAX_BODY_LINES] + ["    ..."]
+    return textwrap.dedent("\n".join(selected))
+
+
+def _module_code(tree: ast.Module, lines: List[str]) -> str:
+    """Module-level statements other than definitions and imports (for script nodes)."""
+    skipped = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom)
+    selected = []
+    for statement in tree.body:
+        if not isinstance(statement, skipped):
+            selected += lines[statement.lineno - 1:statement.end_lineno]
+    if len(selected) > HYBRID_MAX_BODY_LINES:
+        selected = selected[:HYBRID_MAX_BODY_LINES] + ["..."]
+    return "\n".join(selected)
+
+
+def _apply_docstrings(file_path: str, graph: dict) -> Tuple[dict, Dict[str, str]]:
+    """
+    Copy of a file's AST graph with docstring descriptions filled in.
+
+    Returns:
+        (graph, {node id: compact code} of the nodes still without a description)
+    """
+    nodes = [dict(node) for node in graph.get("nodes", [])]
+    result = {"nodes": nodes, "edges": graph.get("edges", [])}
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        tree = ast.parse(content)
+    except (OSError, UnicodeDecodeError, SyntaxError):
+        return result, {}  # keeps the AST descriptions
+    lines = content.splitlines()
+    # Graph nodes start at the def/class line, like the AST nodes
+    definitions = {
+        definition.lineno: definition for definition in ast.walk(tree)
+        if isinstance(definition, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+    }
+    missing = {}
+    for node in nodes:
+        definition = definitions.get(node.get("line_start"))
+        if definition is None:
+            if node["id"].endswith(".main"):
+                missing[node["id"]] = _module_code(tree, lines)
+            continue
+        docstring = _docstring_summary(definition)
+        if docstring:
+            node["description"] = docstring
+        else:
+            missing[node["id"]] = _compact_code(definition, lines)
+    return result, missing
+
+
+def _chunk_items(items: Dict[str, str]) -> List[Dict[str, str]]:
+    """Split a file's items into requests of at most BATCH_TOKEN_BUDGET code tokens."""
+    chunks, current, current_tokens = [], {}, 0
+    for node_id, code in items.items():
+        tokens = count_tokens(code, OPENAI_GPT_4_1_MINI)
+        if current and current_tokens + tokens > BATCH_TOKEN_BUDGET:
+            chunks.append(current)
+            current, current_tokens = {}, 0
+        current[node_id] = code
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def describe_nodes(file_path: str, items: Dict[str, str]) -> Dict[str, str]:
+    """
+    Ask the LLM for the descriptions of one file's nodes.
+    Answers are cached by the compact code sent, the prompt and the model.
+
+    Returns:
+        {node id: description} for the nodes the answer covers
+    """
+    rendered = "\n\n".join(f"### {node_id}\n{code}" for node_id, code in items.items())
+    cache_key = make_key(
+        items=content_hash(rendered), prompt=PROMPT_NODE_DESCRIPTIONS_HASH, model=DESCRIPTION_MODEL_ID
+    )
+    cached = description_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    chat_prompt = ChatPromptTemplate.from_messages(
+        [HumanMessagePromptTemplate.from_template(PROMPT_NODE_DESCRIPTIONS),]
+    )
+    prompt = PromptBuilder(
+        "node_descriptions", OPENAI_GPT_4_1_MINI, completion_tokens=DESCRIPTION_COMPLETION_TOKENS * len(items)
+    )
+    prompt.add("items", rendered)
+    with span("prompt_assembly"):
+        sections = prompt.fit(PROMPT_NODE_DESCRIPTIONS)
+        messages = chat_prompt.format_messages(
+            file_name=os.path.basename(file_path),
+            items=sections["items"],
+        )
+    llm = get_chat_model(
+        OPENAI_GPT_4_1_MINI,
+        temperature=0.0,
+        max_retries=0  # retried by the scheduler
+    )
+    with span("llm_call"):
+        response = await get_llm_scheduler().run(
+            lambda: llm.ainvoke(messages), BULK, prompt.estimate()
+        )
+    prompt.record_usage(response.usage_metadata)
+    answer = extract_json_from_response(response.text())
+    if not isinstance(answer, dict):
+        raise ValueError("LLM 응답이 JSON 객체가 아닙니다.")
+    descriptions = {
+        node_id: str(answer[node_id]).strip()
+        for node_id in items if isinstance(answer.get(node_id), str) and answer[node_id].strip()
+    }
+    description_cache.put(cache_key, descriptions)
+    return descriptions
+
+
+async def generate_hybrid_call_graph(root_path: str, jobs: Optional[int] = None) -> bytes:
+    """
+    Generate a call graph whose structure comes from the AST analyzer and
+    whose descriptions come from docstrings or, for nodes without one, from
+    the LLM.
+
+    Nodes, edges and line ranges are exactly those of the AST graph. The
+    LLM only sees the compact code of the undocumented nodes, one request
+    per file (split above BATCH_TOKEN_BUDGET tokens), and answers with one
+    sentence per node. If a request fails, those nodes keep their AST
+    descriptions.
+
+    Returns:
+        The graph in cg_json_output_all.json format as compact JSON, also
+        saved to the artifact store
+    """
+    try:
+        abs_path = os.path.abspath(os.path.normpath(root_path))
+        print(f"Path: {abs_path}")
+        ast_graph, _ = await build_project_call_graph(abs_path, jobs=jobs)
+
+        with span("hybrid_docstrings"):
+            applied = await asyncio.to_thread(
+                lambda: [(file_path, *_apply_docstrings(file_path, graph)) for file_path, graph in ast_graph.items()]
+            )
+        call_graph = {file_path: graph for file_path, graph, _ in applied}
+        requests = [
+            (file_path, chunk)
+            for file_path, _, missing in applied if missing
+            for chunk in _chunk_items(missing)
+        ]
+
+        async def process_chunk(file_path: str, items: Dict[str, str]):
+            try:
+                return file_path, await describe_nodes(file_path, items)
+            except Exception as e:
+                log_exception(e, inspect.currentframe().f_code.co_name, f" for file '{file_path}'")
+                return file_path, {}
+
+        described = 0
+        for file_path, descriptions in await asyncio.gather(*(process_chunk(*request) for request in requests)):
+            for node in call_graph[file_path]["nodes"]:
+                if node["id"] in descriptions:
+                    node["description"] = descriptions[node["id"]]
+                    described += 1
+        node_count = sum(len(graph["nodes"]) for graph in call_graph.values())
+        requested = sum(len(items) for _, items in requests)
+        HYBRID_NODES.inc(node_count - requested, "ast")
+        HYBRID_NODES.inc(described, "llm")
+        HYBRID_NODES.inc(requested - described, "llm_missing")
+
+        results_json = dumps_json(call_graph)
+        store = get_artifact_store()
+        options = {"model": DESCRIPTION_MODEL_ID}
+        key = ArtifactStore.make_key(abs_path, HYBRID, options, HYBRID_CALL_GRAPH_VERSION)
+        output_path = await asyncio.to_thread(
+            store.write, key, results_json, abs_path, HYBRID, options, HYBRID_CALL_GRAPH_VERSION
+        )
+        print(f"Hybrid call graph saved to {output_path}")
+        return results_json
 
     except Exception as e:
         log_exception(e, inspect.currentframe().f_code.co_name)
@@ -163,22 +618,30 @@ async def generate_control_flow_graph(file_path: str, function_name: str):
 
         print(f"Extracted function code for {function_name}:\n{function_code}")
 
-        llm = ChatOpenAI(
-            model=OPENAI_GPT_4_1,
+        llm = get_chat_model(
+            OPENAI_GPT_4_1,
             use_responses_api=True,
             # model_kwargs={"reasoning": reasoning_medium}
+            max_retries=0
         )
 
         chat_prompt = ChatPromptTemplate.from_messages(
             [HumanMessagePromptTemplate.from_template(PROMPT_CODE_TO_CFG),]
         )  
     
-        messages = chat_prompt.format_messages(
-            function_code=function_code,
-            file_name=os.path.basename(file_path),
-        )
+        prompt = PromptBuilder("control_flow_graph", OPENAI_GPT_4_1)
+        prompt.add("function_code", function_code, policy=HEAD)
+        with span("prompt_assembly"):
+            sections = prompt.fit(PROMPT_CODE_TO_CFG)
+            messages = chat_prompt.format_messages(
+                function_code=sections["function_code"],
+                file_name=os.path.basename(file_path),
+            )
 
-        response = await llm.ainvoke(messages)
+        with span("llm_call"):
+            response = await get_llm_scheduler().run(
+                lambda: llm.ainvoke(messages), INTERACTIVE, prompt.estimate()
+            )
         print(f"Output for {function_name} in {file_path}: {response.text()}")
         json_obj = extract_json_from_response(response.text())
 
@@ -0,0 +1,137 @@
+"""
+Function mentions in chat answers.
+
+Graph-mode answers are scanned for the functions they name so the UI can
+highlight them. Checking every node id and name against the answer with
+`in` costs O(nodes x answer length) and matches names inside longer
+words. FunctionMatcher compiles every node id and function name into one
+Aho-Corasick automaton, built once per call graph version (it hangs off
+the RetrievalIndex), and finds all of them in a single pass over the
+answer:
+
+- a match counts only at identifier boundaries (a function "parse" is
+  not found in "parser" or "_parse_url");
+- where matches overlap, the longest one wins, so a full id is not also
+  credited to the class or module names it contains;
+- functions are ranked by how often and how precisely they are named (a
+  full id outweighs a name that several functions share), then by first
+  mention.
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+# Score of a mention by what it names
+ID_WEIGHT = 3.0
+NAME_WEIGHT = 2.0
+
+
+def _is_identifier_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: all occurrences of the patterns in one pass over a text."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns: List[str] = []
+        # Per state: transitions, failure link, patterns ending here and at states on the failure chain
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for pattern in patterns:
+            self._insert(pattern)
+        self._link()
+
+    def _insert(self, pattern: str) -> None:
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = next_state
+        self._out[state] += (len(self.patterns),)
+        self.patterns.append(pattern)
+
+    def _link(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def finditer(self, text: str) -> Iterable[Tuple[int, int]]:
+        """(start offset, pattern number) of every occurrence, overlapping ones included."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for end, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in out[state]:
+                yield end - len(self.patterns[pattern]), pattern
+
+
+class FunctionMatcher:
+    """Node ids and function names of one call graph, matched in chat answers."""
+
+    def __init__(self, nodes: Iterable[Dict]):
+        # pattern -> ids of the functions it names, and the score of one mention
+        targets: Dict[str, List[str]] = {}
+        weights: Dict[str, float] = {}
+        for node in nodes:
+            node_id = node.get("id")
+            if not node_id:
+                continue
+            targets.setdefault(node_id, []).append(node_id)
+            weights[node_id] = ID_WEIGHT
+            name = node.get("function_name")
+            if name and name != node_id:
+                targets.setdefault(name, []).append(node_id)
+                weights.setdefault(name, NAME_WEIGHT)
+        patterns = list(targets)
+        self._targets = [list(dict.fromkeys(targets[pattern])) for pattern in patterns]
+        self._scores = [weights[pattern] / len(ids) for pattern, ids in zip(patterns, self._targets)]
+        self._automaton = AhoCorasick(patterns)
+
+    def mentions(self, text: str) -> List[Tuple[int, int]]:
+        """(start, pattern number) of the longest non-overlapping matches at identifier boundaries."""
+        patterns = self._automaton.patterns
+        matches = []
+        for start, pattern in self._automaton.finditer(text):
+            end = start + len(patterns[pattern])
+            if start > 0 and _is_identifier_char(text[start - 1]):
+                continue
+            if end < len(text) and _is_identifier_char(text[end]):
+                continue
+            matches.append((start, -len(patterns[pattern]), pattern))
+        matches.sort()
+        chosen = []
+        covered_until = 0
+        for start, negative_length, pattern in matches:
+            if start >= covered_until:
+                chosen.append((start, pattern))
+                covered_until = start - negative_length
+        return chosen
+
+    def match(self, text: str) -> List[str]:
+        """Ids of the functions text mentions, best first."""
+        scores: Dict[str, float] = {}
+        first: Dict[str, int] = {}
+        for start, pattern in self.mentions(text):
+            for node_id in self._targets[pattern]:
+                scores[node_id] = scores.get(node_id, 0.0) + self._scores[pattern]
+                first.setdefault(node_id, start)
+        return sorted(scores, key=lambda node_id: (-scores[node_id], first[node_id]))
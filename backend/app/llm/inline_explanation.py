@@ -2,10 +2,17 @@ import os
 import hashlib
 from typing import Optional, AsyncGenerator, Dict, Tuple
 from llm.constants import OPENAI_GPT_4_1, WORKSPACE_ROOT_DIR
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, SystemMessagePromptTemplate
 from llm.prompt_util import *
 from llm.utils import get_source_file_with_line_number
+from metrics import record_cache, span
+from llm.clients import get_chat_model
+from llm.prompt_budget import AROUND, PromptBuilder
+from llm.scheduler import INTERACTIVE, get_llm_scheduler
+
+SYSTEM_PROMPT = "YOU ARE A SOFTWARE ENGINEERING EXPERT. You are given a Python code snippet. Please generate an inline code explanation for the provided code."
+# Tokens of the source file sent; longer files keep the lines around the selection
+SOURCE_FILE_TOKENS = int(os.getenv("PROMPT_SOURCE_FILE_TOKENS", "16000"))
 
 # In-memory cache for inline code explanations
 _explanation_cache: Dict[str, str] = {}
@@ -25,19 +32,20 @@ async def generate_inline_code_explanation(file_path: str, line_start: int, line
     cache_key = _generate_cache_key(file_path, line_start, line_end, explanation_level)
     
     # Check if result is already in cache
+    record_cache("inline_explanation", cache_key in _explanation_cache)
     if cache_key in _explanation_cache:
         print(f"Cache hit for file: {file_path}, lines: {line_start}-{line_end}, level: {explanation_level}")
         return _explanation_cache[cache_key]
 
-    llm = ChatOpenAI(
-        model=OPENAI_GPT_4_1,
+    llm = get_chat_model(
+        OPENAI_GPT_4_1,
         temperature=0.0,
-        max_retries=2
+        max_retries=0  # retried by the scheduler
     )
 
     chat_prompt = ChatPromptTemplate.from_messages(
         [
-            SystemMessagePromptTemplate.from_template("YOU ARE A SOFTWARE ENGINEERING EXPERT. You are given a Python code snippet. Please generate an inline code explanation for the provided code."),
+            SystemMessagePromptTemplate.from_template(SYSTEM_PROMPT),
             HumanMessagePromptTemplate.from_template(PROMPT_INLINE_CODE_EXPLANATION),
         ]
     )
@@ -46,15 +54,23 @@ async def generate_inline_code_explanation(file_path: str, line_start: int, line
     code_snippet = get_source_file_with_line_number(file_path)
     print(code_snippet)
 
-    messages = chat_prompt.format_messages(
-        code_snippet=code_snippet,
-        line_start=line_start,
-        line_end=line_end,
-        explanation_level=explanation_level,
-    )
+    prompt = PromptBuilder("inline_explanation", OPENAI_GPT_4_1)
+    prompt.add("code_snippet", code_snippet, SOURCE_FILE_TOKENS, AROUND, focus=(line_start, line_end))
+    with span("prompt_assembly"):
+        sections = prompt.fit(SYSTEM_PROMPT, PROMPT_INLINE_CODE_EXPLANATION)
+        messages = chat_prompt.format_messages(
+            code_snippet=sections["code_snippet"],
+            line_start=line_start,
+            line_end=line_end,
+            explanation_level=explanation_level,
+        )
 
-    response = await llm.ainvoke(messages)
+    with span("llm_call"):
+        response = await get_llm_scheduler().run(
+            lambda: llm.ainvoke(messages), INTERACTIVE, prompt.estimate()
+        )
     print(f"Response: {response}")
+    prompt.record_usage(response.usage_metadata)
     # Extract and return only the 'content' field from the response
     if not response or not hasattr(response, "content"):
         raise ValueError("Invalid response from LLM")
@@ -75,21 +91,23 @@ async def generate_inline_code_explanation_stream(file_path: str, line_start: in
     cache_key = _generate_cache_key(file_path, line_start, line_end, explanation_level)
     
     # Check if result is already in cache
+    record_cache("inline_explanation", cache_key in _explanation_cache)
     if cache_key in _explanation_cache:
         print(f"Cache hit for streaming request - file: {file_path}, lines: {line_start}-{line_end}, level: {explanation_level}")
         yield _explanation_cache[cache_key]
         return
 
-    llm = ChatOpenAI(
-        model=OPENAI_GPT_4_1,
+    llm = get_chat_model(
+        OPENAI_GPT_4_1,
         temperature=0.0,
         max_retries=2,
-        streaming=True  # Enable streaming
+        streaming=True,  # Enable streaming
+        stream_usage=True
     )
 
     chat_prompt = ChatPromptTemplate.from_messages(
         [
-            SystemMessagePromptTemplate.from_template("YOU ARE A SOFTWARE ENGINEERING EXPERT. You are given a Python code snippet. Please generate an inline code explanation for the provided code."),
+            SystemMessagePromptTemplate.from_template(SYSTEM_PROMPT),
             HumanMessagePromptTemplate.from_template(PROMPT_INLINE_CODE_EXPLANATION),
         ]
     )
@@ -97,19 +115,27 @@ async def generate_inline_code_explanation_stream(file_path: str, line_start: in
     print(f"Generating streaming inline code explanation for file: {file_path}, lines: {line_start}-{line_end}, level: {explanation_level}")
     code_snippet = get_source_file_with_line_number(file_path)
 
-    messages = chat_prompt.format_messages(
-        code_snippet=code_snippet,
-        line_start=line_start,
-        line_end=line_end,
-        explanation_level=explanation_level,
-    )
+    prompt = PromptBuilder("inline_explanation_stream", OPENAI_GPT_4_1)
+    prompt.add("code_snippet", code_snippet, SOURCE_FILE_TOKENS, AROUND, focus=(line_start, line_end))
+    with span("prompt_assembly"):
+        sections = prompt.fit(SYSTEM_PROMPT, PROMPT_INLINE_CODE_EXPLANATION)
+        messages = chat_prompt.format_messages(
+            code_snippet=sections["code_snippet"],
+            line_start=line_start,
+            line_end=line_end,
+            explanation_level=explanation_level,
+        )
     
     # Collect streaming response and cache it
     full_response = ""
-    async for chunk in llm.astream(messages):
-        if chunk.content:
-            full_response += chunk.content
-            yield chunk.content
+    async with get_llm_scheduler().slot(INTERACTIVE, prompt.estimate()):
+        with span("llm_stream"):
+            async for chunk in llm.astream(messages):
+                if chunk.usage_metadata:
+                    prompt.record_usage(chunk.usage_metadata)
+                if chunk.content:
+                    full_response += chunk.content
+                    yield chunk.content
     
     # Cache the complete response
     if full_response:
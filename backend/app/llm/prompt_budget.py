@@ -0,0 +1,308 @@
+"""
+Token budgets for LLM prompts.
+
+Prompts are built from fixed instructions plus variable sections (source
+files, the repo tree, chat history, the selected code, a diagram), which
+used to be concatenated without limit. PromptBuilder counts every section
+with the model's tokenizer (llm.tokens), cuts each one to its own budget
+and the whole prompt to the model's context window (and PROMPT_MAX_TOKENS),
+and logs how many tokens each section takes and how many were cut. The
+same numbers are exported through metrics (/api/metrics), per entry point
+and section, along with the share of each prompt the provider served from
+its prompt cache (record_usage).
+
+Sections are cut by lines according to a policy:
+
+- HEAD / TAIL: keep the first / last lines
+- MIDDLE: keep the first and last lines, drop the middle
+- AROUND: keep the numbered lines in focus and the lines nearest to them
+  (code with line numbers, as get_source_file_with_line_number renders it)
+- OUTLINE: summarize code as its class/def signatures first, then as
+  many body lines as fit
+- RECENT: a list (chat history) keeps its most recent items
+
+Omitted runs of lines are replaced by a "... (N lines omitted)" marker, so
+the model knows the section is incomplete. A single line longer than the
+budget is cut by characters.
+"""
+
+import os
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from llm.constants import MODEL_CONTEXT_TOKENS
+from llm.scheduler import DEFAULT_COMPLETION_TOKENS
+from llm.tokens import CHARS_PER_TOKEN, count_tokens
+from metrics import (
+    LLM_PROMPT_CACHED_TOKENS,
+    LLM_PROMPT_INPUT_TOKENS,
+    LLM_PROMPT_SIZE,
+    LLM_PROMPT_TOKENS,
+    LLM_PROMPT_TOKENS_CUT,
+)
+
+# Upper bound for any prompt, well below the context windows (and the
+# scheduler's tokens-per-minute budget), to keep cost and latency in check
+PROMPT_MAX_TOKENS = int(os.getenv("LLM_PROMPT_MAX_TOKENS", "100000"))
+# Context window assumed for models missing from MODEL_CONTEXT_TOKENS
+DEFAULT_CONTEXT_TOKENS = 128_000
+# Repo tree share of any prompt that includes it
+REPO_TREE_TOKENS = int(os.getenv("PROMPT_REPO_TREE_TOKENS", "4000"))
+
+HEAD = "head"
+TAIL = "tail"
+MIDDLE = "middle"
+AROUND = "around"
+OUTLINE = "outline"
+RECENT = "recent"
+
+# Reserved per omission marker
+MARKER_TOKENS = 8
+
+_LINE_NUMBER = re.compile(r"^\s*(\d+): ")
+_SIGNATURE = re.compile(r"^(\s*\d+: )?\s*(@|(async\s+)?def\s|class\s)")
+
+
+def _marker(count: int, unit: str = "lines") -> str:
+    return f"... ({count} {unit} omitted)"
+
+
+def _line_order(lines: List[str], policy: str, focus: Optional[Tuple[int, int]]) -> Iterable[int]:
+    """Indexes of lines, most important first."""
+    count = len(lines)
+    if policy == TAIL:
+        return range(count - 1, -1, -1)
+    if policy == MIDDLE:
+        return (index // 2 if index % 2 == 0 else count - 1 - index // 2 for index in range(count))
+    if policy not in (OUTLINE, AROUND):
+        return range(count)
+    numbers = []
+    for line in lines:
+        match = _LINE_NUMBER.match(line)
+        numbers.append(int(match.group(1)) if match else None)
+    # Lines before the first numbered line are headers (e.g. "File: ...")
+    header = []
+    if any(number is not None for number in numbers):
+        for index, number in enumerate(numbers):
+            if number is not None:
+                break
+            header.append(index)
+    if policy == OUTLINE:
+        signatures = [index for index, line in enumerate(lines) if index >= len(header) and _SIGNATURE.match(line)]
+        chosen = set(header + signatures)
+        return header + signatures + [index for index in range(count) if index not in chosen]
+    if focus is not None:
+        first, last = focus
+        inside = [index for index, number in enumerate(numbers) if number is not None and first <= number <= last]
+        if inside:
+            order = header + list(range(inside[0], inside[-1] + 1))
+            below, above = inside[0] - 1, inside[-1] + 1
+            while below >= len(header) or above < count:
+                if below >= len(header):
+                    order.append(below)
+                    below -= 1
+                if above < count:
+                    order.append(above)
+                    above += 1
+            return order
+    return range(count)
+
+
+def _cut_chars(text: str, budget: int, model: Optional[str]) -> Tuple[str, int]:
+    """Longest prefix of text within budget tokens."""
+    length = min(len(text), budget * CHARS_PER_TOKEN)
+    while length > 0:
+        cut = text[:length]
+        tokens = count_tokens(cut, model)
+        if tokens <= budget:
+            return cut, tokens
+        length = length * budget // tokens - 1
+    return "", 0
+
+
+def fit_text(text: str, budget: int, policy: str = HEAD, focus: Optional[Tuple[int, int]] = None,
+             model: Optional[str] = None) -> Tuple[str, int]:
+    """
+    text cut to at most budget tokens by the policy's line order.
+
+    Returns:
+        (text, its tokens)
+    """
+    tokens = count_tokens(text, model)
+    if tokens <= budget:
+        return text, tokens
+    if budget <= MARKER_TOKENS:
+        return "", 0
+    lines = text.split("\n")
+    costs = [count_tokens(line, model) + 1 for line in lines]
+    kept = [False] * len(lines)
+    used = 0
+    gaps = 1  # runs of omitted lines
+    for index in _line_order(lines, policy, focus):
+        left_omitted = index > 0 and not kept[index - 1]
+        right_omitted = index < len(lines) - 1 and not kept[index + 1]
+        new_gaps = gaps + (1 if left_omitted and right_omitted else 0 if left_omitted or right_omitted else -1)
+        if used + costs[index] + new_gaps * MARKER_TOKENS > budget:
+            break
+        kept[index] = True
+        used += costs[index]
+        gaps = new_gaps
+    if not any(kept):
+        cut, _ = _cut_chars(text, budget - MARKER_TOKENS, model)
+        result = f"{cut}\n{_marker(len(text) - len(cut), 'characters')}"
+        return result, count_tokens(result, model)
+
+    result = []
+    omitted = 0
+    for line, keep in zip(lines, kept):
+        if keep:
+            if omitted:
+                result.append(_marker(omitted))
+                omitted = 0
+            result.append(line)
+        else:
+            omitted += 1
+    if omitted:
+        result.append(_marker(omitted))
+    text = "\n".join(result)
+    return text, count_tokens(text, model)
+
+
+def fit_items(items: Sequence, budget: int, model: Optional[str] = None) -> Tuple[str, int]:
+    """The most recent items (rendered as a list) that fit in budget tokens."""
+    text = str(list(items))
+    tokens = count_tokens(text, model)
+    if tokens <= budget:
+        return text, tokens
+    kept = []
+    used = count_tokens(_marker(len(items), "earlier messages"), model) + 1
+    for item in reversed(items):
+        cost = count_tokens(repr(item), model) + 1
+        if used + cost > budget:
+            break
+        kept.append(item)
+        used += cost
+    kept.reverse()
+    omitted = len(items) - len(kept)
+    text = f"{_marker(omitted, 'earlier messages')} {kept}" if kept else _marker(omitted, "earlier messages")
+    return text, count_tokens(text, model)
+
+
+class _Section(NamedTuple):
+    name: str
+    content: Union[str, Sequence, None]
+    budget: Optional[int]
+    policy: str
+    focus: Optional[Tuple[int, int]]
+
+
+class PromptBuilder:
+    """
+    Budgets of one prompt's variable sections.
+
+    Sections are added in order of importance: each gets up to its own
+    budget, out of what the instructions and the sections before it left.
+
+        prompt = PromptBuilder("chat", OPENAI_GPT_4_1)
+        prompt.add("code", code, budget=8000, policy=MIDDLE)
+        prompt.add("history", history, budget=4000, policy=RECENT)
+        sections = prompt.fit(SYSTEM_PROMPT, TEMPLATE)
+        messages = chat_prompt.format_messages(**sections)
+    """
+
+    def __init__(self, entry: str, model: str, completion_tokens: int = DEFAULT_COMPLETION_TOKENS,
+                 max_tokens: int = PROMPT_MAX_TOKENS):
+        self.entry = entry
+        self.model = model
+        self.completion_tokens = completion_tokens
+        context_tokens = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+        self.max_tokens = min(max_tokens, context_tokens - completion_tokens)
+        self.sections: List[_Section] = []
+        # section -> tokens sent, and tokens cut; filled in by fit()
+        self.tokens: Dict[str, int] = {}
+        self.cut: Dict[str, int] = {}
+        # Share of the prompt served from the provider's prompt cache; set by record_usage()
+        self.cached_ratio: Optional[float] = None
+
+    def add(self, name: str, content: Union[str, Sequence, None], budget: Optional[int] = None,
+            policy: str = HEAD, focus: Optional[Tuple[int, int]] = None) -> "PromptBuilder":
+        """
+        Add a section.
+
+        Args:
+            name: Key of the section in fit()'s result
+            content: Text, or a list of items for RECENT; None or empty for no section
+            budget: Tokens the section may take at most (None: whatever is left)
+            policy: How the section is cut (HEAD, TAIL, MIDDLE, AROUND, OUTLINE, RECENT)
+            focus: (first, last) line numbers kept first by AROUND
+        """
+        self.sections.append(_Section(name, content, budget, policy, focus))
+        return self
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    def fit(self, *instructions: str) -> Dict[str, str]:
+        """
+        Cut the sections to their budgets.
+
+        Args:
+            instructions: The fixed parts of the prompt (system prompt,
+                template text), counted but never cut
+
+        Returns:
+            {section name: text to put in the prompt} ("" for empty sections)
+        """
+        self.tokens = {"instructions": sum(count_tokens(text, self.model) for text in instructions)}
+        self.cut = {}
+        remaining = self.max_tokens - self.tokens["instructions"]
+        fitted = {}
+        for section in self.sections:
+            if not section.content:
+                fitted[section.name] = ""
+                continue
+            budget = max(0, remaining if section.budget is None else min(section.budget, remaining))
+            if section.policy == RECENT:
+                text, tokens = fit_items(section.content, budget, self.model)
+                full = count_tokens(str(list(section.content)), self.model) if text.startswith("...") else tokens
+            else:
+                text, tokens = fit_text(section.content, budget, section.policy, section.focus, self.model)
+                full = count_tokens(section.content, self.model) if text is not section.content else tokens
+            fitted[section.name] = text
+            self.tokens[section.name] = tokens
+            if full > tokens:
+                self.cut[section.name] = full - tokens
+            remaining -= tokens
+        self._report()
+        return fitted
+
+    def estimate(self) -> int:
+        """Prompt + completion tokens, for the scheduler's budget."""
+        return self.prompt_tokens + self.completion_tokens
+
+    def record_usage(self, usage: Optional[Dict]) -> Optional[float]:
+        """
+        Record the prompt tokens the provider billed and how many of them
+        came from its prompt cache, from a response's usage_metadata (None
+        or without cache details, e.g. from the Responses API: ignored).
+
+        Returns:
+            The cached share of the prompt, or None if not reported
+        """
+        details = (usage or {}).get("input_token_details") or {}
+        input_tokens = (usage or {}).get("input_tokens")
+        if not input_tokens or "cache_read" not in details:
+            return None
+        cached = details["cache_read"] or 0
+        LLM_PROMPT_INPUT_TOKENS.inc(input_tokens, self.entry)
+        LLM_PROMPT_CACHED_TOKENS.inc(cached, self.entry)
+        self.cached_ratio = cached / input_tokens
+        return self.cached_ratio
+
+    def _report(self) -> None:
+        for name, tokens in self.tokens.items():
+            LLM_PROMPT_TOKENS.inc(tokens, self.entry, name)
+            if name in self.cut:
+                LLM_PROMPT_TOKENS_CUT.inc(self.cut[name], self.entry, name)
+        LLM_PROMPT_SIZE.observe(self.prompt_tokens, self.entry)
@@ -70,6 +70,44 @@ PROMPT_CODE_TO_CG = """
     - Ignore built-in functions and standard library calls.
 """
 
+PROMPT_CODE_TO_CG_BATCH = """
+    You are a SOFTWARE ENGINEERING EXPERT. You are given several Python files.
+    Please generate a separate Call Graph for each provided file.
+
+    INPUT:
+    - The directory structure of the repository:
+    {repo_tree}
+    - The files with line numbers, each between "=== FILE: <path> ===" and "=== END FILE: <path> ===":
+    {code_from_files}
+    - Example output format for one file (JSON):
+    {diagram_example}
+
+    OUTPUT:
+    - The output must be a single JSON object whose keys are the file paths exactly as written in the "=== FILE: <path> ===" headers, and whose values are the Call Graphs of those files: {{"<path>": {{"nodes": [...], "edges": [...]}}, ...}}
+    - Include every provided file, even if its graph has no edges.
+    - Each Call Graph must strictly follow the provided JSON format and only describe its own file.
+    - Node IDs should be unique and follow the format: "sub_dir.file_name.function_name" where sub_dir is the name of the sub-directory from root_dir, file_name is the name of the file without extension, and function_name is the name of the function.
+    - Only create nodes for functions or classes declared in that file, if there are no functions or classes declared, just add "Global" node.
+    - If a function or class is called but not declared in that file (e.g., imported), do not create a node for it, but do create an edge to it.
+    - For edges to imported functions or classes, if the import statement is like 'from A.B import C', the edge target should be 'A.B.C'.
+    - Edges must represent function calls or class method calls.
+    - Edge ids should be unique and follow the format: "file_name.e[index]" where file_name is the name of the file without extension and index is a sequential number starting from 0.
+    - Ignore built-in functions and standard library calls.
+"""
+
+PROMPT_NODE_DESCRIPTIONS = """
+    You are a SOFTWARE ENGINEERING EXPERT. You are given functions and classes of the Python file {file_name}.
+    Please describe what each of them does.
+
+    INPUT:
+    - Each item starts with "### <node_id>" followed by its code (classes show only their signature and method signatures):
+    {items}
+
+    OUTPUT:
+    - The output must be a single JSON object mapping every node_id, exactly as given, to its description: {{"<node_id>": "<description>", ...}}
+    - Each description is one English sentence of at most 25 words, like "Function to do something."
+"""
+
 PROMPT_CODE_TO_CFG = """
     You are tasked with analyzing the provided code and generating a Control Flow Graph (CFG) description in JSON format to help users easily understand the structure and logic of the code.
 
@@ -241,22 +279,24 @@ def build_repo_tree(root: Path, prefix: str = "", is_sub: bool = False) -> str:
 #         print(prompt)
 #         return prompt
 
-def get_codes_from_file(file_path):
+def get_codes_from_file(file_path, display_name=None):
     """
     주어진 파일에서 코드를 읽고, 각 줄에 라인 넘버를 추가하여 반환합니다.
+    display_name: FILE 헤더에 쓸 이름 (기본값은 파일 이름)
     """
     from pathlib import Path
     file_path = Path(file_path)
+    name = display_name or file_path.name
     try:
         text = file_path.read_text(encoding="utf-8")
     except UnicodeDecodeError:
-        return f"# Skipped non-UTF8 file: {file_path.name}\n"
+        return f"# Skipped non-UTF8 file: {name}\n"
     lines = text.splitlines()
     numbered = "\n".join(f"{i+1:4d}: {line}" for i, line in enumerate(lines))
     parts = [
-        f"=== FILE: {file_path.name} ===",
+        f"=== FILE: {name} ===",
         numbered,
-        f"=== END FILE: {file_path.name} ===\n"
+        f"=== END FILE: {name} ===\n"
     ]
     return "\n".join(parts)
 
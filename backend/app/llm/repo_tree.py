@@ -0,0 +1,211 @@
+"""
+Cached directory trees for LLM prompts.
+
+build_repo_tree re-lists and re-sorts the whole project on every call, and
+its output goes into every diagram prompt and graph-mode chat turn.
+RepoTreeCache keeps the tree of each project root in memory instead. Every
+directory remembers its sorted listing and its mtime; a directory's mtime
+changes exactly when entries are added, removed or renamed in it, so a
+later call only stats the directories, re-lists the ones that changed and
+reuses the rendered text of every unchanged subtree.
+
+The text is identical to build_repo_tree's. Trees longer than max_lines
+are shown with fewer levels (collapsed directories report how many
+entries they hide), and max_depth limits the levels shown.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from llm.prompt_util import IGNORE_DIRS, IGNORE_FILES
+from metrics import record_cache, span
+
+# Lines of tree text put in a prompt
+MAX_LINES = int(os.getenv("REPO_TREE_MAX_LINES", "2000"))
+# A listing taken this soon after its directory changed may miss a change
+# made within the same mtime tick; such directories are listed again
+RACY_NANOSECONDS = 1_000_000_000
+
+
+class _Directory:
+    __slots__ = ("path", "mtime_ns", "stable", "entries", "depth_lines", "text")
+
+    def __init__(self, path: str, mtime_ns: Optional[int], stable: bool,
+                 entries: List[Tuple[str, Optional["_Directory"]]]):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.stable = stable
+        # (name, subdirectory or None for other entries), in display order
+        self.entries = entries
+        self.text: Optional[str] = None
+        self.depth_lines: List[int] = []
+        self.count_lines()
+
+    def count_lines(self) -> None:
+        """Lines of the subtree per level below this directory."""
+        counts = [len(self.entries)] if self.entries else []
+        for _, child in self.entries:
+            if child is not None:
+                for level, count in enumerate(child.depth_lines, 1):
+                    if level < len(counts):
+                        counts[level] += count
+                    else:
+                        counts.append(count)
+        self.depth_lines = counts
+
+    @property
+    def total_lines(self) -> int:
+        return sum(self.depth_lines)
+
+
+def _render(directory: _Directory) -> str:
+    """Full text below directory (cached on it until the subtree changes)."""
+    if directory.text is None:
+        lines = []
+        last = len(directory.entries) - 1
+        for index, (name, child) in enumerate(directory.entries):
+            lines.append(("└── " if index == last else "├── ") + name)
+            if child is not None:
+                text = _render(child)
+                if text:
+                    extension = "    " if index == last else "│   "
+                    lines.append(extension + text.replace("\n", "\n" + extension))
+        directory.text = "\n".join(lines)
+    return directory.text
+
+
+def _render_levels(directory: _Directory, levels: int, prefix: str, lines: List[str],
+                   max_entries: Optional[int] = None) -> None:
+    """Text of the first levels below directory; deeper directories are collapsed."""
+    entries = directory.entries
+    hidden = 0
+    if max_entries is not None and len(entries) > max_entries:
+        hidden = len(entries) - max_entries
+        entries = entries[:max_entries]
+    last = len(entries) - 1
+    for index, (name, child) in enumerate(entries):
+        connector = "└── " if index == last and not hidden else "├── "
+        if child is not None and child.entries and levels <= 1:
+            hidden_lines = child.total_lines
+            lines.append(f"{prefix}{connector}{name} ({hidden_lines} {'entry' if hidden_lines == 1 else 'entries'} not shown)")
+            continue
+        lines.append(prefix + connector + name)
+        if child is not None:
+            extension = "    " if index == last and not hidden else "│   "
+            _render_levels(child, levels - 1, prefix + extension, lines)
+    if hidden:
+        lines.append(f"{prefix}└── ... ({hidden} more entries)")
+
+
+class RepoTreeCache:
+    """Directory trees of project roots, refreshed from directory mtimes."""
+
+    def __init__(self):
+        self._roots: Dict[str, _Directory] = {}
+        self._lock = threading.Lock()
+        self.relisted = 0
+
+    def _list(self, path: str, ancestors: frozenset, old: Optional[_Directory]) -> _Directory:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return _Directory(path, None, False, [])
+        listed_at = time.time_ns()
+        self.relisted += 1
+        old_children = {child.path: child for _, child in old.entries if child is not None} if old else {}
+        items = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    # Like Path.is_dir()/is_file(): symlinks are followed
+                    try:
+                        is_dir = entry.is_dir()
+                        is_file = not is_dir and entry.is_file()
+                    except OSError:
+                        is_dir = is_file = False
+                    if (is_dir and entry.name in IGNORE_DIRS) or (is_file and entry.name in IGNORE_FILES):
+                        continue
+                    items.append((is_file, entry.name.lower(), entry.name, is_dir, entry.path))
+        except OSError:
+            pass
+        # Directories first, then files, by lower-cased name (as build_repo_tree)
+        items.sort(key=lambda item: (item[0], item[1]))
+        ancestors = ancestors | {(st.st_dev, st.st_ino)}
+        entries = []
+        for _, _, name, is_dir, entry_path in items:
+            child = self._refresh(entry_path, old_children.get(entry_path), ancestors)[0] if is_dir else None
+            entries.append((name, child))
+        stable = listed_at - st.st_mtime_ns > RACY_NANOSECONDS
+        return _Directory(path, st.st_mtime_ns, stable, entries)
+
+    def _refresh(self, path: str, directory: Optional[_Directory],
+                 ancestors: frozenset) -> Tuple[_Directory, bool]:
+        """(up-to-date directory, whether anything below it changed)."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return _Directory(path, None, False, []), directory is None or bool(directory.entries)
+        if (st.st_dev, st.st_ino) in ancestors:
+            # Symlink back to an ancestor; shown, but not descended into again
+            return _Directory(path, st.st_mtime_ns, True, []), directory is None
+        if directory is None or not directory.stable or directory.mtime_ns != st.st_mtime_ns:
+            return self._list(path, ancestors, directory), True
+
+        ancestors = ancestors | {(st.st_dev, st.st_ino)}
+        changed = False
+        for index, (name, child) in enumerate(directory.entries):
+            if child is None:
+                continue
+            new_child, child_changed = self._refresh(child.path, child, ancestors)
+            if child_changed:
+                directory.entries[index] = (name, new_child)
+                changed = True
+        if changed:
+            directory.text = None
+            directory.count_lines()
+        return directory, changed
+
+    def get(self, root, max_depth: Optional[int] = None, max_lines: Optional[int] = MAX_LINES) -> str:
+        """
+        Tree text of root, as build_repo_tree(root) renders it.
+
+        Args:
+            root: Project directory (str or Path)
+            max_depth: Levels shown below root (None: all)
+            max_lines: Lines shown below root; larger trees show fewer
+                levels, and a root with more entries than this is cut
+        """
+        root = Path(root)
+        key = os.path.realpath(root)
+        with span("repo_tree"), self._lock:
+            relisted = self.relisted
+            directory, _ = self._refresh(key, self._roots.get(key), frozenset())
+            self._roots[key] = directory
+            record_cache("repo_tree", self.relisted == relisted)
+
+            counts = directory.depth_lines
+            levels = len(counts) if max_depth is None else min(max(1, max_depth), len(counts))
+            if max_lines is not None:
+                while levels > 1 and sum(counts[:levels]) > max_lines:
+                    levels -= 1
+            if levels == len(counts) and (max_lines is None or directory.total_lines <= max_lines):
+                text = _render(directory)
+                return f"{root.name}\n{text}" if text else root.name
+            lines = [root.name]
+            _render_levels(directory, levels, "", lines, max_lines)
+            return "\n".join(lines)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"roots": len(self._roots), "relisted_directories": self.relisted}
+
+
+_repo_trees = RepoTreeCache()
+
+
+def get_repo_tree(root, max_depth: Optional[int] = None, max_lines: Optional[int] = MAX_LINES) -> str:
+    """Shared RepoTreeCache lookup (see RepoTreeCache.get)."""
+    return _repo_trees.get(root, max_depth, max_lines)
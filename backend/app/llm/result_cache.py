@@ -0,0 +1,73 @@
+"""
+Content-addressed cache of LLM results.
+
+An LLM answer is reusable as long as everything that went into its prompt
+is unchanged, so entries are keyed by a hash of exactly those inputs (for
+per-file call graphs: the file content, the repo tree, the prompt template
+and the model). Each entry is one JSON file under cache/<namespace>,
+written atomically, so concurrent requests and server restarts share it.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import xxhash
+
+from metrics import record_cache
+
+CACHE_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cache")
+
+
+def content_hash(data) -> str:
+    """xxhash of bytes or text (text is hashed as UTF-8)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return xxhash.xxh3_128_hexdigest(data)
+
+
+def make_key(**parts: str) -> str:
+    """Key over named input hashes; the names are part of it, the order is not."""
+    return content_hash("\n".join(f"{name}={parts[name]}" for name in sorted(parts)))
+
+
+class LLMResultCache:
+    """JSON results on disk, one file per key, with hit/miss counters."""
+
+    def __init__(self, namespace: str, root: str = CACHE_ROOT):
+        self.namespace = namespace
+        self.directory = os.path.join(root, namespace)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        # Two-character fan-out keeps directories small on large repos
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        record_cache(self.namespace, value is not None)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
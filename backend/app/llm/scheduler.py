@@ -0,0 +1,233 @@
+"""
+Shared scheduler for LLM requests.
+
+Every LLM call in the process goes through one LLMScheduler, which caps
+the number of requests in flight and keeps request-per-minute and
+token-per-minute budgets (token buckets refilled continuously). Waiting
+requests are served by priority lane, so an interactive chat or
+explanation never queues behind a directory-wide diagram run, and within
+a lane in arrival order. Requests rejected with HTTP 429 (or failing
+transiently: 408, 5xx, connection errors) are retried with exponential
+backoff and full jitter, or after the server's Retry-After, going back
+through the queue so the retries themselves respect the budgets. Clients
+used through run() should be created with max_retries=0 so the OpenAI
+client does not retry on its own, outside the budgets.
+
+Queue depth, in-flight requests, queue wait time and retries are exported
+through metrics (/api/metrics).
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from metrics import LLM_ACTIVE_REQUESTS, LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT_SECONDS, LLM_RETRIES
+
+T = TypeVar("T")
+
+# Priority lanes, most urgent first
+INTERACTIVE = 0
+BULK = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+MAX_RETRIES = 5
+BASE_BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+
+# Rough size of a completion when the caller does not estimate one
+DEFAULT_COMPLETION_TOKENS = 1024
+
+
+def estimate_tokens(messages: Any, completion_tokens: int = DEFAULT_COMPLETION_TOKENS) -> int:
+    """Cheap prompt + completion estimate (about 4 characters per token) for budgeting."""
+    if isinstance(messages, str):
+        characters = len(messages)
+    else:
+        characters = sum(len(str(getattr(message, "content", message))) for message in messages)
+    return characters // 4 + completion_tokens
+
+
+_RETRYABLE_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Rate limits and transient provider failures."""
+    status = getattr(error, "status_code", None)
+    return status in (408, 429) or (isinstance(status, int) and status >= 500) \
+        or type(error).__name__ in _RETRYABLE_ERRORS
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _used_tokens(result: Any) -> Optional[int]:
+    """Total tokens reported on a LangChain message, if any."""
+    usage = getattr(result, "usage_metadata", None)
+    if isinstance(usage, dict) and usage.get("total_tokens"):
+        return usage["total_tokens"]
+    return None
+
+
+class _TokenBucket:
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until amount is available (0 if it is)."""
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+
+class LLMScheduler:
+    """Concurrency cap, RPM/TPM budgets and priority lanes for LLM requests."""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, requests_per_minute: int = REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = TOKENS_PER_MINUTE):
+        self.max_concurrency = max(1, max_concurrency)
+        self._requests = _TokenBucket(max(1, requests_per_minute))
+        self._tokens = _TokenBucket(max(1, tokens_per_minute))
+        self._active = 0
+        # [lane, sequence, tokens, future]; cancelled waiters are skipped when popped
+        self._waiters: List[list] = []
+        self._sequence = itertools.count()
+        self._depth = dict.fromkeys(LANE_NAMES, 0)
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        for lane, name in LANE_NAMES.items():
+            LLM_QUEUE_DEPTH.set(self._depth[lane], name)
+        LLM_ACTIVE_REQUESTS.set(self._active)
+
+    def _dispatch(self) -> None:
+        """Start queued requests while a slot and the budgets allow."""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+        now = time.monotonic()
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        while self._waiters and self._active < self.max_concurrency:
+            lane, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            delay = max(self._requests.delay(1), self._tokens.delay(tokens))
+            if delay > 0:
+                # The head of the queue waits for budget; lower lanes do not overtake it
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                break
+            heapq.heappop(self._waiters)
+            self._requests.level -= 1
+            self._tokens.level -= min(tokens, self._tokens.capacity)
+            self._active += 1
+            self._depth[lane] -= 1
+            future.set_result(None)
+        self._update_gauges()
+
+    async def _acquire(self, lane: int, tokens: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [lane, next(self._sequence), tokens, future])
+        self._depth[lane] += 1
+        start = time.monotonic()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release()  # got the slot just as we were cancelled
+            else:
+                self._depth[lane] -= 1
+                self._update_gauges()
+            raise
+        LLM_QUEUE_WAIT_SECONDS.observe(time.monotonic() - start, LANE_NAMES[lane])
+
+    def _release(self, estimated: int = 0, used: Optional[int] = None) -> None:
+        self._active -= 1
+        if used is not None:
+            # Settle the budget with what the request actually consumed
+            self._tokens.level -= used - min(estimated, self._tokens.capacity)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane: int = BULK, tokens: int = DEFAULT_COMPLETION_TOKENS):
+        """Hold one request slot (e.g. for the duration of a stream); no retries."""
+        await self._acquire(lane, tokens)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def run(self, call: Callable[[], Awaitable[T]], lane: int = BULK,
+                  tokens: int = DEFAULT_COMPLETION_TOKENS, max_retries: int = MAX_RETRIES) -> T:
+        """
+        Run call() when a slot and budget are free, retrying rate-limited and
+        transiently failed attempts.
+
+        Args:
+            call: Starts one attempt (e.g. lambda: llm.ainvoke(messages))
+            lane: INTERACTIVE or BULK
+            tokens: Estimated prompt + completion tokens (see estimate_tokens)
+            max_retries: Attempts after the first one that hit HTTP 429 or a transient error
+        """
+        attempt = 0
+        while True:
+            await self._acquire(lane, tokens)
+            used = None
+            try:
+                result = await call()
+                used = _used_tokens(result)
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= max_retries:
+                    raise
+                reason = type(e).__name__
+                backoff = _retry_after(e)
+                if backoff is None:
+                    backoff = random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempt))
+            finally:
+                self._release(tokens, used)
+            attempt += 1
+            LLM_RETRIES.inc(1, LANE_NAMES[lane])
+            print(f"LLM request failed ({LANE_NAMES[lane]}: {reason}), "
+                  f"retry {attempt}/{max_retries} in {backoff:.1f}s")
+            await asyncio.sleep(backoff)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queued": {name: self._depth[lane] for lane, name in LANE_NAMES.items()},
+        }
+
+
+_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    """Process-wide scheduler shared by every LLM entry point."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = LLMScheduler()
+    return _scheduler
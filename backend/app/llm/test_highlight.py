@@ -0,0 +1,57 @@
+"""
+Tests for function mentions in chat answers (llm/highlight.py).
+"""
+
+from llm.highlight import AhoCorasick, FunctionMatcher
+
+
+def node(node_id: str, function_name: str) -> dict:
+    return {"id": node_id, "function_name": function_name}
+
+
+def test_automaton_finds_overlapping_occurrences():
+    automaton = AhoCorasick(["he", "she", "hers", ""])
+    found = sorted((start, automaton.patterns[pattern]) for start, pattern in automaton.finditer("ushers"))
+    assert found == [(1, "she"), (2, "he"), (2, "hers")]
+
+
+def test_name_matches_only_at_identifier_boundaries():
+    matcher = FunctionMatcher([node("utils.parse", "parse")])
+    assert matcher.match("the parser calls _parse_url and parse2") == []
+    assert matcher.match("see parse() in utils") == ["utils.parse"]
+    assert matcher.match("parse") == ["utils.parse"]
+
+
+def test_overlapping_mentions_prefer_the_full_id():
+    matcher = FunctionMatcher([
+        node("app.Service.run", "run"),
+        node("app.Service", "Service"),
+    ])
+    text = "app.Service.run is the entry point"
+    assert [matcher._automaton.patterns[pattern] for _, pattern in matcher.mentions(text)] == ["app.Service.run"]
+    assert matcher.match(text) == ["app.Service.run"]
+
+
+def test_full_id_outranks_shared_name():
+    matcher = FunctionMatcher([
+        node("a.load", "load"),
+        node("b.load", "load"),
+        node("c.save", "save"),
+    ])
+    # "load" is shared by two functions, so each gets less credit than the named id
+    assert matcher.match("load then c.save") == ["c.save", "a.load", "b.load"]
+
+
+def test_ranking_by_frequency_then_first_mention():
+    matcher = FunctionMatcher([
+        node("m.first", "first"),
+        node("m.second", "second"),
+        node("m.third", "third"),
+    ])
+    assert matcher.match("third, second, first and second again") == ["m.second", "m.third", "m.first"]
+
+
+def test_empty_inputs():
+    assert FunctionMatcher([]).match("anything") == []
+    assert FunctionMatcher([node("m.f", "f")]).match("") == []
+    assert FunctionMatcher([{"function_name": "orphan"}]).match("orphan") == []
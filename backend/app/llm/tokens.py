@@ -0,0 +1,39 @@
+"""
+Token counting for prompt budgets.
+
+Counts use the model's tiktoken encoding (o200k_base for the o-series and
+gpt-4.1 models tiktoken does not know by name yet). tiktoken downloads the
+encoding on first use; where that fails (no network), counts fall back to
+the ~4 characters per token estimate the scheduler budgets with.
+"""
+
+from functools import lru_cache
+from typing import Optional
+
+import tiktoken
+
+DEFAULT_ENCODING = "o200k_base"
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: Optional[str] = None) -> Optional["tiktoken.Encoding"]:
+    """Encoding for model, or None if no encoding could be loaded."""
+    try:
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        print(f"tiktoken encoding unavailable, estimating token counts from length: {e}")
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    encoding = get_encoding(model)
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    # Code may contain strings like "<|endoftext|>"; count them as plain text
+    return len(encoding.encode(text, disallowed_special=()))
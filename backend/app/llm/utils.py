@@ -1,9 +1,9 @@
 import os
-import glob
 import traceback
 import json
 
 from llm.constants import WORKSPACE_ROOT_DIR
+from analyzers.discovery import discover_paths
 
 # 프로젝트 루트의 poc 디렉토리 경로
 POC_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', 'poc'))
@@ -12,6 +12,9 @@ STUDY_1_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..
 
 SEPARATOR = "-------------------------------------------------------------------"
 
+# Name prefixes (see analyzers.discovery.compile_exclude_patterns)
+SOURCE_EXCLUDE_PATTERNS = [".*", "__init__.py"]
+
 def get_all_source_files(directory: str, file_type: str = "py"):
     """
     Recursively collect all source files in the directory.
@@ -19,11 +22,9 @@ def get_all_source_files(directory: str, file_type: str = "py"):
     __init__.py 등 특정 파일은 제외한다.
     """
 
-    pattern = f"**/*.{file_type}" if file_type else "**/*"
-    files = [f for f in glob.glob(os.path.join(directory, pattern), recursive=True) if os.path.isfile(f)]
-    # __init__.py 등 제외
-    files = [f for f in files if os.path.basename(f) != "__init__.py"]
-    return files
+    extensions = (f".{file_type}",) if file_type else None
+    # __init__.py 등 제외; 숨김 파일/디렉토리는 glob과 같이 제외
+    return discover_paths(directory, extensions, SOURCE_EXCLUDE_PATTERNS)
 
 def get_all_source_files_with_line_numbers(directory: str, file_type: str = "py"):
     """
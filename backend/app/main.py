@@ -1,18 +1,27 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from pathlib import Path
 from schemas.common import *
-from llm.diagram_generator import generate_call_graph, generate_control_flow_graph
+from llm.diagram_generator import generate_call_graph, generate_control_flow_graph, generate_hybrid_call_graph
 from llm.chatbot import create_session, remove_session, generate_chatbot_answer_with_session, generate_chatbot_answer_with_session_stream, get_session_history
 from llm.utils import get_source_file_with_line_number
 from llm.inline_explanation import generate_inline_code_explanation, generate_inline_code_explanation_stream
-from analyzers.ast_analyzer import analyze_project_call_graph
+from analyzers.ast_analyzer import build_project_call_graph, stream_project_call_graph
+from analyzers.incremental import update_project_call_graph
+from analyzers.jobs import get_job_manager
+from analyzers.graph_query import IN, OUT, BOTH, get_query_index
+from analyzers.graph_lod import LEVELS
+from analyzers.serialization import dumps_json, encode_envelope, negotiate_media_type
 from fastapi.responses import JSONResponse
 from llm.constants import SAMPLE_CFG_JSON
+from metrics import observe_request, render_prometheus, span
 
+import asyncio
 import json
+import time
+from typing import Optional
 
 # .env file loading
 load_dotenv()
@@ -28,9 +37,33 @@ app.add_middleware(
     allow_headers=["*"],  # 모든 헤더 허용
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Per-endpoint latency histogram (time to response headers)."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", None) or "unmatched"
+        observe_request(request.method, endpoint, status, time.perf_counter() - start)
+
 # Define the path to the HTML template
 HTML_PATH = Path(__file__).parent / "html" / "root.html"
 
+def graph_response(accept: Optional[str], data=None, data_json: Optional[bytes] = None) -> Optional[Response]:
+    """
+    Encode {"status": 200, "data": graph} as minified JSON or msgpack if the Accept header asks
+    for one of them; None means the client gets the legacy CGDiagramResponse.
+    """
+    media_type = negotiate_media_type(accept)
+    if media_type is None:
+        return None
+    return Response(content=encode_envelope(media_type, data, data_json), media_type=media_type)
+
 # API Endpoint
 @app.get("/", response_class=HTMLResponse)
 async def root():
@@ -42,33 +75,258 @@ async def root():
         return HTMLResponse(content="<h1>Template not found</h1>", status_code=404)
 
 @app.post("/api/generate_call_graph", response_model=CGDiagramResponse)
-async def api_generate_call_graph(request: CGDiagramRequest):
+async def api_generate_call_graph(request: CGDiagramRequest, accept: Optional[str] = Header(None)):
     """
     Generate a call graph for the given code.
     """
     try:
-        json_data = await generate_call_graph(request.path, request.file_type)
+        call_graph_json = await generate_call_graph(request.path, request.file_type)
+        response = graph_response(accept, data_json=call_graph_json)
+        if response is not None:
+            return response
         result = {
-            "data": json_data
+            "data": call_graph_json.decode('utf-8')
+        }
+        return CGDiagramResponse(**result)
+    except Exception as e:
+        return CGDiagramResponse(status=500, data=str(e))
+
+@app.post("/api/generate_call_graph_hybrid", response_model=CGDiagramResponse)
+async def api_generate_call_graph_hybrid(request: CGDiagramRequest, accept: Optional[str] = Header(None)):
+    """
+    Generate a call graph with the AST structure and LLM-written node descriptions.
+    """
+    try:
+        call_graph_json = await generate_hybrid_call_graph(request.path, jobs=request.jobs)
+        response = graph_response(accept, data_json=call_graph_json)
+        if response is not None:
+            return response
+        result = {
+            "data": call_graph_json.decode('utf-8')
         }
         return CGDiagramResponse(**result)
     except Exception as e:
         return CGDiagramResponse(status=500, data=str(e))
 
 @app.post("/api/generate_call_graph_ast", response_model=CGDiagramResponse)
-async def api_generate_call_graph_ast(request: CGDiagramRequest):
+async def api_generate_call_graph_ast(request: CGDiagramRequest, accept: Optional[str] = Header(None)):
     """
     Generate a call graph for the given code using AST.
     """
     try:
-        json_data = await analyze_project_call_graph(request.path)
+        _, call_graph_json = await build_project_call_graph(request.path, jobs=request.jobs)
+        response = graph_response(accept, data_json=call_graph_json)
+        if response is not None:
+            return response
         result = {
-            "data": json_data
+            "data": call_graph_json.decode('utf-8')
+        }
+        return CGDiagramResponse(**result)
+    except Exception as e:
+        return CGDiagramResponse(status=500, data=str(e))
+
+@app.post("/api/generate_call_graph_ast_stream")
+async def api_generate_call_graph_ast_stream(request: CGDiagramRequest):
+    """
+    Generate the AST call graph as NDJSON: one {"file", "nodes", "edges"}
+    line per file, sent as soon as the file is resolved. If the analysis
+    fails, the last line is {"error": message} (the status is already 200).
+    """
+    async def stream_graph():
+        try:
+            async for line in stream_project_call_graph(request.path, jobs=request.jobs):
+                yield line
+        except Exception as e:
+            yield dumps_json({"error": str(e)}) + b"\n"
+
+    return StreamingResponse(
+        stream_graph(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.post("/api/generate_call_graph_ast_delta", response_model=CGDiagramResponse)
+async def api_generate_call_graph_ast_delta(request: CGDeltaRequest, accept: Optional[str] = Header(None)):
+    """
+    Incrementally update the AST call graph and return only the added,
+    changed (replaced whole, same id) and removed nodes and edges since
+    request.base_version.
+    """
+    try:
+        delta = await update_project_call_graph(request.path, request.base_version, request.jobs)
+        response = graph_response(accept, data=delta)
+        if response is not None:
+            return response
+        result = {
+            "data": dumps_json(delta).decode('utf-8')
         }
         return CGDiagramResponse(**result)
     except Exception as e:
         return CGDiagramResponse(status=500, data=str(e))
 
+@app.post("/api/analysis_jobs", response_model=AnalysisJobResponse)
+async def api_submit_analysis_job(request: CGDiagramRequest):
+    """
+    Start an AST call graph analysis in the background and return its job id.
+    """
+    job = get_job_manager().submit(request.path, jobs=request.jobs)
+    return AnalysisJobResponse(job_id=job.id, status=job.status)
+
+@app.get("/api/analysis_jobs/{job_id}")
+async def api_get_analysis_job(job_id: str):
+    """
+    Status and progress counters of an analysis job.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.snapshot()
+
+@app.get("/api/analysis_jobs/{job_id}/events")
+async def api_analysis_job_events(job_id: str):
+    """
+    Stream the progress of an analysis job as server-sent events until it finishes.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream_progress():
+        with span("sse_stream"):
+            async for snapshot in job.events():
+                if snapshot is None:
+                    yield ": keep-alive\n\n"
+                else:
+                    yield f"data: {json.dumps(snapshot)}\n\n"
+            yield f"data: {json.dumps({'done': True})}\n\n"
+
+    return StreamingResponse(
+        stream_progress(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+@app.get("/api/analysis_jobs/{job_id}/result", response_model=CGDiagramResponse)
+async def api_analysis_job_result(job_id: str, accept: Optional[str] = Header(None)):
+    """
+    Call graph produced by a completed analysis job.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    response = graph_response(accept, data_json=job.result)
+    if response is not None:
+        return response
+    return CGDiagramResponse(data=job.result.decode('utf-8'))
+
+@app.post("/api/analysis_jobs/{job_id}/cancel", response_model=AnalysisJobResponse)
+async def api_cancel_analysis_job(job_id: str):
+    """
+    Cancel a queued or running analysis job.
+    """
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Cancellation takes effect at the job's next await
+    await asyncio.wait({job.task}, timeout=1.0)
+    return AnalysisJobResponse(job_id=job.id, status=job.status)
+
+async def _query_index(project_path: str, *node_ids: str):
+    # The first query of a project loads and indexes its whole graph
+    index = await asyncio.to_thread(get_query_index, project_path)
+    if index is None:
+        raise HTTPException(status_code=404, detail="Project has not been analyzed")
+    for node_id in node_ids:
+        if not index.has_node(node_id):
+            raise HTTPException(status_code=404, detail=f"Unknown node: {node_id}")
+    return index
+
+def _query_response(result, accept: Optional[str]):
+    response = graph_response(accept, data=result)
+    if response is not None:
+        return response
+    return CGDiagramResponse(data=dumps_json(result).decode('utf-8'))
+
+@app.post("/api/graph/callees", response_model=CGDiagramResponse)
+async def api_graph_callees(request: GraphNodeQueryRequest, accept: Optional[str] = Header(None)):
+    """
+    Functions called directly by request.node_id.
+    """
+    index = await _query_index(request.path, request.node_id)
+    return _query_response(index.neighbors(request.node_id, OUT), accept)
+
+@app.post("/api/graph/callers", response_model=CGDiagramResponse)
+async def api_graph_callers(request: GraphNodeQueryRequest, accept: Optional[str] = Header(None)):
+    """
+    Functions that call request.node_id directly.
+    """
+    index = await _query_index(request.path, request.node_id)
+    return _query_response(index.neighbors(request.node_id, IN), accept)
+
+@app.post("/api/graph/neighborhood", response_model=CGDiagramResponse)
+async def api_graph_neighborhood(request: GraphNodeQueryRequest, accept: Optional[str] = Header(None)):
+    """
+    Nodes within request.depth call hops of request.node_id.
+    """
+    if request.direction not in (IN, OUT, BOTH):
+        raise HTTPException(status_code=400, detail="Direction must be 'in', 'out' or 'both'")
+    index = await _query_index(request.path, request.node_id)
+    return _query_response(index.neighborhood(request.node_id, request.depth or 1, request.direction), accept)
+
+@app.post("/api/graph/path", response_model=CGDiagramResponse)
+async def api_graph_path(request: GraphPathQueryRequest, accept: Optional[str] = Header(None)):
+    """
+    Shortest call chain from request.source to request.target.
+    """
+    index = await _query_index(request.path, request.source, request.target)
+    return _query_response(index.shortest_path(request.source, request.target), accept)
+
+@app.post("/api/graph/subgraph", response_model=CGDiagramResponse)
+async def api_graph_subgraph(request: GraphSubgraphQueryRequest, accept: Optional[str] = Header(None)):
+    """
+    Nodes of one file and/or package and the calls between them.
+    """
+    if not request.file and not request.package:
+        raise HTTPException(status_code=400, detail="File or package is required")
+    index = await _query_index(request.path)
+    file_number = None
+    if request.file:
+        file_number = index.resolve_file(request.file, request.path)
+        if file_number is None:
+            raise HTTPException(status_code=404, detail=f"Unknown file: {request.file}")
+    result = index.subgraph(file_number, request.package, request.include_external)
+    return _query_response(result, accept)
+
+@app.post("/api/graph/lod", response_model=CGDiagramResponse)
+async def api_graph_lod(request: GraphLODRequest, accept: Optional[str] = Header(None)):
+    """
+    Call graph aggregated into package, module or class supernodes, with
+    the supernodes in request.expand shown one level finer.
+    """
+    if request.level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"Level must be one of {', '.join(LEVELS)}")
+    index = await _query_index(request.path)
+    # Building the hierarchy and a view walks every node and edge
+    result = await asyncio.to_thread(
+        lambda: index.hierarchy.view(
+            request.level, max(1, request.package_depth or 1), request.expand or [], bool(request.include_external)
+        )
+    )
+    return _query_response(result, accept)
+
+@app.get("/api/metrics")
+async def api_metrics():
+    """
+    Phase timings, per-endpoint latency percentiles and cache hit rates in the
+    Prometheus text format.
+    """
+    return Response(content=render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/api/generate_control_flow_graph", response_model=CFGDiagramResponse)
 async def api_generate_control_flow_graph(request: CFGDiagramRequest):
     """
@@ -177,12 +435,13 @@ async def api_inline_code_explanation_stream(req: InlineCodeExplanationRequest):
             raise HTTPException(status_code=400, detail="Line start and end are required")
         
         async def stream_explanation():
-            try:
-                async for chunk in generate_inline_code_explanation_stream(req.file_path, req.line_start, req.line_end, req.explanation_level):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                yield f"data: {json.dumps({'done': True})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            with span("sse_stream"):
+                try:
+                    async for chunk in generate_inline_code_explanation_stream(req.file_path, req.line_start, req.line_end, req.explanation_level):
+                        yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+                    yield f"data: {json.dumps({'done': True})}\n\n"
+                except Exception as e:
+                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
         
         return StreamingResponse(
             stream_explanation(),
@@ -226,14 +485,15 @@ async def api_session_chat_stream(req: ChatbotQueryRequest):
         print(f"Context: {context}")
         
         async def stream_chatbot_response():
-            try:
-                async for chunk in generate_chatbot_answer_with_session_stream(
-                    req.session_id, req.graph_mode, req.target_path, req.query + context, req.code, req.diagram
-                ):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
-                yield f"data: {json.dumps({'done': True})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            with span("sse_stream"):
+                try:
+                    async for chunk in generate_chatbot_answer_with_session_stream(
+                        req.session_id, req.graph_mode, req.target_path, req.query + context, req.code, req.diagram
+                    ):
+                        yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+                    yield f"data: {json.dumps({'done': True})}\n\n"
+                except Exception as e:
+                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
         
         return StreamingResponse(
             stream_chatbot_response(),
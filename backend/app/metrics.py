@@ -0,0 +1,352 @@
+"""
+Lightweight in-process metrics.
+
+Timing spans around analysis and LLM phases, HTTP request latencies and
+cache lookups are aggregated into histograms and counters held in this
+process, and rendered in the Prometheus text exposition format for
+/api/metrics. Histograms also keep a bounded reservoir of recent samples
+so latency percentiles can be reported without a Prometheus server.
+
+Work done in analysis worker processes is recorded with capture() and
+replayed into the parent's registry with replay().
+"""
+
+import asyncio
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Upper bounds (seconds) of the latency buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Recent samples kept per label set for percentiles
+RESERVOIR_SIZE = 1024
+QUANTILES = (0.5, 0.9, 0.99)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _HistogramSeries:
+    __slots__ = ("bucket_counts", "count", "sum", "recent")
+
+    def __init__(self, bucket_count: int):
+        self.bucket_counts = [0] * bucket_count
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+
+class Histogram:
+    """Cumulative latency histogram per label set, with recent-sample percentiles."""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series: Dict[LabelValues, _HistogramSeries] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = _HistogramSeries(len(self.buckets))
+            position = bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                series.bucket_counts[position] += 1
+            series.count += 1
+            series.sum += value
+            series.recent.append(value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [
+            f"# HELP {self.name}_quantile {self.help} (percentiles of the last {RESERVOIR_SIZE} samples)",
+            f"# TYPE {self.name}_quantile gauge",
+        ]
+        with self._lock:
+            series_items = sorted(self._series.items())
+            snapshot = [(values, list(series.bucket_counts), series.count, series.sum, sorted(series.recent))
+                        for values, series in series_items]
+        for values, bucket_counts, count, total, samples in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, values, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {total!r}")
+            lines.append(f"{self.name}_count{labels} {count}")
+            for q in QUANTILES:
+                value = samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+                labels = _format_labels(self.label_names, values, f'quantile="{q}"')
+                quantile_lines.append(f"{self.name}_quantile{labels} {value!r}")
+        return lines + quantile_lines
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for values, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Current value per label set."""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {_format_value(value)}")
+        return lines
+
+
+PHASE_SECONDS = Histogram(
+    "codediagram_phase_duration_seconds",
+    "Wall time of instrumented processing phases",
+    ("phase",),
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "codediagram_http_request_duration_seconds",
+    "HTTP request latency until the response starts",
+    ("method", "endpoint", "status"),
+)
+CACHE_LOOKUPS = Counter(
+    "codediagram_cache_lookups_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ("cache", "result"),
+)
+DISCOVERY_SKIPPED_DIRS = Counter(
+    "codediagram_discovery_skipped_dirs_total",
+    "Directories left out of file discovery for having more than max_dir_entries entries",
+)
+
+LLM_QUEUE_DEPTH = Gauge(
+    "codediagram_llm_queue_depth",
+    "LLM requests waiting for the scheduler, per priority lane",
+    ("lane",),
+)
+LLM_ACTIVE_REQUESTS = Gauge(
+    "codediagram_llm_active_requests",
+    "LLM requests currently running",
+)
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "codediagram_llm_queue_wait_seconds",
+    "Time LLM requests spent queued for a concurrency slot and rate budget",
+    ("lane",),
+)
+LLM_RETRIES = Counter(
+    "codediagram_llm_retries_total",
+    "LLM requests retried after a rate limit (HTTP 429) or transient failure",
+    ("lane",),
+)
+LLM_HTTP_CONNECTIONS = Gauge(
+    "codediagram_llm_http_connections",
+    "Connections in the shared LLM HTTP pools, by state (active, idle)",
+    ("state",),
+)
+LLM_HTTP_POOL_UTILIZATION = Gauge(
+    "codediagram_llm_http_pool_utilization",
+    "Active connections over the connection limit of the shared LLM HTTP pools",
+)
+LLM_HTTP_IN_FLIGHT = Gauge(
+    "codediagram_llm_http_in_flight_requests",
+    "HTTP requests to the LLM provider whose response is not yet consumed",
+)
+LLM_HTTP_REQUESTS = Counter(
+    "codediagram_llm_http_requests_total",
+    "HTTP requests sent through the shared LLM HTTP pools",
+)
+LLM_HTTP_CONNECTIONS_OPENED = Counter(
+    "codediagram_llm_http_connections_opened_total",
+    "Connections opened by the shared LLM HTTP pools (requests minus reuse)",
+)
+LLM_PROMPT_TOKENS = Counter(
+    "codediagram_llm_prompt_tokens_total",
+    "Prompt tokens sent to the LLM, by entry point and prompt section",
+    ("entry", "section"),
+)
+LLM_PROMPT_TOKENS_CUT = Counter(
+    "codediagram_llm_prompt_tokens_cut_total",
+    "Prompt tokens left out by section budgets, by entry point and prompt section",
+    ("entry", "section"),
+)
+LLM_PROMPT_INPUT_TOKENS = Counter(
+    "codediagram_llm_prompt_input_tokens_total",
+    "Prompt tokens billed by the LLM provider, by entry point",
+    ("entry",),
+)
+LLM_PROMPT_CACHED_TOKENS = Counter(
+    "codediagram_llm_prompt_cached_tokens_total",
+    "Prompt tokens the LLM provider served from its prompt cache, by entry point",
+    ("entry",),
+)
+LLM_CALL_GRAPH_BATCHES = Counter(
+    "codediagram_llm_call_graph_batches_total",
+    "LLM call graph requests that carried several small files",
+)
+LLM_CALL_GRAPH_BATCHED_FILES = Counter(
+    "codediagram_llm_call_graph_batched_files_total",
+    "Small files sent to the LLM in batched call graph requests",
+)
+HYBRID_NODES = Counter(
+    "codediagram_hybrid_nodes_total",
+    "Nodes of hybrid call graphs by description source (ast: AST or docstring, llm, llm_missing: asked but not answered)",
+    ("source",),
+)
+LLM_PROMPT_SIZE = Histogram(
+    "codediagram_llm_prompt_tokens",
+    "Size in tokens of the prompts sent to the LLM, by entry point",
+    ("entry",),
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000, 256000),
+)
+
+# Per-thread buffer that replaces the registry inside capture()
+_capture = threading.local()
+
+
+def observe_phase(phase: str, seconds: float) -> None:
+    buffer = getattr(_capture, "observations", None)
+    if buffer is not None:
+        buffer.append((phase, seconds))
+    else:
+        PHASE_SECONDS.observe(seconds, phase)
+
+
+@contextmanager
+def span(phase: str):
+    """Time the enclosed block as one observation of phase."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_phase(phase, time.perf_counter() - start)
+
+
+def timed(phase: str) -> Callable:
+    """Decorator form of span() for plain and async functions."""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(phase):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def capture():
+    """
+    Collect this thread's phase observations in a list instead of the
+    registry (e.g. inside a worker process); pass the list to replay().
+    """
+    previous = getattr(_capture, "observations", None)
+    observations: List[Tuple[str, float]] = []
+    _capture.observations = observations
+    try:
+        yield observations
+    finally:
+        _capture.observations = previous
+
+
+def replay(observations: List[Tuple[str, float]]) -> None:
+    for phase, seconds in observations:
+        observe_phase(phase, seconds)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.inc(1, cache, "hit" if hit else "miss")
+
+
+def observe_request(method: str, endpoint: str, status: int, seconds: float) -> None:
+    HTTP_REQUEST_SECONDS.observe(seconds, method, endpoint, str(status))
+
+
+def render_prometheus() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in (PHASE_SECONDS, HTTP_REQUEST_SECONDS, CACHE_LOOKUPS, DISCOVERY_SKIPPED_DIRS,
+                   LLM_QUEUE_DEPTH, LLM_ACTIVE_REQUESTS, LLM_QUEUE_WAIT_SECONDS, LLM_RETRIES,
+                   LLM_HTTP_CONNECTIONS, LLM_HTTP_POOL_UTILIZATION, LLM_HTTP_IN_FLIGHT,
+                   LLM_HTTP_REQUESTS, LLM_HTTP_CONNECTIONS_OPENED,
+                   LLM_PROMPT_TOKENS, LLM_PROMPT_TOKENS_CUT, LLM_PROMPT_SIZE,
+                   LLM_PROMPT_INPUT_TOKENS, LLM_PROMPT_CACHED_TOKENS,
+                   LLM_CALL_GRAPH_BATCHES, LLM_CALL_GRAPH_BATCHED_FILES, HYBRID_NODES):
+        lines += metric.render()
+
+    lookups: Dict[str, List[float]] = {}
+    for (cache, result), value in CACHE_LOOKUPS.values().items():
+        lookups.setdefault(cache, [0, 0])[0 if result == "hit" else 1] += value
+    lines.append("# HELP codediagram_cache_hit_ratio Cache hits over all lookups since start")
+    lines.append("# TYPE codediagram_cache_hit_ratio gauge")
+    for cache, (hits, misses) in sorted(lookups.items()):
+        ratio = hits / (hits + misses) if hits + misses else 0.0
+        lines.append(f'codediagram_cache_hit_ratio{{cache="{_escape(cache)}"}} {ratio!r}')
+
+    cached_tokens = LLM_PROMPT_CACHED_TOKENS.values()
+    lines.append("# HELP codediagram_llm_prompt_cache_ratio Prompt tokens served from the provider's cache over all prompt tokens since start")
+    lines.append("# TYPE codediagram_llm_prompt_cache_ratio gauge")
+    for (entry,), input_tokens in sorted(LLM_PROMPT_INPUT_TOKENS.values().items()):
+        ratio = cached_tokens.get((entry,), 0) / input_tokens if input_tokens else 0.0
+        lines.append(f'codediagram_llm_prompt_cache_ratio{{entry="{_escape(entry)}"}} {ratio!r}')
+    return "\n".join(lines) + "\n"
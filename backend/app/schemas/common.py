@@ -9,11 +9,46 @@ poc_path = os.path.join(backend_root_dir, "../..", "poc")
 class CGDiagramRequest(BaseModel):
     path: str = poc_path #Local File Absolute Path or Github URL
     file_type: Optional[str] = None #File Type to render CFG
+    jobs: Optional[int] = os.cpu_count() #Worker processes for AST analysis (default: core count)
+
+class CGDeltaRequest(BaseModel):
+    path: str = poc_path #Local File Absolute Path
+    base_version: Optional[int] = None #Graph version the client already has (None: return the full graph)
+    jobs: Optional[int] = os.cpu_count() #Worker processes for AST analysis (default: core count)
 
 # 응답 모델 정의
 class CGDiagramResponse(BaseModel):
+    status: int = 200 #200, or 500 with an error message in data
     data: str #Json Str Format or Error Message
 
+class GraphNodeQueryRequest(BaseModel):
+    path: str = poc_path #Analyzed project path
+    node_id: str #Dotted node id, e.g. package.module.Class.method
+    direction: Optional[str] = "both" #out: callees, in: callers, both
+    depth: Optional[int] = 1 #Number of call hops (neighborhood queries)
+
+class GraphPathQueryRequest(BaseModel):
+    path: str = poc_path #Analyzed project path
+    source: str #Node id the call chain starts from
+    target: str #Node id the call chain ends at
+
+class GraphSubgraphQueryRequest(BaseModel):
+    path: str = poc_path #Analyzed project path
+    file: Optional[str] = None #Absolute file path or path relative to the project
+    package: Optional[str] = None #Dotted package or module prefix
+    include_external: Optional[bool] = False #Also return calls leaving the selection
+
+class GraphLODRequest(BaseModel):
+    path: str = poc_path #Analyzed project path
+    level: Optional[str] = "package" #Zoom level: package, module, class or function
+    package_depth: Optional[int] = 1 #Package components shown at package level
+    expand: Optional[list] = [] #Supernode ids shown one level finer
+    include_external: Optional[bool] = False #Show calls into libraries, grouped per library
+
+class AnalysisJobResponse(BaseModel):
+    job_id: str #ID for the progress, cancel and result endpoints
+    status: str #queued, running, completed, failed or cancelled
+
 class CFGDiagramRequest(BaseModel):
     file_path: str  # 파일 이름
     function_name: str # 함수 이름
@@ -97,6 +97,33 @@ def test_single_file():
         import traceback
         traceback.print_exc()
 
+def relative_call_graph(call_graph, root):
+    """Call graph keyed by paths relative to root, so it does not depend on the checkout location."""
+    return {os.path.relpath(file_path, root).replace(os.sep, '/'): data for file_path, data in call_graph.items()}
+
+def test_poc_call_graph_matches_golden(tmp_path, monkeypatch):
+    """build_project_call_graph on poc must match the committed golden output.
+
+    After an intended change to the analyzer output, regenerate the golden
+    file with UPDATE_GOLDEN=1 and review its diff.
+    """
+    import asyncio
+    from analyzers import artifact_store
+    from analyzers.ast_analyzer import build_project_call_graph
+
+    monkeypatch.setattr(artifact_store, "_default_store", artifact_store.ArtifactStore(str(tmp_path / "store")))
+    poc_dir = Path(__file__).parent.parent.parent / "poc"
+    golden_file = Path(__file__).parent / "test_data" / "poc_call_graph.json"
+
+    call_graph, _ = asyncio.run(build_project_call_graph(str(poc_dir), jobs=1, use_cache=False))
+    call_graph = relative_call_graph(call_graph, poc_dir)
+
+    if os.environ.get("UPDATE_GOLDEN"):
+        golden_file.parent.mkdir(exist_ok=True)
+        golden_file.write_text(json.dumps(call_graph, indent=2, ensure_ascii=False) + "\n", encoding='utf-8')
+    golden = json.loads(golden_file.read_text(encoding='utf-8'))
+    assert call_graph == golden
+
 if __name__ == "__main__":
     print("Testing Call Graph Generation")
     print("=" * 50)
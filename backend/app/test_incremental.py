@@ -0,0 +1,157 @@
+"""
+Tests for incremental call-graph updates: deltas applied to the previous
+graph must give the same graph as a full rebuild.
+"""
+
+import asyncio
+import os
+
+import pytest
+
+from analyzers import artifact_store, incremental, summary_cache
+from analyzers.ast_analyzer import build_project_call_graph
+from analyzers.incremental import IncrementalCallGraph, get_incremental_project, update_project_call_graph
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    """Empty project directory, with the artifact store and summary cache kept under tmp_path."""
+    monkeypatch.setattr(artifact_store, "_default_store", artifact_store.ArtifactStore(str(tmp_path / "store")))
+    monkeypatch.setattr(summary_cache, "_default_cache", summary_cache.SummaryCache(str(tmp_path / "summaries")))
+    monkeypatch.setattr(incremental, "_projects", incremental.OrderedDict())
+    root = tmp_path / "project"
+    root.mkdir()
+    return root
+
+
+def write(root, relative_path: str, content: str) -> None:
+    path = root / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    previous = path.stat().st_mtime_ns if path.exists() else 0
+    path.write_text(content)
+    # Filesystems with coarse timestamps would hide a rewrite within the same tick
+    stat = path.stat()
+    if stat.st_mtime_ns <= previous:
+        os.utime(path, ns=(stat.st_atime_ns, previous + 1_000_000_000))
+
+
+def as_items(call_graph):
+    """{file: {nodes: {id: node}, edges: {id: edge}}} without empty files."""
+    result = {}
+    for file_key, graph in call_graph.items():
+        if graph["nodes"] or graph["edges"]:
+            result[file_key] = {kind: {item["id"]: item for item in graph[kind]} for kind in ("nodes", "edges")}
+    return result
+
+
+def apply_delta(items, delta):
+    """Patch a client's copy of the graph, applying the lists in an arbitrary order."""
+    for kind in ("nodes", "edges"):
+        changes = delta[kind]
+        for file_key, added in changes["added"].items():
+            file_items = items.setdefault(file_key, {"nodes": {}, "edges": {}})[kind]
+            for item in added:
+                assert item["id"] not in file_items
+                file_items[item["id"]] = item
+        for file_key, removed in changes["removed"].items():
+            for item_id in removed:
+                del items[file_key][kind][item_id]
+        for file_key, changed in changes["changed"].items():
+            for item in changed:
+                assert item["id"] in items[file_key][kind]
+                items[file_key][kind][item["id"]] = item
+    return {file_key: graph for file_key, graph in items.items() if graph["nodes"] or graph["edges"]}
+
+
+def full_build(root):
+    call_graph, _ = asyncio.run(build_project_call_graph(str(root), jobs=1))
+    return as_items(call_graph)
+
+
+def test_deltas_match_full_rebuild(project):
+    write(project, "pkg/__init__.py", "")
+    write(project, "pkg/util.py", "def helper():\n    return 1\n\ndef unused():\n    pass\n")
+    write(project, "pkg/service.py",
+          "from pkg.util import helper\n\nclass Service:\n    def run(self):\n        return helper()\n")
+    write(project, "main.py", "from pkg.service import Service\n\ndef main():\n    Service().run()\n")
+
+    graph = IncrementalCallGraph(str(project))
+    first = asyncio.run(graph.update(jobs=1))
+    items = apply_delta({}, first)
+    assert items == full_build(project)
+
+    steps = [
+        # Edit a body: new call, removed call
+        lambda: write(project, "main.py",
+                      "from pkg.service import Service\nfrom pkg.util import helper\n\n"
+                      "def main():\n    helper()\n"),
+        # Change a module's symbols: its unchanged importers must be re-resolved
+        lambda: write(project, "pkg/util.py", "def unused():\n    pass\n"),
+        # Add a file, and a function the dangling import now resolves to
+        lambda: (write(project, "pkg/extra.py", "from pkg.util import unused\n\ndef extra():\n    unused()\n"),
+                 write(project, "pkg/util.py", "def helper():\n    return 2\n\ndef unused():\n    pass\n")),
+        # Delete a file
+        lambda: os.remove(project / "pkg" / "service.py"),
+        # Touch without changing the content
+        lambda: os.utime(project / "main.py", ns=(0, os.stat(project / "main.py").st_mtime_ns + 1_000_000_000)),
+    ]
+    for step in steps:
+        step()
+        delta = asyncio.run(graph.update(jobs=1))
+        items = apply_delta(items, delta)
+        assert items == full_build(project)
+
+    # The last step only touched a file: the content hash shows nothing changed
+    assert delta["files"]["changed"] == []
+    assert delta["version"] == delta["base_version"]
+
+
+def test_changed_node_is_not_reported_as_removed(project):
+    write(project, "mod.py", "def a():\n    b()\n\ndef b():\n    pass\n")
+    graph = IncrementalCallGraph(str(project))
+    asyncio.run(graph.update(jobs=1))
+
+    write(project, "mod.py", "def a():\n    b()\n\ndef b():\n    x = 1\n    return x\n")
+    delta = asyncio.run(graph.update(jobs=1))
+    file_key = str(project / "mod.py")
+    assert [node["id"] for node in delta["nodes"]["changed"][file_key]] == ["mod.b"]
+    assert delta["nodes"]["removed"] == {}
+    assert delta["nodes"]["added"] == {}
+    assert delta["edges"] == {"added": {}, "changed": {}, "removed": {}}
+
+
+def test_removed_call_keeps_other_edge_ids(project):
+    write(project, "mod.py", "def a():\n    b()\n    c()\n    d()\n\ndef b():\n    pass\n\n"
+                             "def c():\n    pass\n\ndef d():\n    pass\n")
+    graph = IncrementalCallGraph(str(project))
+    asyncio.run(graph.update(jobs=1))
+
+    write(project, "mod.py", "def a():\n    c()\n    d()\n\ndef b():\n    pass\n\n"
+                             "def c():\n    pass\n\ndef d():\n    pass\n")
+    delta = asyncio.run(graph.update(jobs=1))
+    file_key = str(project / "mod.py")
+    assert delta["edges"]["added"] == {}
+    assert len(delta["edges"]["removed"][file_key]) == 1
+
+
+def test_base_version_mismatch_returns_full_graph(project):
+    write(project, "mod.py", "def a():\n    pass\n")
+    first = asyncio.run(update_project_call_graph(str(project), jobs=1))
+    assert first["full"] and "graph" in first
+
+    write(project, "mod.py", "def a():\n    b()\n\ndef b():\n    pass\n")
+    delta = asyncio.run(update_project_call_graph(str(project), base_version=first["version"], jobs=1))
+    assert not delta["full"] and "graph" not in delta
+
+    stale = asyncio.run(update_project_call_graph(str(project), base_version=first["version"], jobs=1))
+    assert stale["full"]
+    assert as_items(stale["graph"]) == full_build(project)
+
+
+def test_projects_are_evicted_least_recently_used(project, monkeypatch):
+    monkeypatch.setattr(incremental, "MAX_INCREMENTAL_PROJECTS", 2)
+    first = get_incremental_project(str(project / "a"))
+    get_incremental_project(str(project / "b"))
+    assert get_incremental_project(str(project / "a")) is first
+    get_incremental_project(str(project / "c"))
+    assert list(incremental._projects) == [str(project / "a"), str(project / "c")]
@@ -667,11 +667,10 @@ export default function DiagramViewer() {
       // 클래스별로 메소드들을 매핑
       const classMethods: Record<string, any[]> = {};
       methodNodes.forEach(method => {
-        // 메소드 ID에서 클래스 이름 추출 (예: "data_augmentation.ImageGenerator.method_name")
+        // 메소드 ID에서 클래스 ID 추출 (예: "src.utils.data_augmentation.ImageGenerator.method_name")
         const parts = method.id.split('.');
         if (parts.length >= 3) {
-          const className = parts[1]; // ImageGenerator
-          const classNodeId = `${parts[0]}.${className}`; // data_augmentation.ImageGenerator
+          const classNodeId = parts.slice(0, -1).join('.'); // src.utils.data_augmentation.ImageGenerator
           if (!classMethods[classNodeId]) {
             classMethods[classNodeId] = [];
           }
@@ -695,8 +694,8 @@ export default function DiagramViewer() {
         if (isMethod) {
           const parts = n.id.split('.');
           if (parts.length >= 3) {
-            const className = parts[1];
-            const classNodeId = `${parts[0]}.${className}`;
+            // 모듈 경로는 여러 단계일 수 있으므로 마지막(메소드 이름)만 제거
+            const classNodeId = parts.slice(0, -1).join('.');
             parentId = classNodeId;
           }
         }
@@ -1237,7 +1236,8 @@ export default function DiagramViewer() {
       try {
         const res = await fetch(`${apiUrl}${ENDPOINTS.CG}`, {
           method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
+          // Ask for the graph as a JSON object rather than a JSON string in `data`
+          headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
           body: JSON.stringify({ path: `../../${TARGET_FOLDER}`, file_type: 'py' }),
         });
         
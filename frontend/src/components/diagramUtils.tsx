@@ -508,7 +508,7 @@ export function calculateLayoutWithClasses(
     methodNodes.forEach(method => {
       const parts = method.id.split('.');
       if (parts.length >= 3) {
-        const classNodeId = `${parts[0]}.${parts[1]}`;
+        const classNodeId = parts.slice(0, -1).join('.');
         if (!classMethods[classNodeId]) {
           classMethods[classNodeId] = [];
         }